@@ -18,13 +18,14 @@ from langchain_core.runnables import RunnableConfig
 from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, START, END
 from langgraph.types import Command
-from langgraph.checkpoint.memory import MemorySaver
 from pydantic import BaseModel, Field
 
 from copilotkit import CopilotKitState
 from copilotkit.langgraph import copilotkit_emit_state
 from copilotkit.langchain import copilotkit_customize_config
 
+from checkpointing import advanced_checkpoint_saver
+
 load_dotenv()
 
 
@@ -615,7 +616,7 @@ def create_contratos_agent_graph() -> StateGraph:
     workflow.add_edge("execute_contratos", "finalize_contratos")
     workflow.add_edge("finalize_contratos", END)
     
-    return workflow.compile(checkpointer=MemorySaver())
+    return workflow.compile(checkpointer=advanced_checkpoint_saver.for_graph("contratos"))
 
 
 contratos_agent_graph = create_contratos_agent_graph()
\ No newline at end of file
@@ -18,13 +18,14 @@ from langchain_core.runnables import RunnableConfig
 from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, START, END
 from langgraph.types import Command
-from langgraph.checkpoint.memory import MemorySaver
 from pydantic import BaseModel, Field
 
 from copilotkit import CopilotKitState
 from copilotkit.langgraph import copilotkit_emit_state
 from copilotkit.langchain import copilotkit_customize_config
 
+from checkpointing import advanced_checkpoint_saver
+
 load_dotenv()
 
 
@@ -395,7 +396,7 @@ def create_tributario_agent_graph() -> StateGraph:
     workflow.add_edge("execute_tributario", "finalize_tributario")
     workflow.add_edge("finalize_tributario", END)
     
-    return workflow.compile(checkpointer=MemorySaver())
+    return workflow.compile(checkpointer=advanced_checkpoint_saver.for_graph("tributario"))
 
 
 tributario_agent_graph = create_tributario_agent_graph()
\ No newline at end of file
@@ -0,0 +1,493 @@
+"""
+Benchmarks do Checkpointing
+Vieira Pires Advogados - Knowledge Management System
+
+Uso:
+    python benchmarks/bench_checkpointing.py delta --sizes 50,200,1000
+    python benchmarks/bench_checkpointing.py dedup --sizes 50,200,1000
+    python benchmarks/bench_checkpointing.py compression --sizes 200,1000
+    python benchmarks/bench_checkpointing.py serialization --sizes 50,200,1000
+    python benchmarks/bench_checkpointing.py retention --sizes 100,1000,5000
+    python benchmarks/bench_checkpointing.py listing --sizes 1000,10000,50000
+    python benchmarks/bench_checkpointing.py durability --sizes 1,4,16
+    python benchmarks/bench_checkpointing.py auto --sizes 10,50
+    python benchmarks/bench_checkpointing.py file --sizes 1,8,32
+"""
+
+import os
+import sys
+import time
+import pickle
+import random
+import logging
+import asyncio
+import argparse
+import tracemalloc
+import threading
+import json
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from checkpointing import (
+    AdvancedCheckpointSaver, AutoCheckpointScheduler, CheckpointConfig, CheckpointMetadata, CheckpointType,
+    CompressionManager, CompressionType, DurabilityMode, FileCheckpointStorage,
+    SQLiteCheckpointStorage, SerializationFormat, STATE_SERIALIZERS,
+    decode_state_payload, encode_state_payload
+)
+
+logging.disable(logging.INFO)
+
+
+# ==================== DADOS SINTÉTICOS ====================
+
+WORDS = [
+    "contrato", "cláusula", "holding", "tributário", "societário", "precedente",
+    "responsabilidade", "quotas", "governança", "impugnação", "prescrição",
+    "arbitragem", "compliance", "reforma", "dissolução", "sucessão", "patrimonial",
+]
+
+
+def conversation_states(steps: int, seed: int = 0):
+    """Estados de uma conversa em que cada passo acrescenta uma mensagem."""
+    rng = random.Random(seed)
+    state: Dict[str, Any] = {
+        "session_id": "bench",
+        "messages": [],
+        "context": {"cliente": "Empresa X", "area": "societario", "step": 0},
+        "documents": {},
+    }
+    for step in range(steps):
+        state["messages"].append({
+            "role": "user" if step % 2 == 0 else "assistant",
+            "content": " ".join(rng.choices(WORDS, k=80)),
+        })
+        state["context"]["step"] = step
+        if step % 25 == 0:
+            state["documents"][f"doc_{step}"] = " ".join(rng.choices(WORDS, k=400))
+        yield state
+
+
+def time_call(fn: Callable[[], object], repeats: int) -> float:
+    """Latência mediana em ms."""
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(samples), 3)
+
+
+# ==================== BENCHMARKS ====================
+
+def bench_delta(sizes: List[int], repeats: int = 20):
+    """Bytes gravados e latência de load: checkpoints completos vs incrementais."""
+    print(f"{'steps':>8} | {'mode':>11} | {'written MB':>10} | {'save p50 ms':>11} | {'load p50 ms':>11}")
+
+    for steps in sizes:
+        for mode in ("full", "incremental"):
+            with tempfile.TemporaryDirectory() as tmp:
+                config = CheckpointConfig(
+                    auto_checkpoint_interval=0,
+                    max_checkpoints_per_session=0,
+                    enable_incremental=mode == "incremental",
+                    content_addressed=False,
+                )
+                storage = SQLiteCheckpointStorage(db_path=str(Path(tmp) / "bench.db"))
+                saver = AdvancedCheckpointSaver(config, storage=storage)
+
+                written = 0
+                save_times = []
+                last_id = None
+                for state in conversation_states(steps):
+                    start = time.perf_counter()
+                    last_id = saver.save_checkpoint(session_id="bench", state=state)
+                    save_times.append((time.perf_counter() - start) * 1000)
+                    written += storage.list_checkpoints(session_id="bench", limit=1)[0].size_bytes
+
+                load_ms = time_call(lambda: saver.load_checkpoint(last_id), repeats)
+                storage.close()
+
+                print(f"{steps:>8} | {mode:>11} | {written / 1e6:>10.2f} | "
+                      f"{statistics.median(save_times):>11.3f} | {load_ms:>11}")
+
+
+def database_size(storage: SQLiteCheckpointStorage) -> int:
+    """Bytes ocupados no banco (páginas em uso)."""
+    with storage._connections.connection() as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        used = conn.execute("PRAGMA page_count").fetchone()[0] - conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return used * page_size
+
+
+def bench_dedup(sizes: List[int], repeats: int = 20):
+    """Tamanho do banco: BLOB por checkpoint vs chunks endereçados por conteúdo."""
+    print(f"{'steps':>8} | {'mode':>16} | {'db MB':>8} | {'unique MB':>9} | {'load p50 ms':>11}")
+
+    modes = {
+        "full": dict(enable_incremental=False, content_addressed=False),
+        "full+chunks": dict(enable_incremental=False, content_addressed=True),
+        "delta": dict(enable_incremental=True, content_addressed=False),
+        "delta+chunks": dict(enable_incremental=True, content_addressed=True),
+    }
+    for steps in sizes:
+        for mode, options in modes.items():
+            with tempfile.TemporaryDirectory() as tmp:
+                config = CheckpointConfig(auto_checkpoint_interval=0, max_checkpoints_per_session=0, **options)
+                storage = SQLiteCheckpointStorage(db_path=str(Path(tmp) / "bench.db"))
+                saver = AdvancedCheckpointSaver(config, storage=storage)
+
+                last_id = None
+                for state in conversation_states(steps):
+                    last_id = saver.save_checkpoint(session_id="bench", state=state)
+                # Conteúdo único: o último estado serializado uma vez
+                unique_mb = len(pickle.dumps(saver.load_checkpoint(last_id))) / 1e6
+
+                load_ms = time_call(lambda: saver.load_checkpoint(last_id), repeats)
+                print(f"{steps:>8} | {mode:>16} | {database_size(storage) / 1e6:>8.2f} | "
+                      f"{unique_mb:>9.2f} | {load_ms:>11}")
+                storage.close()
+
+
+def checkpoint_samples(steps: int) -> List[bytes]:
+    """Conteúdos gravados (sem compressão) por uma sessão de `steps` passos."""
+    with tempfile.TemporaryDirectory() as tmp:
+        config = CheckpointConfig(auto_checkpoint_interval=0, max_checkpoints_per_session=0,
+                                  compression_enabled=False)
+        storage = SQLiteCheckpointStorage(db_path=str(Path(tmp) / "bench.db"))
+        saver = AdvancedCheckpointSaver(config, storage=storage)
+        for state in conversation_states(steps):
+            saver.save_checkpoint(session_id="bench", state=state)
+        samples = [data for data, _ in storage.sample_payloads(1_000_000)]
+        storage.close()
+    return samples
+
+
+def bench_compression(sizes: List[int]):
+    """Razão e MB/s de compressão/descompressão por codec sobre conteúdos reais."""
+    codecs = {
+        "gzip-6": (CompressionType.GZIP, 6),
+        "gzip-9": (CompressionType.GZIP, 9),
+        "lzma": (CompressionType.LZMA, None),
+        "zstd-1": (CompressionType.ZSTD, 1),
+        "zstd-3": (CompressionType.ZSTD, 3),
+        "zstd-9": (CompressionType.ZSTD, 9),
+        "zstd-19": (CompressionType.ZSTD, 19),
+        "zstd-dict-3": (CompressionType.ZSTD_DICT, 3),
+    }
+    print(f"{'steps':>6} | {'samples':>7} | {'codec':>11} | {'ratio':>6} | {'<1KB ratio':>10} | "
+          f"{'enc MB/s':>8} | {'dec MB/s':>8}")
+
+    for steps in sizes:
+        samples = checkpoint_samples(steps)
+        # Dicionário treinado na metade das amostras e avaliado na outra
+        random.Random(0).shuffle(samples)
+        train, test = samples[::2], samples[1::2]
+        raw_total = sum(len(sample) for sample in test)
+        small = [sample for sample in test if len(sample) < 1024]
+
+        for name, (compression_type, level) in codecs.items():
+            manager = CompressionManager(level=level)
+            if compression_type == CompressionType.ZSTD_DICT:
+                import zstandard
+                manager.use_dictionary(zstandard.train_dictionary(64 * 1024, train).as_bytes())
+
+            start = time.perf_counter()
+            compressed = [manager.compress(sample, compression_type) for sample in test]
+            encode = time.perf_counter() - start
+            start = time.perf_counter()
+            for data in compressed:
+                manager.decompress(data, compression_type)
+            decode = time.perf_counter() - start
+
+            small_compressed = sum(
+                len(data) for sample, data in zip(test, compressed) if len(sample) < 1024
+            )
+            small_ratio = sum(len(sample) for sample in small) / small_compressed if small else 0
+            print(f"{steps:>6} | {len(test):>7} | {name:>11} | "
+                  f"{raw_total / sum(len(data) for data in compressed):>6.2f} | {small_ratio:>10.2f} | "
+                  f"{raw_total / 1e6 / encode:>8.1f} | {raw_total / 1e6 / decode:>8.1f}")
+
+
+def message_state(steps: int) -> Dict[str, Any]:
+    """Estado no formato dos grafos: mensagens LangChain e contexto."""
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    state = None
+    for state in conversation_states(steps):
+        pass
+    return {
+        "messages": [
+            HumanMessage(m["content"]) if m["role"] == "user" else AIMessage(m["content"], id=str(i))
+            for i, m in enumerate(state["messages"])
+        ],
+        "context": state["context"],
+        "documents": state["documents"],
+    }
+
+
+def bench_serialization(sizes: List[int], repeats: int = 20):
+    """Serialização do estado: pickle vs msgpack versionado, completa e parcial."""
+    print(f"{'steps':>6} | {'format':>8} | {'KB':>8} | {'dumps ms':>8} | {'loads ms':>8} | "
+          f"{'context only ms':>15}")
+
+    for steps in sizes:
+        state = message_state(steps)
+        for fmt in (SerializationFormat.PICKLE, SerializationFormat.MSGPACK):
+            serializer = STATE_SERIALIZERS[fmt]
+            allow_pickle = fmt == SerializationFormat.PICKLE
+            payload = encode_state_payload(state, serializer, lazy=True)
+            assert decode_state_payload(payload, allow_pickle=allow_pickle) == state
+
+            dumps_ms = time_call(lambda: encode_state_payload(state, serializer, lazy=True), repeats)
+            loads_ms = time_call(lambda: decode_state_payload(payload, allow_pickle=allow_pickle), repeats)
+            partial_ms = time_call(
+                lambda: decode_state_payload(payload, keys=["context"], allow_pickle=allow_pickle), repeats
+            )
+            print(f"{steps:>6} | {fmt.value:>8} | {len(payload) / 1024:>8.1f} | {dumps_ms:>8} | "
+                  f"{loads_ms:>8} | {partial_ms:>15}")
+
+
+class ScanningRetentionSaver(AdvancedCheckpointSaver):
+    """Retenção anterior: lista a sessão, ordena em Python e remove um a um."""
+
+    def _cleanup_old_checkpoints(self, session_id: str):
+        checkpoints = self.storage.list_checkpoints(session_id=session_id, limit=1000)
+        if len(checkpoints) > self.config.max_checkpoints_per_session:
+            milestones = [cp for cp in checkpoints if cp.checkpoint_type == CheckpointType.MILESTONE]
+            regular = sorted(
+                (cp for cp in checkpoints if cp.checkpoint_type != CheckpointType.MILESTONE),
+                key=lambda cp: cp.created_at
+            )
+            keep_regular = self.config.max_checkpoints_per_session - len(milestones)
+            for cp in regular[:-keep_regular] if keep_regular > 0 else regular:
+                self.storage.delete_checkpoint(cp.id)
+
+
+def bench_retention(sizes: List[int], saves: int = 200):
+    """Latência do save com a sessão no limite de retenção (limite = size)."""
+    print(f"{'limit':>8} | {'mode':>8} | {'save p50 ms':>11} | {'save p99 ms':>11}")
+    state = {"messages": [{"role": "user", "content": "consulta"}], "context": {"step": 0}}
+
+    for size in sizes:
+        for mode, saver_class in (("scan", ScanningRetentionSaver), ("sql", AdvancedCheckpointSaver)):
+            with tempfile.TemporaryDirectory() as tmp:
+                config = CheckpointConfig(
+                    auto_checkpoint_interval=0, max_checkpoints_per_session=size,
+                    enable_incremental=False, content_addressed=False,
+                )
+                storage = SQLiteCheckpointStorage(db_path=str(Path(tmp) / "bench.db"))
+                saver = saver_class(config, storage=storage)
+                # Preencher a sessão até o limite sem medir
+                for step in range(size):
+                    state["context"]["step"] = step
+                    AdvancedCheckpointSaver.save_checkpoint(saver, session_id="bench", state=state)
+
+                samples = []
+                for step in range(saves):
+                    state["context"]["step"] = size + step
+                    start = time.perf_counter()
+                    saver.save_checkpoint(session_id="bench", state=state)
+                    samples.append((time.perf_counter() - start) * 1000)
+                storage.close()
+
+                samples.sort()
+                print(f"{size:>8} | {mode:>8} | {statistics.median(samples):>11.3f} | "
+                      f"{samples[int(len(samples) * 0.99) - 1]:>11.3f}")
+
+
+def json_metadata(storage: SQLiteCheckpointStorage, limit: int) -> List[CheckpointMetadata]:
+    """Listagem anterior: JSON de metadados decodificado linha a linha."""
+    with storage._connections.connection() as conn:
+        rows = conn.execute(
+            "SELECT metadata FROM checkpoints ORDER BY created_at DESC LIMIT ?", (limit,)
+        ).fetchall()
+    return [CheckpointMetadata.from_dict(json.loads(row[0])) for row in rows]
+
+
+def json_statistics(storage: SQLiteCheckpointStorage) -> Dict[str, Any]:
+    """Estatísticas anteriores: agregação em Python sobre as 1000 linhas mais recentes."""
+    checkpoints = json_metadata(storage, 1000)
+    by_type: Dict[str, int] = {}
+    for cp in checkpoints:
+        by_type[cp.checkpoint_type.value] = by_type.get(cp.checkpoint_type.value, 0) + 1
+    return {"total": len(checkpoints), "total_size_bytes": sum(cp.size_bytes for cp in checkpoints),
+            "by_type": by_type}
+
+
+def bench_listing(sizes: List[int], repeats: int = 20):
+    """Listagem por tag e estatísticas: JSON + Python vs colunas + agregados SQL."""
+    print(f"{'rows':>8} | {'mode':>6} | {'list 100 ms':>11} | {'tag hits':>8} | {'stats ms':>9} | {'stats rows':>10}")
+    rng = random.Random(0)
+
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            storage = SQLiteCheckpointStorage(db_path=str(Path(tmp) / "bench.db"))
+            for i in range(size):
+                # 1 em cada 50 checkpoints marcado para revisão
+                tags = ["rotina", "revisao"] if i % 50 == 0 else ["rotina"]
+                metadata = CheckpointMetadata(
+                    id=f"cp-{i}", session_id=f"sessao-{i % 20}",
+                    checkpoint_type=CheckpointType.MILESTONE if i % 10 == 0 else CheckpointType.AUTOMATIC,
+                    created_at=datetime(2024, 1, 1) + timedelta(seconds=i),
+                    size_bytes=rng.randint(500, 5000), compression=CompressionType.ZSTD,
+                    tags=tags, description="checkpoint sintético", step_number=i,
+                )
+                storage.save_checkpoint(metadata.id, metadata.session_id, b"x", metadata)
+
+            for mode in ("json", "sql"):
+                if mode == "json":
+                    # Filtro de tags depois do LIMIT, como antes
+                    list_fn = lambda: [cp for cp in json_metadata(storage, 100) if "revisao" in cp.tags]
+                    stats_fn = lambda: json_statistics(storage)
+                else:
+                    list_fn = lambda: storage.list_checkpoints(tags=["revisao"], limit=100)
+                    stats_fn = lambda: storage.get_statistics()
+                print(f"{size:>8} | {mode:>6} | {time_call(list_fn, repeats):>11.3f} | {len(list_fn()):>8} | "
+                      f"{time_call(stats_fn, repeats):>9.3f} | {stats_fn()['total']:>10}")
+            storage.close()
+
+
+def bench_durability(sizes: List[int], saves: int = 100):
+    """Latência do save e vazão por modo de durabilidade com `size` sessões concorrentes."""
+    print(f"{'sessions':>8} | {'mode':>8} | {'save p50 ms':>11} | {'save p99 ms':>11} | "
+          f"{'saves/s':>8} | {'batches':>7}")
+
+    for size in sizes:
+        for mode in DurabilityMode:
+            with tempfile.TemporaryDirectory() as tmp:
+                config = CheckpointConfig(
+                    auto_checkpoint_interval=0, max_checkpoints_per_session=50, durability_mode=mode,
+                )
+                storage = SQLiteCheckpointStorage(db_path=str(Path(tmp) / "bench.db"))
+                saver = AdvancedCheckpointSaver(config, storage=storage)
+                samples: List[float] = []
+
+                def session(index: int):
+                    states = conversation_states(saves, seed=index)
+                    for state in states:
+                        start = time.perf_counter()
+                        saver.save_checkpoint(session_id=f"sessao-{index}", state=state)
+                        samples.append((time.perf_counter() - start) * 1000)
+
+                start = time.perf_counter()
+                threads = [threading.Thread(target=session, args=(index,)) for index in range(size)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                saver.flush()
+                elapsed = time.perf_counter() - start
+                batches = saver._write_queue.batches if saver._write_queue else len(samples)
+                saver.shutdown()
+                storage.close()
+
+                samples.sort()
+                print(f"{size:>8} | {mode.value:>8} | {statistics.median(samples):>11.3f} | "
+                      f"{samples[int(len(samples) * 0.99) - 1]:>11.3f} | "
+                      f"{len(samples) / elapsed:>8.0f} | {batches:>7}")
+
+
+def bench_auto(sizes: List[int], calls: int = 200):
+    """Custo por chamada de um nó decorado: saver novo por chamada, saver compartilhado e deferred."""
+    print(f"{'steps':>8} | {'mode':>10} | {'per call ms':>11} | {'checkpoints':>11}")
+
+    for size in sizes:
+        state = list(conversation_states(size))[-1]
+        for mode in ("new saver", "shared", "deferred"):
+            with tempfile.TemporaryDirectory() as tmp:
+                db_path = str(Path(tmp) / "bench.db")
+                config = CheckpointConfig(auto_checkpoint_interval=1, max_checkpoints_per_session=50)
+                saver = AdvancedCheckpointSaver(config, storage=SQLiteCheckpointStorage(db_path=db_path))
+                scheduler = AutoCheckpointScheduler(saver)
+
+                async def call():
+                    if mode == "new saver":
+                        # Comportamento anterior do decorador: saver e storage novos por chamada
+                        fresh = AdvancedCheckpointSaver(config, storage=SQLiteCheckpointStorage(db_path=db_path))
+                        await fresh.asave_checkpoint(session_id="bench", state=state)
+                    elif mode == "shared":
+                        await saver.asave_checkpoint(session_id="bench", state=state)
+                    else:
+                        scheduler.mark_dirty("bench", state)
+
+                async def run() -> float:
+                    start = time.perf_counter()
+                    for _ in range(calls):
+                        await call()
+                    elapsed = time.perf_counter() - start
+                    await scheduler.run_once()
+                    return elapsed
+
+                elapsed = asyncio.run(run())
+                total = saver.get_checkpoint_statistics().get("total", 0)
+                print(f"{size:>8} | {mode:>10} | {elapsed / calls * 1000:>11.3f} | {total:>11}")
+                saver.shutdown()
+
+
+def bench_file(sizes: List[int], repeats: int = 10):
+    """Load de checkpoints de `size` MB: BLOB no SQLite vs segmento via mmap."""
+    print(f"{'MB':>6} | {'backend':>7} | {'compression':>11} | {'raw load ms':>11} | "
+          f"{'raw alloc MB':>12} | {'state load ms':>13}")
+    rng = random.Random(0)
+
+    for size in sizes:
+        # Documentos longos (atas, due diligence) que somam ~size MB
+        document = " ".join(rng.choices(WORDS, k=size * 1024 * 1024 // 9))
+        state = {"documents": {"ata": document}, "context": {"step": 1}}
+        for compression in (CompressionType.NONE, CompressionType.ZSTD):
+            for backend in ("sqlite", "file"):
+                with tempfile.TemporaryDirectory() as tmp:
+                    db_path = str(Path(tmp) / "bench.db")
+                    storage = (FileCheckpointStorage(db_path=db_path) if backend == "file"
+                               else SQLiteCheckpointStorage(db_path=db_path))
+                    config = CheckpointConfig(
+                        auto_checkpoint_interval=0, enable_incremental=False, content_addressed=False,
+                        compression_enabled=compression != CompressionType.NONE, compression_type=compression,
+                    )
+                    saver = AdvancedCheckpointSaver(config, storage=storage)
+                    checkpoint_id = saver.save_checkpoint(session_id="bench", state=state)
+
+                    raw_ms = time_call(lambda: storage.load_checkpoint(checkpoint_id), repeats)
+                    tracemalloc.start()
+                    storage.load_checkpoint(checkpoint_id)
+                    allocated = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                    state_ms = time_call(lambda: saver.load_checkpoint(checkpoint_id), repeats)
+                    storage.close()
+
+                print(f"{size:>6} | {backend:>7} | {compression.value:>11} | {raw_ms:>11.3f} | "
+                      f"{allocated / (1024 * 1024):>12.2f} | {state_ms:>13.3f}")
+
+
+BENCHMARKS = {
+    "auto": bench_auto,
+    "compression": bench_compression,
+    "dedup": bench_dedup,
+    "delta": bench_delta,
+    "durability": bench_durability,
+    "file": bench_file,
+    "listing": bench_listing,
+    "retention": bench_retention,
+    "serialization": bench_serialization,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks do checkpointing")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--sizes", default="50,200,1000",
+                        help="Tamanhos (passos da sessão) separados por vírgula")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    BENCHMARKS[args.benchmark](sizes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""
+Benchmarks de Observabilidade
+Vieira Pires Advogados - Knowledge Management System
+
+Uso:
+    python benchmarks/bench_observability.py node --sizes 20000
+    python benchmarks/bench_observability.py spans --sizes 1,16,128
+    python benchmarks/bench_observability.py summary --sizes 10000,100000
+    python benchmarks/bench_observability.py metrics --sizes 50000,500000
+    python benchmarks/bench_observability.py export --sizes 10000,100000
+    python benchmarks/bench_observability.py prometheus --sizes 10,100,1000
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import statistics
+import tempfile
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import PrometheusMetrics
+from observability import (
+    EventType, ObservabilityConfig, ObservabilityManager, PerformanceMonitor, TraceEvent, TraceLevel
+)
+
+logging.disable(logging.INFO)
+
+
+# ==================== NODO ====================
+
+def bench_node(sizes: List[int], repeats: int = 5):
+    """Custo de `with trace_node(...)` vazio, por nível de trace."""
+    print(f"{'nodes':>6} | {'level':>6} | {'us/node':>8} | {'event bytes':>11}")
+
+    for size in sizes:
+        for level in (TraceLevel.INFO, TraceLevel.DEBUG):
+            manager = ObservabilityManager(ObservabilityConfig(
+                langsmith_enabled=False, trace_level=level, max_trace_events=size * 2
+            ))
+            manager.start_trace("bench")
+            samples = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                for _ in range(size):
+                    with manager.trace_node("nodo"):
+                        pass
+                samples.append((time.perf_counter() - start) / size * 1e6)
+
+            event = manager.trace_events[-1]
+            event_bytes = sys.getsizeof(event) + (sys.getsizeof(event.__dict__) if hasattr(event, "__dict__") else 0)
+            print(f"{size:>6} | {level.value:>6} | {min(samples):>8.2f} | {event_bytes:>11}")
+
+
+# ==================== SPANS ====================
+
+async def run_spans(manager: ObservabilityManager, tasks: int, spans: int) -> float:
+    """Executa `spans` nodos aninhados em dois níveis por task; retorna segundos."""
+    async def session(index: int):
+        trace_id = manager.start_trace(f"agente_{index}")
+        for _ in range(spans // 2):
+            with manager.trace_node("externo"):
+                with manager.trace_node("interno"):
+                    pass
+            await asyncio.sleep(0)
+        manager.end_trace(trace_id)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(session(i) for i in range(tasks)))
+    return time.perf_counter() - start
+
+
+async def run_baseline(tasks: int, spans: int) -> float:
+    """Mesmo laço sem tracing, para descontar o custo do event loop."""
+    async def session():
+        for _ in range(spans // 2):
+            await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(session() for _ in range(tasks)))
+    return time.perf_counter() - start
+
+
+def bench_spans(sizes: List[int], spans: int = 2000):
+    """Custo por span de trace_node com N sessões concorrentes."""
+    print(f"{'tasks':>6} | {'level':>6} | {'us/span':>8} | {'events':>7}")
+
+    async def measure(tasks: int, level: TraceLevel):
+        manager = ObservabilityManager(ObservabilityConfig(
+            langsmith_enabled=False, trace_level=level, max_trace_events=1_000_000
+        ))
+        elapsed = await run_spans(manager, tasks, spans)
+        baseline = await run_baseline(tasks, spans)
+        return (elapsed - baseline) / (tasks * spans) * 1e6, len(manager.trace_events)
+
+    for tasks in sizes:
+        for level in (TraceLevel.INFO, TraceLevel.DEBUG):
+            per_span, events = asyncio.run(measure(tasks, level))
+            print(f"{tasks:>6} | {level.value:>6} | {per_span:>8.2f} | {events:>7}")
+
+
+# ==================== RESUMO DE TRACE ====================
+
+def scan_summary(manager: ObservabilityManager, trace_id: str) -> Dict[str, Any]:
+    """Resumo como era antes do índice: varredura do deque sob o lock global."""
+    with manager._trace_lock:
+        events = [e for e in manager.trace_events if e.trace_id == trace_id]
+    event_counts = defaultdict(int)
+    for event in events:
+        event_counts[event.event_type.value] += 1
+    return {
+        "start_time": min(e.timestamp for e in events).isoformat(),
+        "end_time": max(e.timestamp for e in events).isoformat(),
+        "total_events": len(events),
+        "error_count": sum(1 for e in events if e.level == TraceLevel.ERROR),
+        "event_counts": dict(event_counts),
+        "nodes_visited": list(set(e.node_name for e in events if e.node_name)),
+    }
+
+
+def bench_summary(sizes: List[int], traces: int = 100, repeats: int = 50):
+    """get_trace_summary com o deque cheio de eventos de `traces` sessões."""
+    print(f"{'events':>7} | {'scan ms':>8} | {'index ms':>8} | {'append us':>9}")
+
+    for size in sizes:
+        manager = ObservabilityManager(ObservabilityConfig(langsmith_enabled=False, max_trace_events=size))
+        trace_ids = [f"trace-{i}" for i in range(traces)]
+        events = [
+            TraceEvent(
+                id=str(i), trace_id=trace_ids[i % traces], parent_id=None,
+                event_type=EventType.TOOL_CALL, timestamp=datetime.now(), level=TraceLevel.INFO,
+                agent_name="bench", node_name=f"node_{i % 7}", message="", data={}
+            )
+            for i in range(size)
+        ]
+        start = time.perf_counter()
+        for event in events:
+            manager.add_trace_event(event)
+        append_us = (time.perf_counter() - start) / size * 1e6
+
+        def timed(fn) -> float:
+            samples = []
+            for i in range(repeats):
+                start = time.perf_counter()
+                fn(trace_ids[i % traces])
+                samples.append((time.perf_counter() - start) * 1000)
+            return statistics.median(samples)
+
+        scan_ms = timed(lambda trace_id: scan_summary(manager, trace_id))
+        index_ms = timed(manager.get_trace_summary)
+        print(f"{size:>7} | {scan_ms:>8.3f} | {index_ms:>8.4f} | {append_us:>9.2f}")
+
+
+# ==================== MÉTRICAS ====================
+
+def bench_metrics(sizes: List[int], keys: int = 50):
+    """record_latency sustentado: custo por registro, memória retida e resumo."""
+    print(f"{'records':>8} | {'record us':>9} | {'retained MB':>11} | {'summary ms':>10}")
+
+    def fill(monitor: PerformanceMonitor, size: int):
+        for i in range(size):
+            monitor.record_latency(f"op_{i % keys}", (i % 997) + 0.5, "bench", f"node_{i % 5}")
+
+    for size in sizes:
+        tracemalloc.start()
+        monitor = PerformanceMonitor()
+        fill(monitor, size)
+        retained = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        monitor = PerformanceMonitor()
+        start = time.perf_counter()
+        fill(monitor, size)
+        record_us = (time.perf_counter() - start) / size * 1e6
+
+        start = time.perf_counter()
+        monitor.get_metrics_summary()
+        summary_ms = (time.perf_counter() - start) * 1000
+        print(f"{size:>8} | {record_us:>9.2f} | {retained / (1024 * 1024):>11.1f} | {summary_ms:>10.2f}")
+
+
+# ==================== EXPORTAÇÃO ====================
+
+def bench_export(sizes: List[int]):
+    """Custo de add_trace_event com exportador JSONL e vazão até o disco."""
+    print(f"{'events':>7} | {'sink':>5} | {'add us':>7} | {'drain s':>7} | {'dropped':>7} | {'file KB':>8}")
+
+    for size in sizes:
+        events = [
+            TraceEvent(
+                str(i), "trace", None, EventType.TOOL_CALL, agent_name="bench",
+                node_name=f"node_{i % 7}", message="Tool call: %s", message_args=("busca",),
+                data={"args": {"query": "contrato social"}, "success": True}
+            )
+            for i in range(size)
+        ]
+        for sink in ("none", "jsonl"):
+            with tempfile.TemporaryDirectory() as tmp:
+                manager = ObservabilityManager(ObservabilityConfig(
+                    langsmith_enabled=False, max_trace_events=size,
+                    export_jsonl_dir=tmp if sink == "jsonl" else None
+                ))
+                start = time.perf_counter()
+                for event in events:
+                    manager.add_trace_event(event)
+                add_us = (time.perf_counter() - start) / size * 1e6
+
+                start = time.perf_counter()
+                manager.shutdown()
+                drain = time.perf_counter() - start
+                dropped = manager.exporter.dropped if manager.exporter else 0
+                size_kb = sum(f.stat().st_size for f in Path(tmp).iterdir()) / 1024
+            print(f"{size:>7} | {sink:>5} | {add_us:>7.2f} | {drain:>7.2f} | {dropped:>7} | {size_kb:>8.0f}")
+
+
+# ==================== PROMETHEUS ====================
+
+def bench_prometheus(sizes: List[int], repeats: int = 20):
+    """Render de /metrics com N séries de latência: sem cache e do cache."""
+    print(f"{'series':>6} | {'render ms':>9} | {'cached us':>9} | {'KB':>6}")
+
+    for size in sizes:
+        manager = ObservabilityManager(ObservabilityConfig(langsmith_enabled=False))
+        for i in range(size):
+            for value in (3.0, 40.0, 700.0, 2500.0):
+                manager.performance_monitor.record_latency(f"op_{i % 10}", value, f"agent_{i // 10}", f"node_{i}")
+
+        metrics = PrometheusMetrics(manager, cache_seconds=0)
+        samples = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            text = metrics.render()
+            samples.append((time.perf_counter() - start) * 1000)
+
+        metrics.cache_seconds = 60
+        start = time.perf_counter()
+        for _ in range(1000):
+            metrics.render()
+        cached_us = (time.perf_counter() - start) / 1000 * 1e6
+        print(f"{size:>6} | {statistics.median(samples):>9.2f} | {cached_us:>9.2f} | {len(text) / 1024:>6.0f}")
+
+
+BENCHMARKS = {
+    "export": bench_export,
+    "metrics": bench_metrics,
+    "node": bench_node,
+    "prometheus": bench_prometheus,
+    "spans": bench_spans,
+    "summary": bench_summary,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de observabilidade")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--sizes", default="1,16,128",
+                        help="Número de sessões concorrentes separado por vírgula")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    BENCHMARKS[args.benchmark](sizes)
+
+
+if __name__ == "__main__":
+    main()
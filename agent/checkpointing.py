@@ -4,24 +4,63 @@ Este módulo implementa persistência de estado robusta para agentes LangGraph.
 """
 
 import os
+import re
 import json
+import atexit
 import pickle
 import sqlite3
+import mmap
 import hashlib
-from typing import Any, Dict, List, Optional, Union, Tuple
+import functools
+import itertools
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence, Set, Union, Tuple
 from enum import Enum
-from datetime import datetime, timedelta
+from datetime import date, datetime, time as dt_time, timedelta, timezone
+from decimal import Decimal
 from dataclasses import dataclass, asdict
 from pathlib import Path
+from uuid import UUID
+from zoneinfo import ZoneInfo
+import time
 import asyncio
 import threading
 import logging
+import queue
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait as wait_futures
 from contextlib import contextmanager
 
 from dotenv import load_dotenv
-from langgraph.checkpoint.base import BaseCheckpointSaver, Checkpoint
+from langchain_core.documents import Document
+from langchain_core.messages import (
+    AIMessage, AIMessageChunk, ChatMessage, ChatMessageChunk, FunctionMessage, FunctionMessageChunk,
+    HumanMessage, HumanMessageChunk, RemoveMessage, SystemMessage, SystemMessageChunk,
+    ToolMessage, ToolMessageChunk
+)
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP, BaseCheckpointSaver, ChannelVersions, Checkpoint, CheckpointTuple,
+    get_checkpoint_id, get_serializable_checkpoint_metadata
+)
+from langgraph.checkpoint.base import CheckpointMetadata as GraphCheckpointMetadata
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.serde.jsonplus import (
+    EXT_CONSTRUCTOR_KW_ARGS, EXT_CONSTRUCTOR_POS_ARGS, EXT_CONSTRUCTOR_SINGLE_ARG, EXT_METHOD_SINGLE_ARG,
+    EXT_PYDANTIC_V1, EXT_PYDANTIC_V2, JsonPlusSerializer
+)
 from langgraph.checkpoint.memory import MemorySaver
 from pydantic import BaseModel, Field
+import ormsgpack
+
+from sqlite_pool import SQLiteConnectionManager, get_database_executor
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstandard = None
+    ZSTD_AVAILABLE = False
 
 load_dotenv()
 
@@ -32,6 +71,20 @@ logger = logging.getLogger(__name__)
 CHECKPOINT_DIR = Path(os.getenv("CHECKPOINT_DIR", "./checkpoints"))
 CHECKPOINT_DIR.mkdir(exist_ok=True)
 
+# Nível zstd padrão: bom equilíbrio entre velocidade e razão para estados pequenos
+ZSTD_DEFAULT_LEVEL = 3
+
+# Dicionário treinado: tamanho alvo e amostras de checkpoints usadas no treino
+ZSTD_DICT_SIZE = 64 * 1024
+ZSTD_DICT_SAMPLE_SIZE = 2000
+
+# Backend de arquivos: tamanho a partir do qual um novo segmento é aberto,
+# conteúdo mínimo para sair do SQLite e fração de bytes mortos que leva um
+# segmento a ser compactado
+FILE_SEGMENT_SIZE = 64 * 1024 * 1024
+FILE_INLINE_THRESHOLD = 16 * 1024
+FILE_COMPACTION_RATIO = 0.5
+
 
 # ==================== ENUMS E TIPOS ====================
 
@@ -47,7 +100,20 @@ class CompressionType(Enum):
     NONE = "none"
     GZIP = "gzip"
     LZMA = "lzma"
-    PICKLE = "pickle"
+    ZSTD = "zstd"
+    ZSTD_DICT = "zstd_dict"  # zstd com dicionário treinado nos checkpoints
+    PICKLE = "pickle"  # legado: mantido para ler checkpoints antigos
+
+
+class SerializationFormat(Enum):
+    MSGPACK = "msgpack"  # serde do LangGraph: mensagens, modelos pydantic, dataclasses
+    PICKLE = "pickle"  # legado
+
+
+class DurabilityMode(Enum):
+    SYNC = "sync"  # comprime e grava antes de retornar
+    BATCHED = "batched"  # aguarda o commit do lote (group commit)
+    ASYNC = "async"  # retorna ao enfileirar; gravação em segundo plano
 
 
 class StorageBackend(Enum):
@@ -76,6 +142,10 @@ class CheckpointMetadata:
     step_number: Optional[int] = None
     execution_time: Optional[float] = None
     memory_usage: Optional[int] = None
+    is_delta: bool = False
+    base_checkpoint_id: Optional[str] = None
+    chain_length: int = 0
+    chunked: bool = False
     
     def to_dict(self) -> Dict[str, Any]:
         """Converte para dicionário."""
@@ -94,16 +164,40 @@ class CheckpointMetadata:
         return cls(**data)
 
 
+@dataclass
+class ChunkSet:
+    """Chunks de um checkpoint endereçado por conteúdo."""
+    # hash -> (dados, compressão) dos itens serializados
+    leaves: Dict[str, Tuple[bytes, str]]
+    # hash -> hashes dos itens de um grupo (trecho de lista ou dicionário)
+    groups: Dict[str, List[str]]
+    # Chunks referenciados diretamente pelo checkpoint (grupos e valores)
+    refs: List[str]
+
+
 class CheckpointConfig(BaseModel):
     """Configuração de checkpointing."""
     storage_backend: StorageBackend = StorageBackend.SQLITE
     auto_checkpoint_interval: int = 30  # segundos
     max_checkpoints_per_session: int = 100
+    retention_worker_interval: int = 0  # segundos; 0 = retenção aplicada a cada save
     compression_enabled: bool = True
-    compression_type: CompressionType = CompressionType.GZIP
+    compression_type: CompressionType = CompressionType.ZSTD if ZSTD_AVAILABLE else CompressionType.GZIP
+    compression_level: Optional[int] = None  # None = padrão do algoritmo; no gzip, limitado a 1-9
+    serialization_format: SerializationFormat = SerializationFormat.MSGPACK
+    allow_legacy_pickle: bool = False  # lê checkpoints pickle antigos (executa código do conteúdo)
     retention_days: int = 30
     enable_incremental: bool = True
+    full_checkpoint_interval: int = 10  # deltas entre checkpoints completos
+    content_addressed: bool = True  # checkpoints completos em chunks deduplicados
     enable_compression_threshold: int = 1024  # bytes
+    dictionary_compression_threshold: int = 64  # bytes, com dicionário treinado ativo
+    durability_mode: DurabilityMode = DurabilityMode.SYNC
+    write_queue_size: int = 1000  # escritas pendentes antes de bloquear quem grava
+    write_queue_timeout: float = 30.0  # segundos aguardando vaga na fila
+    write_batch_size: int = 64  # operações por transação
+    write_batch_delay: float = 0.0  # segundos aguardando o lote encher
+    compression_workers: int = 2
     backup_enabled: bool = True
     encryption_enabled: bool = False
 
@@ -115,160 +209,662 @@ class SQLiteCheckpointStorage:
     
     def __init__(self, db_path: str = None):
         self.db_path = db_path or str(CHECKPOINT_DIR / "checkpoints.db")
-        self._local = threading.local()
+        self._connections = SQLiteConnectionManager(self.db_path)
+        self._executor = get_database_executor()
         self._init_db()
     
-    def _get_connection(self) -> sqlite3.Connection:
-        """Obtém conexão thread-safe."""
-        if not hasattr(self._local, 'connection'):
-            self._local.connection = sqlite3.connect(
-                self.db_path, 
-                check_same_thread=False,
-                timeout=30.0
-            )
-            self._local.connection.row_factory = sqlite3.Row
-        return self._local.connection
-    
     def _init_db(self):
         """Inicializa o banco de dados."""
-        conn = self._get_connection()
+        with self._connections.connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    id TEXT PRIMARY KEY,
+                    session_id TEXT NOT NULL,
+                    checkpoint_type TEXT NOT NULL,
+                    data BLOB NOT NULL,
+                    metadata TEXT NOT NULL,
+                    created_at TIMESTAMP NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    compression TEXT NOT NULL,
+                    tags TEXT,
+                    node_name TEXT,
+                    step_number INTEGER,
+                    parent_checkpoint_id TEXT,
+                    description TEXT,
+                    execution_time REAL,
+                    memory_usage INTEGER,
+                    is_delta INTEGER NOT NULL DEFAULT 0,
+                    base_checkpoint_id TEXT,
+                    chain_length INTEGER NOT NULL DEFAULT 0,
+                    chunked INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            self._migrate_typed_columns(conn)
+            
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_session_id 
+                ON checkpoints(session_id)
+            """)
+            
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_created_at 
+                ON checkpoints(created_at)
+            """)
+            
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_checkpoint_type 
+                ON checkpoints(checkpoint_type)
+            """)
+            
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_session_created_at
+                ON checkpoints(session_id, created_at)
+            """)
+            
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_parent_checkpoint_id
+                ON checkpoints(parent_checkpoint_id)
+            """)
+            
+            self._init_session_counters(conn)
+            self._init_checkpoint_stats(conn)
+            self._init_tags_table(conn)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS checkpoint_dictionaries (
+                    version INTEGER PRIMARY KEY AUTOINCREMENT,
+                    dict_id INTEGER NOT NULL UNIQUE,
+                    data BLOB NOT NULL,
+                    sample_count INTEGER NOT NULL,
+                    sample_bytes INTEGER NOT NULL,
+                    created_at TIMESTAMP NOT NULL
+                )
+            """)
+            
+            self._init_chunk_store(conn)
+            self._init_graph_tables(conn)
+            
+            conn.commit()
+    
+    def _migrate_typed_columns(self, conn: sqlite3.Connection):
+        """
+        Adiciona às bases antigas as colunas de delta e chunks.
+        
+        Antes esses campos existiam só no JSON de metadados; a listagem e a
+        retenção passam a ler colunas, então o valor é copiado uma vez.
+        """
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(checkpoints)")}
+        added = {
+            "is_delta": "INTEGER NOT NULL DEFAULT 0",
+            "base_checkpoint_id": "TEXT",
+            "chain_length": "INTEGER NOT NULL DEFAULT 0",
+            "chunked": "INTEGER NOT NULL DEFAULT 0",
+        }
+        missing = [name for name in added if name not in columns]
+        for name in missing:
+            conn.execute(f"ALTER TABLE checkpoints ADD COLUMN {name} {added[name]}")
+        if missing:
+            conn.execute("""
+                UPDATE checkpoints SET
+                    is_delta = COALESCE(json_extract(metadata, '$.is_delta'), 0),
+                    base_checkpoint_id = json_extract(metadata, '$.base_checkpoint_id'),
+                    chain_length = COALESCE(json_extract(metadata, '$.chain_length'), 0),
+                    chunked = COALESCE(json_extract(metadata, '$.chunked'), 0)
+            """)
+    
+    def _init_tags_table(self, conn: sqlite3.Connection):
+        """
+        Tags dos checkpoints em tabela própria, indexada por tag.
+        
+        O filtro por tag roda no SQL antes do LIMIT; a coluna tags (JSON)
+        continua sendo gravada para compatibilidade.
+        """
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'checkpoint_tags'"
+        ).fetchone()
+        
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS checkpoint_tags (
+                tag TEXT NOT NULL,
+                checkpoint_id TEXT NOT NULL,
+                PRIMARY KEY (tag, checkpoint_id)
+            ) WITHOUT ROWID
+        """)
         conn.execute("""
-            CREATE TABLE IF NOT EXISTS checkpoints (
-                id TEXT PRIMARY KEY,
+            CREATE INDEX IF NOT EXISTS idx_checkpoint_tags_checkpoint_id
+            ON checkpoint_tags(checkpoint_id)
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS checkpoint_tags_ad
+            AFTER DELETE ON checkpoints BEGIN
+                DELETE FROM checkpoint_tags WHERE checkpoint_id = old.id;
+            END
+        """)
+        
+        if not exists:
+            conn.execute("""
+                INSERT OR IGNORE INTO checkpoint_tags(tag, checkpoint_id)
+                SELECT t.value, c.id FROM checkpoints c, json_each(c.tags) t
+                WHERE c.tags IS NOT NULL AND json_valid(c.tags)
+            """)
+    
+    def _init_session_counters(self, conn: sqlite3.Connection):
+        """
+        Contagem de checkpoints por sessão mantida por triggers.
+        
+        Permite decidir a retenção sem varrer a sessão: a limpeza só roda
+        quando a contagem passa do limite. Triggers rodam na transação da
+        escrita, então a contagem não diverge da tabela.
+        """
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'checkpoint_session_counts'"
+        ).fetchone()
+        
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS checkpoint_session_counts (
+                session_id TEXT PRIMARY KEY,
+                regular INTEGER NOT NULL DEFAULT 0,
+                milestones INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+        """)
+        
+        increment = """
+            INSERT INTO checkpoint_session_counts(session_id, regular, milestones)
+            VALUES ({row}.session_id, {d} * ({row}.checkpoint_type != 'milestone'),
+                    {d} * ({row}.checkpoint_type = 'milestone'))
+            ON CONFLICT(session_id) DO UPDATE SET
+                regular = regular + excluded.regular,
+                milestones = milestones + excluded.milestones;
+        """
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS checkpoint_session_counts_ai
+            AFTER INSERT ON checkpoints BEGIN
+                {increment.format(row="new", d=1)}
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS checkpoint_session_counts_ad
+            AFTER DELETE ON checkpoints BEGIN
+                {increment.format(row="old", d=-1)}
+                DELETE FROM checkpoint_session_counts
+                WHERE session_id = old.session_id AND regular + milestones <= 0;
+            END
+        """)
+        
+        if not exists:
+            # Migração: contar os checkpoints existentes uma única vez
+            conn.execute("""
+                INSERT INTO checkpoint_session_counts(session_id, regular, milestones)
+                SELECT session_id, SUM(checkpoint_type != 'milestone'), SUM(checkpoint_type = 'milestone')
+                FROM checkpoints GROUP BY session_id
+            """)
+    
+    def _init_checkpoint_stats(self, conn: sqlite3.Connection):
+        """
+        Contagem e bytes por sessão, tipo e compressão, mantidos por triggers.
+        
+        As estatísticas somam poucas linhas desta tabela em vez de agregar
+        a tabela de checkpoints; datas extremas vêm dos índices de created_at.
+        """
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'checkpoint_stats'"
+        ).fetchone()
+        
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS checkpoint_stats (
                 session_id TEXT NOT NULL,
                 checkpoint_type TEXT NOT NULL,
-                data BLOB NOT NULL,
-                metadata TEXT NOT NULL,
-                created_at TIMESTAMP NOT NULL,
-                size_bytes INTEGER NOT NULL,
                 compression TEXT NOT NULL,
-                tags TEXT,
-                node_name TEXT,
-                step_number INTEGER,
+                count INTEGER NOT NULL DEFAULT 0,
+                total_size INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (session_id, checkpoint_type, compression)
+            ) WITHOUT ROWID
+        """)
+        
+        update = """
+            INSERT INTO checkpoint_stats(session_id, checkpoint_type, compression, count, total_size)
+            VALUES ({row}.session_id, {row}.checkpoint_type, {row}.compression, {d}, {d} * {row}.size_bytes)
+            ON CONFLICT(session_id, checkpoint_type, compression) DO UPDATE SET
+                count = count + excluded.count,
+                total_size = total_size + excluded.total_size;
+        """
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS checkpoint_stats_ai
+            AFTER INSERT ON checkpoints BEGIN
+                {update.format(row="new", d=1)}
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS checkpoint_stats_ad
+            AFTER DELETE ON checkpoints BEGIN
+                {update.format(row="old", d=-1)}
+                DELETE FROM checkpoint_stats
+                WHERE session_id = old.session_id AND checkpoint_type = old.checkpoint_type
+                  AND compression = old.compression AND count <= 0;
+            END
+        """)
+        
+        if not exists:
+            conn.execute("""
+                INSERT INTO checkpoint_stats(session_id, checkpoint_type, compression, count, total_size)
+                SELECT session_id, checkpoint_type, compression, COUNT(*), SUM(size_bytes)
+                FROM checkpoints GROUP BY session_id, checkpoint_type, compression
+            """)
+    
+    def _init_graph_tables(self, conn: sqlite3.Connection):
+        """
+        Cria as tabelas usadas pelos grafos LangGraph (checkpointer nativo).
+        
+        Cada checkpoint do grafo é um snapshot completo dos canais,
+        serializado pelo serde do LangGraph; as escritas pendentes de cada
+        tarefa ficam em graph_writes até o próximo checkpoint do thread.
+        """
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS graph_checkpoints (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL DEFAULT '',
+                checkpoint_id TEXT NOT NULL,
                 parent_checkpoint_id TEXT,
-                description TEXT,
-                execution_time REAL,
-                memory_usage INTEGER
+                type TEXT NOT NULL,
+                checkpoint BLOB NOT NULL,
+                compression TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                created_at TIMESTAMP NOT NULL,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
             )
         """)
-        
         conn.execute("""
-            CREATE INDEX IF NOT EXISTS idx_session_id 
-            ON checkpoints(session_id)
+            CREATE TABLE IF NOT EXISTS graph_writes (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL DEFAULT '',
+                checkpoint_id TEXT NOT NULL,
+                task_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                channel TEXT NOT NULL,
+                type TEXT NOT NULL,
+                value BLOB NOT NULL,
+                task_path TEXT NOT NULL DEFAULT '',
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+            ) WITHOUT ROWID
         """)
+    
+    def _init_chunk_store(self, conn: sqlite3.Connection):
+        """
+        Cria o armazenamento de chunks endereçados por conteúdo.
         
+        Cada chunk é gravado uma vez (hash do conteúdo). Grupos são chunks
+        cujo conteúdo é a lista de hashes de até CHUNK_GROUP_SIZE itens; um
+        checkpoint referencia apenas grupos e valores, de modo que o custo
+        por checkpoint não cresce com o histórico de mensagens. refcount
+        conta referências de checkpoints e de grupos; triggers mantêm a
+        contagem e removem chunks que chegam a zero, inclusive quando
+        checkpoints são apagados pela limpeza de retenção.
+        """
         conn.execute("""
-            CREATE INDEX IF NOT EXISTS idx_created_at 
-            ON checkpoints(created_at)
+            CREATE TABLE IF NOT EXISTS checkpoint_chunks (
+                hash TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                compression TEXT NOT NULL,
+                refcount INTEGER NOT NULL DEFAULT 0
+            )
         """)
-        
         conn.execute("""
-            CREATE INDEX IF NOT EXISTS idx_checkpoint_type 
-            ON checkpoints(checkpoint_type)
+            CREATE TABLE IF NOT EXISTS checkpoint_chunk_refs (
+                checkpoint_id TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                PRIMARY KEY (checkpoint_id, hash)
+            ) WITHOUT ROWID
         """)
-        
-        conn.commit()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS checkpoint_chunk_edges (
+                parent TEXT NOT NULL,
+                child TEXT NOT NULL,
+                PRIMARY KEY (parent, child)
+            ) WITHOUT ROWID
+        """)
+        conn.executescript("""
+            CREATE TRIGGER IF NOT EXISTS checkpoint_chunk_refs_ai
+            AFTER INSERT ON checkpoint_chunk_refs BEGIN
+                UPDATE checkpoint_chunks SET refcount = refcount + 1 WHERE hash = new.hash;
+            END;
+            
+            CREATE TRIGGER IF NOT EXISTS checkpoint_chunk_refs_ad
+            AFTER DELETE ON checkpoint_chunk_refs BEGIN
+                UPDATE checkpoint_chunks SET refcount = refcount - 1 WHERE hash = old.hash;
+                DELETE FROM checkpoint_chunks WHERE hash = old.hash AND refcount <= 0;
+            END;
+            
+            CREATE TRIGGER IF NOT EXISTS checkpoint_chunk_edges_ai
+            AFTER INSERT ON checkpoint_chunk_edges BEGIN
+                UPDATE checkpoint_chunks SET refcount = refcount + 1 WHERE hash = new.child;
+            END;
+            
+            CREATE TRIGGER IF NOT EXISTS checkpoint_chunk_edges_ad
+            AFTER DELETE ON checkpoint_chunk_edges BEGIN
+                UPDATE checkpoint_chunks SET refcount = refcount - 1 WHERE hash = old.child;
+                DELETE FROM checkpoint_chunks WHERE hash = old.child AND refcount <= 0;
+            END;
+            
+            -- Grupo removido libera seus itens (itens não têm filhos, então
+            -- a ausência de triggers recursivos não afeta a contagem)
+            CREATE TRIGGER IF NOT EXISTS checkpoint_chunks_ad
+            AFTER DELETE ON checkpoint_chunks BEGIN
+                DELETE FROM checkpoint_chunk_edges WHERE parent = old.hash;
+            END;
+            
+            CREATE TRIGGER IF NOT EXISTS checkpoints_chunk_refs_ad
+            AFTER DELETE ON checkpoints BEGIN
+                DELETE FROM checkpoint_chunk_refs WHERE checkpoint_id = old.id;
+            END;
+        """)
+    
+    def _store_blob(self, conn: sqlite3.Connection, key: str, data: bytes) -> bytes:
+        """
+        Conteúdo a gravar na coluna de dados para a chave key ("cp:" +
+        checkpoint, "ch:" + chunk, "gc:" + checkpoint do grafo). Backends que
+        guardam o conteúdo fora do banco devolvem b"" e registram a localização.
+        """
+        return data
+    
+    def _resolve_blob(self, conn: sqlite3.Connection, key: str, stored: bytes) -> Union[bytes, memoryview]:
+        """Conteúdo de uma chave a partir do valor lido da coluna de dados."""
+        return stored
+    
+    @staticmethod
+    def _graph_blob_key(thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> str:
+        return f"gc:{thread_id}\x00{checkpoint_ns}\x00{checkpoint_id}"
     
     def save_checkpoint(
         self, 
         checkpoint_id: str,
         session_id: str,
         data: bytes,
-        metadata: CheckpointMetadata
+        metadata: CheckpointMetadata,
+        chunks: Optional[ChunkSet] = None
     ) -> bool:
-        """Salva um checkpoint."""
+        """
+        Salva um checkpoint.
+        
+        chunks traz os chunks referenciados pelo checkpoint; os que já
+        existem não são regravados.
+        """
         try:
-            conn = self._get_connection()
-            metadata_json = json.dumps(metadata.to_dict())
-            tags_json = json.dumps(metadata.tags)
-            
-            conn.execute("""
-                INSERT OR REPLACE INTO checkpoints 
-                (id, session_id, checkpoint_type, data, metadata, created_at, 
-                 size_bytes, compression, tags, node_name, step_number, 
-                 parent_checkpoint_id, description, execution_time, memory_usage)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                checkpoint_id, session_id, metadata.checkpoint_type.value,
-                data, metadata_json, metadata.created_at,
-                metadata.size_bytes, metadata.compression.value,
-                tags_json, metadata.node_name, metadata.step_number,
-                metadata.parent_checkpoint_id, metadata.description,
-                metadata.execution_time, metadata.memory_usage
-            ))
-            
-            conn.commit()
-            return True
+            with self._connections.connection() as conn:
+                self._write_checkpoint(conn, checkpoint_id, session_id, data, metadata, chunks)
+                conn.commit()
+                return True
             
         except Exception as e:
             logger.error(f"Erro ao salvar checkpoint: {e}")
             return False
     
+    def _write_checkpoint(
+        self,
+        conn: sqlite3.Connection,
+        checkpoint_id: str,
+        session_id: str,
+        data: bytes,
+        metadata: CheckpointMetadata,
+        chunks: Optional[ChunkSet] = None
+    ):
+        """Grava um checkpoint na transação aberta em conn (sem commit)."""
+        # Delta sem o pai gravado seria irrecuperável (ex.: pai cuja
+        # gravação em lote falhou)
+        if metadata.is_delta and conn.execute(
+            "SELECT 1 FROM checkpoints WHERE id = ?", (metadata.parent_checkpoint_id,)
+        ).fetchone() is None:
+            raise ValueError(f"Checkpoint pai ausente: {metadata.parent_checkpoint_id}")
+        
+        metadata_json = json.dumps(metadata.to_dict())
+        tags_json = json.dumps(metadata.tags)
+        
+        # Versão anterior do mesmo ID removida explicitamente: REPLACE não
+        # dispara os triggers de DELETE (referências de chunks, contagens)
+        conn.execute("DELETE FROM checkpoints WHERE id = ?", (checkpoint_id,))
+        if chunks:
+            # Itens antes dos grupos: as arestas incrementam refcount
+            conn.executemany(
+                "INSERT OR IGNORE INTO checkpoint_chunks (hash, data, compression) VALUES (?, ?, ?)",
+                [
+                    (chunk_hash, self._store_blob(conn, f"ch:{chunk_hash}", chunk), compression)
+                    for chunk_hash, (chunk, compression) in chunks.leaves.items()
+                ]
+            )
+            for group_hash, children in chunks.groups.items():
+                inserted = conn.execute(
+                    "INSERT OR IGNORE INTO checkpoint_chunks (hash, data, compression) VALUES (?, ?, ?)",
+                    (group_hash, bytes.fromhex("".join(children)), "group")
+                ).rowcount
+                if inserted:
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO checkpoint_chunk_edges (parent, child) VALUES (?, ?)",
+                        [(group_hash, child) for child in children]
+                    )
+            conn.executemany(
+                "INSERT OR IGNORE INTO checkpoint_chunk_refs (checkpoint_id, hash) VALUES (?, ?)",
+                [(checkpoint_id, chunk_hash) for chunk_hash in chunks.refs]
+            )
+        
+        conn.execute("""
+            INSERT INTO checkpoints 
+            (id, session_id, checkpoint_type, data, metadata, created_at, 
+             size_bytes, compression, tags, node_name, step_number, 
+             parent_checkpoint_id, description, execution_time, memory_usage,
+             is_delta, base_checkpoint_id, chain_length, chunked)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            checkpoint_id, session_id, metadata.checkpoint_type.value,
+            self._store_blob(conn, f"cp:{checkpoint_id}", data), metadata_json, metadata.created_at,
+            metadata.size_bytes, metadata.compression.value,
+            tags_json, metadata.node_name, metadata.step_number,
+            metadata.parent_checkpoint_id, metadata.description,
+            metadata.execution_time, metadata.memory_usage,
+            metadata.is_delta, metadata.base_checkpoint_id,
+            metadata.chain_length, metadata.chunked
+        ))
+        if metadata.tags:
+            conn.executemany(
+                "INSERT OR IGNORE INTO checkpoint_tags (tag, checkpoint_id) VALUES (?, ?)",
+                [(tag, checkpoint_id) for tag in metadata.tags]
+            )
+    
+    def write_batch(self, operations: List[Tuple[str, Tuple]]) -> List[Optional[Exception]]:
+        """
+        Grava várias operações em uma única transação (group commit).
+        
+        Cada operação é (nome, argumentos), com nome em "checkpoint",
+        "graph_checkpoint" e "graph_writes" (métodos _write_*). Cada uma roda
+        em um savepoint: uma falha desfaz apenas aquela operação. Retorna,
+        na ordem, None ou a exceção de cada operação.
+        """
+        errors: List[Optional[Exception]] = []
+        with self._connections.connection() as conn:
+            conn.execute("BEGIN")
+            try:
+                for name, args in operations:
+                    conn.execute("SAVEPOINT write_batch_op")
+                    try:
+                        getattr(self, f"_write_{name}")(conn, *args)
+                        errors.append(None)
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO write_batch_op")
+                        errors.append(e)
+                    conn.execute("RELEASE write_batch_op")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return errors
+    
     def load_checkpoint(self, checkpoint_id: str) -> Optional[Tuple[bytes, CheckpointMetadata]]:
         """Carrega um checkpoint."""
         try:
-            conn = self._get_connection()
-            row = conn.execute(
-                "SELECT data, metadata FROM checkpoints WHERE id = ?",
-                (checkpoint_id,)
-            ).fetchone()
-            
-            if row:
-                data = row['data']
-                metadata_dict = json.loads(row['metadata'])
-                metadata = CheckpointMetadata.from_dict(metadata_dict)
-                return data, metadata
+            with self._connections.connection() as conn:
+                row = conn.execute(
+                    "SELECT data, metadata FROM checkpoints WHERE id = ?",
+                    (checkpoint_id,)
+                ).fetchone()
                 
-            return None
+                if row:
+                    data = self._resolve_blob(conn, f"cp:{checkpoint_id}", row['data'])
+                    metadata_dict = json.loads(row['metadata'])
+                    metadata = CheckpointMetadata.from_dict(metadata_dict)
+                    return data, metadata
+                    
+                return None
             
         except Exception as e:
             logger.error(f"Erro ao carregar checkpoint: {e}")
             return None
     
+    def checkpoint_exists(self, checkpoint_id: str) -> bool:
+        """Indica se o checkpoint está gravado (sem ler o conteúdo)."""
+        try:
+            with self._connections.connection() as conn:
+                return conn.execute(
+                    "SELECT 1 FROM checkpoints WHERE id = ?", (checkpoint_id,)
+                ).fetchone() is not None
+            
+        except Exception as e:
+            logger.error(f"Erro ao consultar checkpoint: {e}")
+            return False
+    
+    # Colunas usadas para montar CheckpointMetadata sem ler o JSON de metadados
+    METADATA_COLUMNS = (
+        "id, session_id, checkpoint_type, created_at, size_bytes, compression, tags, "
+        "description, parent_checkpoint_id, node_name, step_number, execution_time, "
+        "memory_usage, is_delta, base_checkpoint_id, chain_length, chunked"
+    )
+    
+    @staticmethod
+    def _metadata_from_row(row: sqlite3.Row) -> CheckpointMetadata:
+        """Monta os metadados a partir das colunas tipadas."""
+        created_at = row['created_at']
+        return CheckpointMetadata(
+            id=row['id'],
+            session_id=row['session_id'],
+            checkpoint_type=CheckpointType(row['checkpoint_type']),
+            created_at=created_at if isinstance(created_at, datetime) else datetime.fromisoformat(created_at),
+            size_bytes=row['size_bytes'],
+            compression=CompressionType(row['compression']),
+            tags=json.loads(row['tags']) if row['tags'] else [],
+            description=row['description'],
+            parent_checkpoint_id=row['parent_checkpoint_id'],
+            node_name=row['node_name'],
+            step_number=row['step_number'],
+            execution_time=row['execution_time'],
+            memory_usage=row['memory_usage'],
+            is_delta=bool(row['is_delta']),
+            base_checkpoint_id=row['base_checkpoint_id'],
+            chain_length=row['chain_length'],
+            chunked=bool(row['chunked'])
+        )
+    
     def list_checkpoints(
         self, 
         session_id: Optional[str] = None,
         checkpoint_type: Optional[CheckpointType] = None,
-        limit: int = 100
+        limit: int = 100,
+        tags: Optional[List[str]] = None,
+        match_all_tags: bool = False
     ) -> List[CheckpointMetadata]:
-        """Lista checkpoints com filtros."""
+        """
+        Lista checkpoints com filtros.
+        
+        Com tags, retorna checkpoints com qualquer uma delas (ou todas, com
+        match_all_tags); o filtro usa checkpoint_tags e é aplicado antes do
+        LIMIT.
+        """
         try:
-            conn = self._get_connection()
-            query = "SELECT metadata FROM checkpoints WHERE 1=1"
-            params = []
-            
-            if session_id:
-                query += " AND session_id = ?"
-                params.append(session_id)
-            
-            if checkpoint_type:
-                query += " AND checkpoint_type = ?"
-                params.append(checkpoint_type.value)
-            
-            query += " ORDER BY created_at DESC LIMIT ?"
-            params.append(limit)
-            
-            rows = conn.execute(query, params).fetchall()
-            
-            checkpoints = []
-            for row in rows:
-                metadata_dict = json.loads(row['metadata'])
-                metadata = CheckpointMetadata.from_dict(metadata_dict)
-                checkpoints.append(metadata)
-            
-            return checkpoints
+            with self._connections.connection() as conn:
+                query = f"SELECT {self.METADATA_COLUMNS} FROM checkpoints WHERE 1=1"
+                params = []
+                
+                if session_id:
+                    query += " AND session_id = ?"
+                    params.append(session_id)
+                
+                if checkpoint_type:
+                    query += " AND checkpoint_type = ?"
+                    params.append(checkpoint_type.value)
+                
+                if tags:
+                    unique_tags = list(dict.fromkeys(tags))
+                    placeholders = ", ".join("?" * len(unique_tags))
+                    query += f"""
+                        AND id IN (
+                            SELECT checkpoint_id FROM checkpoint_tags
+                            WHERE tag IN ({placeholders})
+                            GROUP BY checkpoint_id
+                            HAVING COUNT(*) >= ?
+                        )
+                    """
+                    params.extend(unique_tags)
+                    params.append(len(unique_tags) if match_all_tags else 1)
+                
+                query += " ORDER BY created_at DESC LIMIT ?"
+                params.append(limit)
+                
+                rows = conn.execute(query, params).fetchall()
+                return [self._metadata_from_row(row) for row in rows]
             
         except Exception as e:
             logger.error(f"Erro ao listar checkpoints: {e}")
             return []
     
+    def get_statistics(self, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Agregados dos checkpoints (todos ou de uma sessão): total, tamanho,
+        intervalo de datas e contagens por tipo e compressão.
+        
+        Lê checkpoint_stats e os extremos de created_at pelos índices; o
+        custo não depende do número de checkpoints.
+        """
+        try:
+            with self._connections.connection() as conn:
+                where, params = ("WHERE session_id = ?", (session_id,)) if session_id else ("", ())
+                rows = conn.execute(f"""
+                    SELECT checkpoint_type, compression, SUM(count) AS count, SUM(total_size) AS total_size
+                    FROM checkpoint_stats {where}
+                    GROUP BY checkpoint_type, compression
+                """, params).fetchall()
+                
+                stats = {
+                    "total": 0, "total_size_bytes": 0, "by_type": {},
+                    "compression_stats": {}, "oldest": None, "newest": None
+                }
+                for row in rows:
+                    stats["total"] += row['count']
+                    stats["total_size_bytes"] += row['total_size']
+                    by_type = stats["by_type"]
+                    by_type[row['checkpoint_type']] = by_type.get(row['checkpoint_type'], 0) + row['count']
+                    compression = stats["compression_stats"].setdefault(
+                        row['compression'], {"count": 0, "total_size": 0}
+                    )
+                    compression["count"] += row['count']
+                    compression["total_size"] += row['total_size']
+                
+                if stats["total"]:
+                    # MIN e MAX em consultas separadas: cada uma vira uma
+                    # busca no índice em vez de uma varredura
+                    for key, aggregate in (("oldest", "MIN"), ("newest", "MAX")):
+                        value = conn.execute(
+                            f"SELECT {aggregate}(created_at) FROM checkpoints {where}", params
+                        ).fetchone()[0]
+                        stats[key] = datetime.fromisoformat(str(value))
+                
+                return stats
+            
+        except Exception as e:
+            logger.error(f"Erro ao obter estatísticas de checkpoints: {e}")
+            return {"total": 0}
+    
     def delete_checkpoint(self, checkpoint_id: str) -> bool:
         """Remove um checkpoint."""
         try:
-            conn = self._get_connection()
-            conn.execute("DELETE FROM checkpoints WHERE id = ?", (checkpoint_id,))
-            conn.commit()
-            return True
+            with self._connections.connection() as conn:
+                conn.execute("DELETE FROM checkpoints WHERE id = ?", (checkpoint_id,))
+                conn.commit()
+                return True
             
         except Exception as e:
             logger.error(f"Erro ao deletar checkpoint: {e}")
@@ -278,57 +874,1274 @@ class SQLiteCheckpointStorage:
         """Remove checkpoints antigos."""
         try:
             cutoff_date = datetime.now() - timedelta(days=retention_days)
-            conn = self._get_connection()
-            
-            cursor = conn.execute(
-                "DELETE FROM checkpoints WHERE created_at < ?",
-                (cutoff_date,)
-            )
-            
-            conn.commit()
-            return cursor.rowcount
+            with self._connections.connection() as conn:
+                # Checkpoints antigos ainda necessários para reconstruir
+                # deltas recentes (cadeia até a base) são preservados
+                conn.execute("""
+                    WITH RECURSIVE needed(id) AS (
+                        SELECT parent_checkpoint_id FROM checkpoints
+                        WHERE created_at >= ? AND is_delta = 1
+                        UNION
+                        SELECT c.parent_checkpoint_id FROM checkpoints c
+                        JOIN needed n ON c.id = n.id
+                        WHERE c.is_delta = 1
+                    )
+                    DELETE FROM checkpoints
+                    WHERE created_at < ?
+                      AND id NOT IN (SELECT id FROM needed WHERE id IS NOT NULL)
+                """, (cutoff_date, cutoff_date))
+                # rowcount é -1 para comandos iniciados por WITH
+                removed = conn.execute("SELECT changes()").fetchone()[0]
+                
+                conn.commit()
+                return removed
             
         except Exception as e:
             logger.error(f"Erro ao limpar checkpoints antigos: {e}")
             return 0
+    
+    def enforce_retention(self, session_id: str, max_checkpoints: int) -> int:
+        """
+        Mantém no máximo max_checkpoints checkpoints na sessão.
+        
+        Milestones nunca são removidos, mas contam para o limite; dos demais
+        ficam os mais recentes, e o mais recente (cabeça da cadeia de deltas)
+        fica mesmo com milestones ocupando todo o limite. A contagem por sessão diz quantos excedem o
+        limite sem varrer a sessão, e um único DELETE remove os mais antigos
+        em excesso (busca pelo índice, custo proporcional ao excesso e não
+        ao histórico). Bases e deltas ainda necessários para reconstruir
+        deltas mantidos são preservados e saem em uma limpeza posterior.
+        Retorna o número de checkpoints removidos.
+        """
+        try:
+            with self._connections.connection() as conn:
+                counts = conn.execute(
+                    "SELECT regular, milestones FROM checkpoint_session_counts WHERE session_id = ?",
+                    (session_id,)
+                ).fetchone()
+                if counts is None:
+                    return 0
+                excess = min(counts[0] - 1, counts[0] - max(0, max_checkpoints - counts[1]))
+                if excess <= 0:
+                    return 0
+                
+                conn.execute("""
+                    WITH RECURSIVE candidates AS (
+                        SELECT id FROM checkpoints
+                        WHERE session_id = ? AND checkpoint_type != 'milestone'
+                        ORDER BY created_at, rowid
+                        LIMIT ?
+                    ),
+                    needed(id) AS (
+                        SELECT c.parent_checkpoint_id FROM checkpoints c
+                        WHERE c.parent_checkpoint_id IN (SELECT id FROM candidates)
+                          AND c.id NOT IN (SELECT id FROM candidates)
+                          AND c.is_delta = 1
+                        UNION
+                        SELECT c.parent_checkpoint_id FROM checkpoints c
+                        JOIN needed n ON c.id = n.id
+                        WHERE c.is_delta = 1
+                    )
+                    DELETE FROM checkpoints
+                    WHERE id IN (SELECT id FROM candidates)
+                      AND id NOT IN (SELECT id FROM needed WHERE id IS NOT NULL)
+                """, (session_id, excess))
+                # rowcount é -1 para comandos iniciados por WITH
+                removed = conn.execute("SELECT changes()").fetchone()[0]
+                
+                conn.commit()
+                return removed
+            
+        except Exception as e:
+            logger.error(f"Erro ao aplicar retenção da sessão {session_id}: {e}")
+            return 0
+    
+    def sessions_over_limit(self, max_checkpoints: int) -> List[str]:
+        """Sessões com mais checkpoints que o limite."""
+        try:
+            with self._connections.connection() as conn:
+                rows = conn.execute(
+                    "SELECT session_id FROM checkpoint_session_counts WHERE regular + milestones > ?",
+                    (max_checkpoints,)
+                ).fetchall()
+                return [row[0] for row in rows]
+            
+        except Exception as e:
+            logger.error(f"Erro ao consultar contagens de sessões: {e}")
+            return []
+    
+    def load_chunks(self, hashes: List[str]) -> Dict[str, Tuple[bytes, str]]:
+        """Carrega chunks por hash: {hash: (dados, compressão)}; grupos têm compressão "group"."""
+        try:
+            with self._connections.connection() as conn:
+                rows = conn.execute(
+                    "SELECT hash, data, compression FROM checkpoint_chunks "
+                    "WHERE hash IN (SELECT value FROM json_each(?))",
+                    (json.dumps(list(hashes)),)
+                ).fetchall()
+                return {
+                    row['hash']: (self._resolve_blob(conn, f"ch:{row['hash']}", row['data']), row['compression'])
+                    for row in rows
+                }
+            
+        except Exception as e:
+            logger.error(f"Erro ao carregar chunks: {e}")
+            return {}
+    
+    def get_chunk_statistics(self) -> Dict[str, Any]:
+        """Chunks únicos armazenados e total de referências."""
+        try:
+            with self._connections.connection() as conn:
+                row = conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0), "
+                    "COALESCE(SUM(compression = 'group'), 0) FROM checkpoint_chunks"
+                ).fetchone()
+                return {"unique_chunks": row[0], "stored_bytes": row[1], "groups": row[2]}
+            
+        except Exception as e:
+            logger.error(f"Erro ao obter estatísticas de chunks: {e}")
+            return {}
+    
+    def sample_payloads(self, limit: int) -> List[Tuple[bytes, str]]:
+        """
+        Amostra aleatória de conteúdos gravados: (dados, compressão) de
+        checkpoints, itens do chunk store e snapshots dos grafos.
+        """
+        try:
+            with self._connections.connection() as conn:
+                rows = conn.execute("""
+                    SELECT key, data, compression FROM (
+                        SELECT 'cp:' || id AS key, data, compression FROM checkpoints
+                        UNION ALL
+                        SELECT 'ch:' || hash, data, compression FROM checkpoint_chunks
+                        WHERE compression != 'group'
+                        UNION ALL
+                        SELECT 'gc:' || thread_id || char(0) || checkpoint_ns || char(0) || checkpoint_id,
+                               checkpoint, compression FROM graph_checkpoints
+                    ) ORDER BY random() LIMIT ?
+                """, (limit,)).fetchall()
+                return [(bytes(self._resolve_blob(conn, row[0], row[1])), row[2]) for row in rows]
+            
+        except Exception as e:
+            logger.error(f"Erro ao amostrar checkpoints: {e}")
+            return []
+    
+    def save_compression_dictionary(self, dict_id: int, data: bytes, sample_count: int, sample_bytes: int) -> int:
+        """Grava uma nova versão do dicionário de compressão; retorna a versão."""
+        with self._connections.connection() as conn:
+            cursor = conn.execute("""
+                INSERT OR IGNORE INTO checkpoint_dictionaries
+                (dict_id, data, sample_count, sample_bytes, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, (dict_id, data, sample_count, sample_bytes, datetime.now()))
+            conn.commit()
+            return cursor.lastrowid
+    
+    def load_compression_dictionary(self, dict_id: int) -> Optional[bytes]:
+        """Dicionário de compressão pelo ID gravado nos frames zstd."""
+        with self._connections.connection() as conn:
+            row = conn.execute(
+                "SELECT data FROM checkpoint_dictionaries WHERE dict_id = ?", (dict_id,)
+            ).fetchone()
+            return row[0] if row else None
+    
+    def latest_compression_dictionary(self) -> Optional[bytes]:
+        """Versão mais recente do dicionário de compressão."""
+        with self._connections.connection() as conn:
+            row = conn.execute(
+                "SELECT data FROM checkpoint_dictionaries ORDER BY version DESC LIMIT 1"
+            ).fetchone()
+            return row[0] if row else None
+    
+    def close(self):
+        """Fecha as conexões do pool."""
+        self._connections.close_all()
+    
+    # API assíncrona: as mesmas operações executadas no executor de banco
+    
+    async def asave_checkpoint(
+        self,
+        checkpoint_id: str,
+        session_id: str,
+        data: bytes,
+        metadata: CheckpointMetadata
+    ) -> bool:
+        """Versão assíncrona de save_checkpoint."""
+        return await self._executor.run(
+            self.save_checkpoint, checkpoint_id, session_id, data, metadata
+        )
+    
+    async def aload_checkpoint(self, checkpoint_id: str) -> Optional[Tuple[bytes, CheckpointMetadata]]:
+        """Versão assíncrona de load_checkpoint."""
+        return await self._executor.run(self.load_checkpoint, checkpoint_id)
+    
+    async def alist_checkpoints(self, **kwargs) -> List[CheckpointMetadata]:
+        """Versão assíncrona de list_checkpoints."""
+        return await self._executor.run(self.list_checkpoints, **kwargs)
+    
+    async def adelete_checkpoint(self, checkpoint_id: str) -> bool:
+        """Versão assíncrona de delete_checkpoint."""
+        return await self._executor.run(self.delete_checkpoint, checkpoint_id)
+
+    # Checkpoints dos grafos LangGraph: erros propagam para o grafo, que não
+    # pode seguir com um passo que não foi persistido
+    
+    def put_graph_checkpoint(
+        self,
+        thread_id: str,
+        checkpoint_ns: str,
+        checkpoint_id: str,
+        parent_checkpoint_id: Optional[str],
+        type_: str,
+        checkpoint: bytes,
+        compression: str,
+        metadata: Dict[str, Any],
+        keep_last: int = 0
+    ):
+        """
+        Grava um checkpoint do grafo.
+        
+        Com keep_last > 0 mantém apenas os keep_last checkpoints mais
+        recentes do thread/namespace (e as escritas pendentes deles).
+        """
+        with self._connections.connection() as conn:
+            self._write_graph_checkpoint(
+                conn, thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id,
+                type_, checkpoint, compression, metadata, keep_last
+            )
+            conn.commit()
+    
+    def _write_graph_checkpoint(
+        self,
+        conn: sqlite3.Connection,
+        thread_id: str,
+        checkpoint_ns: str,
+        checkpoint_id: str,
+        parent_checkpoint_id: Optional[str],
+        type_: str,
+        checkpoint: bytes,
+        compression: str,
+        metadata: Dict[str, Any],
+        keep_last: int = 0
+    ):
+        """Grava um checkpoint do grafo na transação aberta em conn (sem commit)."""
+        conn.execute("""
+            INSERT OR REPLACE INTO graph_checkpoints
+            (thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id,
+             type, checkpoint, compression, metadata, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type_,
+            self._store_blob(conn, self._graph_blob_key(thread_id, checkpoint_ns, checkpoint_id), checkpoint),
+            compression, json.dumps(metadata, default=str), datetime.now()
+        ))
+        
+        if keep_last > 0:
+            # IDs de checkpoint (uuid6) crescem com o tempo
+            oldest_kept = conn.execute("""
+                SELECT checkpoint_id FROM graph_checkpoints
+                WHERE thread_id = ? AND checkpoint_ns = ?
+                ORDER BY checkpoint_id DESC LIMIT 1 OFFSET ?
+            """, (thread_id, checkpoint_ns, keep_last - 1)).fetchone()
+            if oldest_kept:
+                for table in ("graph_checkpoints", "graph_writes"):
+                    conn.execute(
+                        f"DELETE FROM {table} WHERE thread_id = ? "
+                        "AND checkpoint_ns = ? AND checkpoint_id < ?",
+                        (thread_id, checkpoint_ns, oldest_kept[0])
+                    )
+    
+    def get_graph_checkpoint(
+        self,
+        thread_id: str,
+        checkpoint_ns: str,
+        checkpoint_id: Optional[str] = None
+    ) -> Optional[sqlite3.Row]:
+        """Checkpoint do grafo pelo ID, ou o mais recente do thread/namespace."""
+        with self._connections.connection() as conn:
+            if checkpoint_id:
+                return conn.execute("""
+                    SELECT * FROM graph_checkpoints
+                    WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?
+                """, (thread_id, checkpoint_ns, checkpoint_id)).fetchone()
+            return conn.execute("""
+                SELECT * FROM graph_checkpoints
+                WHERE thread_id = ? AND checkpoint_ns = ?
+                ORDER BY checkpoint_id DESC LIMIT 1
+            """, (thread_id, checkpoint_ns)).fetchone()
+    
+    def list_graph_checkpoints(
+        self,
+        thread_id: Optional[str] = None,
+        checkpoint_ns: Optional[str] = None,
+        checkpoint_id: Optional[str] = None,
+        before: Optional[str] = None,
+        metadata_filter: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None
+    ) -> List[sqlite3.Row]:
+        """Checkpoints do grafo, do mais recente para o mais antigo."""
+        query = "SELECT * FROM graph_checkpoints WHERE 1=1"
+        params: List[Any] = []
+        
+        if thread_id is not None:
+            query += " AND thread_id = ?"
+            params.append(thread_id)
+        if checkpoint_ns is not None:
+            query += " AND checkpoint_ns = ?"
+            params.append(checkpoint_ns)
+        if checkpoint_id is not None:
+            query += " AND checkpoint_id = ?"
+            params.append(checkpoint_id)
+        if before is not None:
+            query += " AND checkpoint_id < ?"
+            params.append(before)
+        for key, value in (metadata_filter or {}).items():
+            query += " AND json_extract(metadata, ?) = json_extract(?, '$')"
+            params.extend([f'$."{key}"', json.dumps(value)])
+        
+        query += " ORDER BY checkpoint_id DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        
+        with self._connections.connection() as conn:
+            return conn.execute(query, params).fetchall()
+    
+    def graph_checkpoint_data(self, row: sqlite3.Row) -> Union[bytes, memoryview]:
+        """Conteúdo (comprimido) de uma linha de graph_checkpoints."""
+        with self._connections.connection() as conn:
+            return self._resolve_blob(
+                conn,
+                self._graph_blob_key(row['thread_id'], row['checkpoint_ns'], row['checkpoint_id']),
+                row['checkpoint']
+            )
+    
+    def put_graph_writes(self, rows: List[Tuple], replace: bool = False):
+        """
+        Grava escritas pendentes (thread_id, checkpoint_ns, checkpoint_id,
+        task_id, idx, channel, type, value, task_path).
+        
+        Escritas especiais (erro, interrupção) substituem as existentes;
+        as demais são ignoradas se a tarefa já gravou aquele índice.
+        """
+        with self._connections.connection() as conn:
+            self._write_graph_writes(conn, rows, replace)
+            conn.commit()
+    
+    def _write_graph_writes(self, conn: sqlite3.Connection, rows: List[Tuple], replace: bool = False):
+        """Grava escritas pendentes na transação aberta em conn (sem commit)."""
+        verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+        conn.executemany(f"""
+            {verb} INTO graph_writes
+            (thread_id, checkpoint_ns, checkpoint_id, task_id, idx,
+             channel, type, value, task_path)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+    
+    def get_graph_writes(
+        self,
+        thread_id: str,
+        checkpoint_ns: str,
+        checkpoint_id: str
+    ) -> List[sqlite3.Row]:
+        """Escritas pendentes de um checkpoint do grafo, na ordem de gravação."""
+        with self._connections.connection() as conn:
+            return conn.execute("""
+                SELECT task_id, channel, type, value FROM graph_writes
+                WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?
+                ORDER BY task_id, idx
+            """, (thread_id, checkpoint_ns, checkpoint_id)).fetchall()
+    
+    def delete_graph_thread(self, thread_id: str):
+        """Remove checkpoints e escritas de um thread do grafo."""
+        with self._connections.connection() as conn:
+            conn.execute("DELETE FROM graph_checkpoints WHERE thread_id = ?", (thread_id,))
+            conn.execute("DELETE FROM graph_writes WHERE thread_id = ?", (thread_id,))
+            conn.commit()
+
+
+class FileCheckpointStorage(SQLiteCheckpointStorage):
+    """
+    Backend de checkpoints em arquivos de segmento com índice SQLite.
+    
+    Metadados, tags, escritas dos grafos e conteúdos pequenos continuam no
+    SQLite. Conteúdos a partir de inline_threshold bytes (checkpoints, itens
+    do chunk store, snapshots dos grafos) são acrescentados ao segmento
+    ativo, append-only, e file_blobs guarda (segmento, offset, tamanho). A
+    leitura devolve um memoryview sobre o mmap do segmento: o conteúdo vai
+    direto para a descompressão, sem cópia em bytes. Triggers mantêm os
+    bytes vivos por segmento, e compact() reescreve os segmentos com muitos
+    bytes mortos (checkpoints removidos, gravações desfeitas).
+    
+    Cada memoryview entregue mantém o mmap exportado, e mmap.close() falha
+    enquanto houver exportações: é essa a contagem de leitores. Um segmento
+    compactado sai de _maps na hora, mas o mapeamento só é fechado, e o
+    arquivo só é removido, quando o último leitor solta o seu memoryview
+    (no Windows, um arquivo mapeado não pode ser apagado).
+    
+    Os segmentos recebem flush antes do commit no SQLite, a mesma garantia
+    do banco em synchronous=NORMAL: sobrevivem a falhas do processo, mas
+    não necessariamente a uma queda de energia.
+    """
+    
+    def __init__(
+        self,
+        db_path: str = None,
+        segments_dir: str = None,
+        segment_size: int = FILE_SEGMENT_SIZE,
+        inline_threshold: int = FILE_INLINE_THRESHOLD
+    ):
+        db_path = db_path or str(CHECKPOINT_DIR / "checkpoints_file.db")
+        self.segments_dir = Path(segments_dir) if segments_dir else (
+            Path(db_path).parent / f"{Path(db_path).stem}_segments"
+        )
+        self.segments_dir.mkdir(parents=True, exist_ok=True)
+        self.segment_size = segment_size
+        self.inline_threshold = inline_threshold
+        self._append_lock = threading.Lock()
+        self._active_segment: Optional[int] = None
+        self._active_file = None
+        self._maps: Dict[int, mmap.mmap] = {}
+        self._maps_lock = threading.Lock()
+        # Mapeamentos substituídos que ainda têm leitores, por segmento
+        self._retired: Dict[int, List[mmap.mmap]] = defaultdict(list)
+        # Segmentos compactados cujo arquivo aguarda o fim dos leitores
+        self._dropped: Set[int] = set()
+        super().__init__(db_path)
+        
+        segments = self._segment_numbers()
+        if segments and self._segment_path(segments[-1]).stat().st_size < self.segment_size:
+            self._open_segment(segments[-1])
+    
+    def _init_db(self):
+        super()._init_db()
+        with self._connections.connection() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS file_segments (
+                    segment INTEGER PRIMARY KEY,
+                    live_bytes INTEGER NOT NULL DEFAULT 0
+                );
+                
+                CREATE TABLE IF NOT EXISTS file_blobs (
+                    key TEXT PRIMARY KEY,
+                    segment INTEGER NOT NULL,
+                    offset INTEGER NOT NULL,
+                    length INTEGER NOT NULL
+                ) WITHOUT ROWID;
+                
+                CREATE INDEX IF NOT EXISTS idx_file_blobs_segment ON file_blobs(segment);
+                
+                CREATE TRIGGER IF NOT EXISTS file_blobs_ai
+                AFTER INSERT ON file_blobs BEGIN
+                    INSERT INTO file_segments(segment, live_bytes) VALUES (new.segment, new.length)
+                    ON CONFLICT(segment) DO UPDATE SET live_bytes = live_bytes + excluded.live_bytes;
+                END;
+                
+                CREATE TRIGGER IF NOT EXISTS file_blobs_ad
+                AFTER DELETE ON file_blobs BEGIN
+                    UPDATE file_segments SET live_bytes = live_bytes - old.length
+                    WHERE segment = old.segment;
+                END;
+                
+                -- Conteúdo movido pela compactação
+                CREATE TRIGGER IF NOT EXISTS file_blobs_au
+                AFTER UPDATE OF segment ON file_blobs BEGIN
+                    UPDATE file_segments SET live_bytes = live_bytes - old.length
+                    WHERE segment = old.segment;
+                    INSERT INTO file_segments(segment, live_bytes) VALUES (new.segment, new.length)
+                    ON CONFLICT(segment) DO UPDATE SET live_bytes = live_bytes + excluded.live_bytes;
+                END;
+                
+                -- Linhas com a coluna de dados vazia têm o conteúdo em segmento
+                CREATE TRIGGER IF NOT EXISTS checkpoints_file_blobs_ad
+                AFTER DELETE ON checkpoints WHEN length(old.data) = 0 BEGIN
+                    DELETE FROM file_blobs WHERE key = 'cp:' || old.id;
+                END;
+                
+                CREATE TRIGGER IF NOT EXISTS checkpoint_chunks_file_blobs_ad
+                AFTER DELETE ON checkpoint_chunks WHEN length(old.data) = 0 BEGIN
+                    DELETE FROM file_blobs WHERE key = 'ch:' || old.hash;
+                END;
+                
+                CREATE TRIGGER IF NOT EXISTS graph_checkpoints_file_blobs_ad
+                AFTER DELETE ON graph_checkpoints WHEN length(old.checkpoint) = 0 BEGIN
+                    DELETE FROM file_blobs
+                    WHERE key = 'gc:' || old.thread_id || char(0) || old.checkpoint_ns
+                                || char(0) || old.checkpoint_id;
+                END;
+            """)
+            conn.commit()
+    
+    # Segmentos
+    
+    def _segment_path(self, segment: int) -> Path:
+        return self.segments_dir / f"{segment:08d}.seg"
+    
+    def _segment_numbers(self) -> List[int]:
+        return sorted(int(path.stem) for path in self.segments_dir.glob("*.seg"))
+    
+    def _open_segment(self, segment: int):
+        if self._active_file is not None:
+            self._active_file.close()
+        self._active_segment = segment
+        self._active_file = open(self._segment_path(segment), "ab")
+    
+    def _rotate(self):
+        """Fecha o segmento ativo e abre o próximo (chamado com _append_lock)."""
+        segments = self._segment_numbers()
+        self._open_segment(segments[-1] + 1 if segments else 1)
+    
+    def _append(self, data: Union[bytes, memoryview]) -> Tuple[int, int]:
+        """Acrescenta data ao segmento ativo; retorna (segmento, offset)."""
+        with self._append_lock:
+            position = self._active_file.tell() if self._active_file is not None else 0
+            if self._active_file is None or (position and position + len(data) > self.segment_size):
+                self._rotate()
+                position = 0
+            self._active_file.write(data)
+            self._active_file.flush()
+            return self._active_segment, position
+    
+    def _view(self, segment: int, offset: int, length: int) -> memoryview:
+        """Trecho de um segmento, via mmap (remapeado se o arquivo cresceu)."""
+        with self._maps_lock:
+            if segment in self._dropped:
+                # O conteúdo já foi movido; quem chama relê a localização
+                raise FileNotFoundError(f"Segmento compactado: {segment}")
+            mapped = self._maps.get(segment)
+            if mapped is None or len(mapped) < offset + length:
+                with open(self._segment_path(segment), "rb") as f:
+                    remapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                if mapped is not None:
+                    self._retire(segment, mapped)
+                mapped = self._maps[segment] = remapped
+            return memoryview(mapped)[offset:offset + length]
+    
+    def _retire(self, segment: int, mapped: mmap.mmap):
+        """Fecha um mapeamento ou, se ainda há leitores, adia o fechamento (com _maps_lock)."""
+        try:
+            mapped.close()
+        except BufferError:
+            self._retired[segment].append(mapped)
+    
+    def _release_retired(self):
+        """Fecha os mapeamentos sem leitores e remove os segmentos compactados liberados."""
+        with self._maps_lock:
+            for segment in list(self._retired):
+                pending, self._retired[segment] = self._retired[segment], []
+                for mapped in pending:
+                    self._retire(segment, mapped)
+                if not self._retired[segment]:
+                    del self._retired[segment]
+            
+            for segment in list(self._dropped):
+                if segment in self._retired:
+                    continue
+                try:
+                    self._segment_path(segment).unlink(missing_ok=True)
+                except OSError as e:
+                    # Arquivo ainda aberto por outro processo: nova tentativa depois
+                    logger.debug(f"Segmento {segment} ainda em uso: {e}")
+                    continue
+                self._dropped.discard(segment)
+    
+    # Conteúdos
+    
+    def _store_blob(self, conn: sqlite3.Connection, key: str, data: bytes) -> bytes:
+        if key.startswith("ch:"):
+            # Chunks são imutáveis: se já existe, o INSERT OR IGNORE mantém o atual
+            if conn.execute("SELECT 1 FROM checkpoint_chunks WHERE hash = ?", (key[3:],)).fetchone():
+                return data
+        else:
+            # Snapshot do grafo regravado com INSERT OR REPLACE (sem trigger de DELETE)
+            conn.execute("DELETE FROM file_blobs WHERE key = ?", (key,))
+        
+        if len(data) < self.inline_threshold:
+            return data
+        segment, offset = self._append(data)
+        conn.execute(
+            "INSERT INTO file_blobs (key, segment, offset, length) VALUES (?, ?, ?, ?)",
+            (key, segment, offset, len(data))
+        )
+        return b""
+    
+    def _resolve_blob(self, conn: sqlite3.Connection, key: str, stored: bytes) -> Union[bytes, memoryview]:
+        if len(stored):
+            return stored
+        for attempt in range(2):
+            row = conn.execute(
+                "SELECT segment, offset, length FROM file_blobs WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return stored
+            if self._retired:
+                self._release_retired()
+            try:
+                return self._view(*row)
+            except FileNotFoundError:
+                # Segmento removido por uma compactação concluída após a consulta
+                if attempt:
+                    raise
+        return stored
+    
+    # Compactação
+    
+    def compact(self, min_dead_ratio: float = FILE_COMPACTION_RATIO) -> Dict[str, int]:
+        """
+        Reescreve no segmento ativo o conteúdo vivo dos segmentos com ao
+        menos min_dead_ratio de bytes mortos e remove os arquivos antigos.
+        Roda em uma transação de escrita, bloqueando gravações concorrentes
+        durante a cópia. Retorna segmentos removidos e bytes liberados.
+        """
+        self._release_retired()
+        with self._connections.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                live = dict(conn.execute("SELECT segment, live_bytes FROM file_segments").fetchall())
+                candidates = []
+                for segment in self._segment_numbers():
+                    if segment in self._dropped:
+                        continue
+                    size = self._segment_path(segment).stat().st_size
+                    if size == 0:
+                        if segment != self._active_segment:
+                            candidates.append((segment, size))
+                    elif (size - live.get(segment, 0)) / size >= min_dead_ratio:
+                        candidates.append((segment, size))
+                
+                # O segmento ativo só é compactado depois de fechado; com a
+                # transação de escrita aberta, ninguém mais acrescenta nele
+                with self._append_lock:
+                    if any(segment == self._active_segment for segment, _ in candidates):
+                        self._rotate()
+                
+                moved = 0
+                for segment, _ in candidates:
+                    blobs = conn.execute(
+                        "SELECT key, offset, length FROM file_blobs WHERE segment = ? ORDER BY offset",
+                        (segment,)
+                    ).fetchall()
+                    for key, offset, length in blobs:
+                        new_segment, new_offset = self._append(self._view(segment, offset, length))
+                        conn.execute(
+                            "UPDATE file_blobs SET segment = ?, offset = ? WHERE key = ?",
+                            (new_segment, new_offset, key)
+                        )
+                        moved += length
+                    conn.execute("DELETE FROM file_segments WHERE segment = ?", (segment,))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        
+        # Novas leituras já resolvem para os segmentos novos; os mapeamentos
+        # antigos saem de _maps e são fechados antes de apagar os arquivos
+        with self._maps_lock:
+            for segment, _ in candidates:
+                self._dropped.add(segment)
+                mapped = self._maps.pop(segment, None)
+                if mapped is not None:
+                    self._retire(segment, mapped)
+        self._release_retired()
+        
+        freed = sum(size for _, size in candidates) - moved
+        if candidates:
+            logger.info(f"Compactação: {len(candidates)} segmentos removidos, {freed} bytes liberados")
+        return {"segments_removed": len(candidates), "bytes_moved": moved, "bytes_freed": freed}
+    
+    def get_file_statistics(self) -> Dict[str, Any]:
+        """Segmentos em disco, bytes totais e bytes ainda referenciados."""
+        with self._connections.connection() as conn:
+            live = conn.execute("SELECT COALESCE(SUM(live_bytes), 0) FROM file_segments").fetchone()[0]
+        total = sum(self._segment_path(segment).stat().st_size for segment in self._segment_numbers())
+        return {
+            "segments": len(self._segment_numbers()),
+            "total_bytes": total,
+            "live_bytes": live,
+            "dead_ratio": round((total - live) / total, 3) if total else 0.0
+        }
+    
+    def close(self):
+        """Fecha o segmento ativo, os mapeamentos e as conexões."""
+        with self._append_lock:
+            if self._active_file is not None:
+                self._active_file.close()
+                self._active_file = None
+        with self._maps_lock:
+            for segment, mapped in self._maps.items():
+                self._retire(segment, mapped)
+            self._maps.clear()
+        self._release_retired()
+        super().close()
+
+
+# ==================== SERIALIZAÇÃO DE ESTADO ====================
+
+# Cabeçalho dos conteúdos serializados: magic, versão do esquema, formato e
+# tipo de corpo. Conteúdos sem o magic são pickles de versões anteriores,
+# lidos apenas com allow_pickle (pickle executa código ao desserializar).
+STATE_MAGIC = b"VPS"
+STATE_SCHEMA_VERSION = 1
+STATE_HEADER_SIZE = len(STATE_MAGIC) + 3
+
+# Corpo: um valor, ou um envelope {chave: valor serializado} decodificado
+# chave a chave sob demanda
+_BODY_VALUE = 0
+_BODY_LAZY_DICT = 1
+
+
+class StateSerializer(ABC):
+    """Codec dos valores do estado gravados nos checkpoints."""
+    
+    format: SerializationFormat
+    
+    @abstractmethod
+    def dumps(self, value: Any) -> bytes:
+        """Serializa um valor do estado."""
+    
+    @abstractmethod
+    def loads(self, data: bytes) -> Any:
+        """Reconstrói um valor gravado por dumps."""
+
+
+# Classes (e funções) que a leitura do msgpack pode reconstruir: o módulo e
+# o nome gravados no conteúdo só servem de chave nesta tabela, e nada é
+# importado ou chamado fora dela
+_SAFE_STATE_TYPES: Dict[Tuple[str, str], Any] = {}
+
+# Métodos de classe aceitos no tipo estendido "método com um argumento"
+_SAFE_STATE_METHODS = frozenset({"fromisoformat"})
+
+# Tipos estendidos lidos (arrays numpy não são suportados)
+_EXT_CODES = frozenset({
+    EXT_CONSTRUCTOR_SINGLE_ARG, EXT_CONSTRUCTOR_POS_ARGS, EXT_CONSTRUCTOR_KW_ARGS,
+    EXT_METHOD_SINGLE_ARG, EXT_PYDANTIC_V1, EXT_PYDANTIC_V2
+})
+
+
+def register_state_type(*classes: Any):
+    """
+    Permite reconstruir classes da aplicação (modelos pydantic, dataclasses,
+    enums) ao carregar checkpoints; as demais voltam como dados brutos.
+    """
+    for cls in classes:
+        _SAFE_STATE_TYPES[(cls.__module__, cls.__name__)] = cls
+
+
+register_state_type(
+    datetime, date, dt_time, timedelta, timezone, ZoneInfo, UUID, Decimal,
+    set, frozenset, deque, type(Path()), re.compile,
+    AIMessage, AIMessageChunk, ChatMessage, ChatMessageChunk, FunctionMessage, FunctionMessageChunk,
+    HumanMessage, HumanMessageChunk, RemoveMessage, SystemMessage, SystemMessageChunk,
+    ToolMessage, ToolMessageChunk, Document
+)
+
+
+class MsgpackStateSerializer(StateSerializer):
+    """
+    msgpack com os tipos estendidos do serde do LangGraph.
+    
+    Mensagens LangChain, datetimes, UUIDs e as classes registradas em
+    register_state_type são reconstruídos na leitura; nenhum outro código é
+    executado, mesmo com conteúdo adulterado. Objetos sem representação
+    geram erro na gravação. Tuplas voltam como listas.
+    """
+    
+    format = SerializationFormat.MSGPACK
+    
+    def __init__(self):
+        self._serde = JsonPlusSerializer(pickle_fallback=False)
+        self._unregistered: set = set()
+    
+    def dumps(self, value: Any) -> bytes:
+        type_, data = self._serde.dumps_typed(value)
+        # None e bytes têm tipos próprios no serde; msgpack os representa nativamente
+        return data if type_ == "msgpack" else ormsgpack.packb(value)
+    
+    def loads(self, data: bytes) -> Any:
+        return ormsgpack.unpackb(data, ext_hook=self._ext_hook, option=ormsgpack.OPT_NON_STR_KEYS)
+    
+    def _ext_hook(self, code: int, data: bytes) -> Any:
+        """
+        Reconstrói um tipo estendido apenas se a classe estiver registrada;
+        fora da lista, devolve os dados gravados (campos ou argumentos).
+        
+        Modelos pydantic (mensagens) são recriados com model_construct: os
+        campos foram validados na gravação, e revalidar cada mensagem
+        dominava o tempo de leitura.
+        """
+        if code not in _EXT_CODES:
+            raise ValueError(f"Tipo estendido não suportado no estado: {code}")
+        item = ormsgpack.unpackb(data, ext_hook=self._ext_hook, option=ormsgpack.OPT_NON_STR_KEYS)
+        module, name, arg = item[:3]
+        cls = _SAFE_STATE_TYPES.get((module, name))
+        
+        if code == EXT_PYDANTIC_V2:
+            if isinstance(cls, type) and issubclass(cls, BaseModel):
+                return cls.model_construct(**arg)
+        elif cls is not None and code != EXT_PYDANTIC_V1:
+            if code == EXT_CONSTRUCTOR_SINGLE_ARG:
+                return cls(arg)
+            if code == EXT_CONSTRUCTOR_POS_ARGS:
+                return cls(*arg)
+            if code == EXT_CONSTRUCTOR_KW_ARGS:
+                return cls(**arg)
+            if item[3] in _SAFE_STATE_METHODS:
+                return getattr(cls, item[3])(arg)
+        
+        if (module, name) not in self._unregistered:
+            self._unregistered.add((module, name))
+            logger.warning(f"Tipo {module}.{name} não registrado; lido como dados brutos")
+        return arg
+
+
+class PickleStateSerializer(StateSerializer):
+    """pickle, para compatibilidade com checkpoints e estados antigos."""
+    
+    format = SerializationFormat.PICKLE
+    
+    def dumps(self, value: Any) -> bytes:
+        return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    
+    def loads(self, data: bytes) -> Any:
+        return pickle.loads(data)
+
+
+STATE_SERIALIZERS: Dict[SerializationFormat, StateSerializer] = {
+    SerializationFormat.MSGPACK: MsgpackStateSerializer(),
+    SerializationFormat.PICKLE: PickleStateSerializer(),
+}
+
+# Código do formato no cabeçalho (estável entre versões)
+_FORMAT_CODES = {SerializationFormat.MSGPACK: 1, SerializationFormat.PICKLE: 2}
+_FORMATS_BY_CODE = {code: fmt for fmt, code in _FORMAT_CODES.items()}
+
+
+def encode_state_payload(value: Any, serializer: StateSerializer, lazy: bool = False) -> bytes:
+    """
+    Serializa um valor com cabeçalho versionado.
+    
+    Com lazy, dicionários com chaves str viram um envelope em que cada valor
+    é serializado à parte, permitindo decodificar só as chaves pedidas.
+    """
+    if lazy and isinstance(value, dict) and all(isinstance(key, str) for key in value):
+        body_type = _BODY_LAZY_DICT
+        body = ormsgpack.packb({key: serializer.dumps(item) for key, item in value.items()})
+    else:
+        body_type = _BODY_VALUE
+        body = serializer.dumps(value)
+    header = STATE_MAGIC + bytes([STATE_SCHEMA_VERSION, _FORMAT_CODES[serializer.format], body_type])
+    return header + body
+
+
+def decode_state_payload(
+    data: bytes,
+    keys: Optional[Sequence[str]] = None,
+    allow_pickle: bool = False
+) -> Any:
+    """
+    Desserializa um conteúdo de encode_state_payload.
+    
+    keys restringe envelopes lazy às chaves pedidas; as demais nem chegam
+    a ser decodificadas (ex.: inspecionar o contexto sem ler o histórico).
+    Conteúdos pickle (legados ou gravados no formato PICKLE) só são lidos
+    com allow_pickle; sem ele, geram ValueError.
+    """
+    # data pode ser um memoryview (ex.: mapeado de um segmento de arquivo)
+    if data[:len(STATE_MAGIC)] != STATE_MAGIC:
+        _require_pickle(allow_pickle)
+        return pickle.loads(data)
+    
+    version, code, body_type = data[len(STATE_MAGIC):STATE_HEADER_SIZE]
+    if version > STATE_SCHEMA_VERSION:
+        raise ValueError(f"Versão de serialização não suportada: {version}")
+    fmt = _FORMATS_BY_CODE.get(code)
+    if fmt is None:
+        raise ValueError(f"Formato de serialização desconhecido: {code}")
+    if fmt == SerializationFormat.PICKLE:
+        _require_pickle(allow_pickle)
+    serializer = STATE_SERIALIZERS[fmt]
+    body = memoryview(data)[STATE_HEADER_SIZE:]
+    
+    if body_type == _BODY_LAZY_DICT:
+        envelope = ormsgpack.unpackb(body)
+        return {
+            key: serializer.loads(item)
+            for key, item in envelope.items()
+            if keys is None or key in keys
+        }
+    return serializer.loads(body)
+
+
+def _require_pickle(allow_pickle: bool):
+    if not allow_pickle:
+        raise ValueError(
+            "Conteúdo em pickle recusado; habilite allow_legacy_pickle para ler checkpoints legados"
+        )
 
 
 # ==================== COMPRESSÃO ====================
 
 class CompressionManager:
-    """Gerenciador de compressão para checkpoints."""
+    """
+    Gerenciador de compressão para checkpoints.
     
-    @staticmethod
-    def compress(data: bytes, compression_type: CompressionType) -> bytes:
+    ZSTD_DICT comprime com o dicionário treinado ativo; o ID do dicionário
+    vai no cabeçalho do frame zstd, então a descompressão encontra o
+    dicionário certo (via dictionary_loader) mesmo após novos treinos.
+    Compressores zstd não são thread-safe e ficam um por thread.
+    """
+    
+    def __init__(
+        self,
+        level: Optional[int] = None,
+        dictionary_loader: Optional[Callable[[int], Optional[bytes]]] = None,
+        allow_pickle: bool = False
+    ):
+        self.level = level
+        self.dictionary_loader = dictionary_loader
+        self.allow_pickle = allow_pickle  # leitura do tipo legado PICKLE
+        self.active_dictionary_id: Optional[int] = None
+        self._dictionaries: Dict[int, Any] = {}
+        self._local = threading.local()
+    
+    def use_dictionary(self, data: bytes) -> int:
+        """Registra um dicionário zstd e o torna o ativo; retorna seu ID."""
+        self._require_zstd()
+        dictionary = zstandard.ZstdCompressionDict(data)
+        dict_id = dictionary.dict_id()
+        self._dictionaries[dict_id] = dictionary
+        self.active_dictionary_id = dict_id
+        return dict_id
+    
+    def _require_zstd(self):
+        if not ZSTD_AVAILABLE:
+            raise ValueError("Compressão zstd requer o pacote zstandard")
+    
+    def _dictionary(self, dict_id: int):
+        dictionary = self._dictionaries.get(dict_id)
+        if dictionary is None:
+            data = self.dictionary_loader(dict_id) if self.dictionary_loader else None
+            if data is None:
+                raise ValueError(f"Dicionário zstd {dict_id} não encontrado")
+            dictionary = self._dictionaries[dict_id] = zstandard.ZstdCompressionDict(data)
+        return dictionary
+    
+    def _zstd(self, kind: str, dict_id: int = 0):
+        """Compressor/descompressor zstd da thread atual (dict_id 0 = sem dicionário)."""
+        cache = getattr(self._local, "codecs", None)
+        if cache is None:
+            cache = self._local.codecs = {}
+        codec = cache.get((kind, dict_id))
+        if codec is None:
+            dictionary = self._dictionary(dict_id) if dict_id else None
+            if kind == "compress":
+                codec = zstandard.ZstdCompressor(
+                    level=self.level or ZSTD_DEFAULT_LEVEL, dict_data=dictionary
+                )
+            else:
+                codec = zstandard.ZstdDecompressor(dict_data=dictionary)
+            cache[(kind, dict_id)] = codec
+        return codec
+    
+    def compress(self, data: bytes, compression_type: CompressionType) -> bytes:
         """Comprime dados."""
         if compression_type == CompressionType.NONE:
             return data
         elif compression_type == CompressionType.GZIP:
             import gzip
-            return gzip.compress(data)
+            # O nível é compartilhado com o zstd (até 22); o gzip aceita 1-9
+            level = min(max(self.level, 1), 9) if self.level else 9
+            return gzip.compress(data, compresslevel=level)
         elif compression_type == CompressionType.LZMA:
             import lzma
             return lzma.compress(data)
+        elif compression_type == CompressionType.ZSTD:
+            self._require_zstd()
+            return self._zstd("compress").compress(data)
+        elif compression_type == CompressionType.ZSTD_DICT:
+            self._require_zstd()
+            if self.active_dictionary_id is None:
+                raise ValueError("Nenhum dicionário zstd ativo")
+            return self._zstd("compress", self.active_dictionary_id).compress(data)
         elif compression_type == CompressionType.PICKLE:
             return pickle.dumps(data)
         else:
             raise ValueError(f"Tipo de compressão não suportado: {compression_type}")
     
-    @staticmethod
-    def decompress(data: bytes, compression_type: CompressionType) -> bytes:
-        """Descomprime dados."""
-        if compression_type == CompressionType.NONE:
-            return data
-        elif compression_type == CompressionType.GZIP:
-            import gzip
-            return gzip.decompress(data)
-        elif compression_type == CompressionType.LZMA:
-            import lzma
-            return lzma.decompress(data)
-        elif compression_type == CompressionType.PICKLE:
-            return pickle.loads(data)
+    def decompress(self, data: bytes, compression_type: CompressionType) -> bytes:
+        """Descomprime dados."""
+        if compression_type == CompressionType.NONE:
+            return data
+        elif compression_type == CompressionType.GZIP:
+            import gzip
+            return gzip.decompress(data)
+        elif compression_type == CompressionType.LZMA:
+            import lzma
+            return lzma.decompress(data)
+        elif compression_type in (CompressionType.ZSTD, CompressionType.ZSTD_DICT):
+            self._require_zstd()
+            dict_id = zstandard.get_frame_parameters(data).dict_id
+            return self._zstd("decompress", dict_id).decompress(data)
+        elif compression_type == CompressionType.PICKLE:
+            _require_pickle(self.allow_pickle)
+            return pickle.loads(data)
+        else:
+            raise ValueError(f"Tipo de compressão não suportado: {compression_type}")
+
+
+# ==================== CHECKPOINTS INCREMENTAIS ====================
+
+# Sessões cujo último estado fica em memória para calcular o próximo delta
+DELTA_HEAD_CACHE_SIZE = 256
+
+# Itens (mensagens, registros) por grupo no armazenamento por conteúdo
+CHUNK_GROUP_SIZE = 64
+
+
+def compute_state_delta(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Diferença estrutural entre dois estados (dicionários).
+    
+    Listas que apenas cresceram (ex.: messages) viram "extend" com os novos
+    itens; dicionários aninhados são comparados recursivamente; o restante é
+    substituído por inteiro em "set". Chaves removidas vão em "delete".
+    """
+    delta: Dict[str, Any] = {}
+    for key, value in new.items():
+        if key not in old:
+            delta.setdefault("set", {})[key] = value
+            continue
+        
+        previous = old[key]
+        if previous is value:
+            continue
+        if isinstance(previous, dict) and isinstance(value, dict):
+            nested = compute_state_delta(previous, value)
+            if nested:
+                delta.setdefault("nested", {})[key] = nested
+        elif (isinstance(previous, list) and isinstance(value, list)
+              and len(value) >= len(previous) and value[:len(previous)] == previous):
+            if len(value) > len(previous):
+                delta.setdefault("extend", {})[key] = value[len(previous):]
+        elif previous != value:
+            delta.setdefault("set", {})[key] = value
+    
+    removed = [key for key in old if key not in new]
+    if removed:
+        delta["delete"] = removed
+    return delta
+
+
+def apply_state_delta(state: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    """Aplica um delta de compute_state_delta, retornando um novo estado."""
+    result = dict(state)
+    for key in delta.get("delete", ()):
+        result.pop(key, None)
+    for key, value in delta.get("set", {}).items():
+        result[key] = value
+    for key, items in delta.get("extend", {}).items():
+        result[key] = list(result[key]) + list(items)
+    for key, nested in delta.get("nested", {}).items():
+        result[key] = apply_state_delta(result[key], nested)
+    return result
+
+
+def _restrict_delta(delta: Dict[str, Any], keys: Optional[Sequence[str]]) -> Dict[str, Any]:
+    """Delta limitado às chaves de primeiro nível pedidas."""
+    if keys is None:
+        return delta
+    restricted: Dict[str, Any] = {}
+    for op, entries in delta.items():
+        if op == "delete":
+            restricted[op] = [key for key in entries if key in keys]
+        else:
+            restricted[op] = {key: value for key, value in entries.items() if key in keys}
+    return restricted
+
+
+def _snapshot_containers(value: Any) -> Any:
+    """
+    Copia dicionários e listas do estado, compartilhando os demais valores.
+    
+    Protege o estado guardado para o próximo delta contra mutações in-place
+    nos contêineres (ex.: messages.append); os itens são tratados como
+    imutáveis, como nos reducers do LangGraph.
+    """
+    if isinstance(value, dict):
+        return {key: _snapshot_containers(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_snapshot_containers(item) for item in value]
+    return value
+
+
+# ==================== ESCRITA EM SEGUNDO PLANO ====================
+
+@dataclass
+class PendingWrite:
+    """Operação de escrita enfileirada."""
+    operation: str  # "checkpoint", "graph_checkpoint" ou "graph_writes"
+    args: Future  # argumentos de _write_<operation>, prontos após a compressão
+    done: Future  # concluído com o commit do lote (ou com o erro)
+    on_done: Optional[Callable[[Optional[Exception]], None]] = None
+
+
+class WriteBehindQueue:
+    """
+    Fila de escrita dos checkpoints (write-behind).
+    
+    Quem grava só serializa o estado e enfileira; a compressão roda em um
+    pool de threads (zstd e gzip liberam o GIL) e uma thread escritora
+    grava as operações disponíveis em lotes, uma transação por lote. A fila
+    é limitada: cheia, submit bloqueia até write_queue_timeout (backpressure),
+    sem segurar o lock da fila enquanto espera. flush() aguarda as operações
+    pendentes no momento da chamada, e close() só enfileira o fim depois que
+    os submits já aceitos terminam de enfileirar.
+    """
+    
+    _STOP = object()
+    
+    def __init__(self, storage: SQLiteCheckpointStorage, config: CheckpointConfig):
+        self.storage = storage
+        self.batch_size = max(1, config.write_batch_size)
+        self.batch_delay = config.write_batch_delay
+        self.enqueue_timeout = config.write_queue_timeout
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, config.write_queue_size))
+        self._compressor = ThreadPoolExecutor(
+            max_workers=max(1, config.compression_workers), thread_name_prefix="checkpoint-compress"
+        )
+        self._lock = threading.Lock()
+        self._enqueued = threading.Condition(self._lock)
+        self._pending: set = set()  # Futures de operações ainda não gravadas
+        self._enqueuing = 0  # submits aceitos aguardando vaga na fila
+        self._closed = False
+        self.batches = 0
+        self.operations = 0
+        self._writer = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self._writer.start()
+    
+    def submit(
+        self,
+        operation: str,
+        args: Union[Tuple, Callable[[], Tuple]],
+        on_done: Optional[Callable[[Optional[Exception]], None]] = None
+    ) -> Future:
+        """
+        Enfileira uma operação. args são os argumentos de _write_<operation>
+        ou uma função que os produz, executada no pool de compressão.
+        Retorna um Future concluído quando o lote da operação é gravado.
+        """
+        if callable(args):
+            prepared = self._compressor.submit(args)
         else:
-            raise ValueError(f"Tipo de compressão não suportado: {compression_type}")
+            prepared = Future()
+            prepared.set_result(args)
+        
+        item = PendingWrite(operation=operation, args=prepared, done=Future(), on_done=on_done)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Fila de escrita de checkpoints encerrada")
+            self._enqueuing += 1
+            self._pending.add(item.done)
+        item.done.add_done_callback(self._discard_pending)
+        
+        # A espera por vaga fica fora do lock: outros submits, flush e close seguem
+        try:
+            self._queue.put(item, timeout=self.enqueue_timeout)
+        except queue.Full:
+            # Conclui o Future para que flush() não espere uma operação descartada
+            error = RuntimeError(f"Fila de escrita de checkpoints cheia por {self.enqueue_timeout}s")
+            item.done.set_exception(error)
+            raise error from None
+        finally:
+            with self._lock:
+                self._enqueuing -= 1
+                if not self._enqueuing:
+                    self._enqueued.notify_all()
+        return item.done
+    
+    def _discard_pending(self, done: Future):
+        with self._lock:
+            self._pending.discard(done)
+    
+    @property
+    def pending(self) -> int:
+        """Operações ainda não gravadas."""
+        return self._queue.qsize()
+    
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Aguarda a gravação de tudo o que foi enfileirado até agora."""
+        with self._lock:
+            pending = list(self._pending)
+        if not pending:
+            return True
+        return not wait_futures(pending, timeout).not_done
+    
+    def close(self, timeout: Optional[float] = None):
+        """Recusa novas operações, grava as pendentes e encerra as threads."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            while self._enqueuing:
+                self._enqueued.wait()
+        self._queue.put(self._STOP)
+        self._writer.join(timeout)
+        self._compressor.shutdown(wait=True)
+    
+    def _run(self):
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            if batch[0] is self._STOP:
+                break
+            # Agrupa o que já está na fila (e o que chegar em batch_delay)
+            deadline = time.monotonic() + self.batch_delay
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic())) \
+                        if self.batch_delay > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+    
+    def _commit(self, batch: List[PendingWrite]):
+        """Grava um lote em uma transação e conclui os Futures na ordem."""
+        errors: List[Optional[Exception]] = [None] * len(batch)
+        operations, positions = [], []
+        for position, item in enumerate(batch):
+            try:
+                operations.append((item.operation, item.args.result()))
+                positions.append(position)
+            except Exception as e:
+                errors[position] = e
+        
+        try:
+            for position, error in zip(positions, self.storage.write_batch(operations)):
+                errors[position] = error
+        except Exception as e:
+            logger.error(f"Erro ao gravar lote de {len(operations)} checkpoints: {e}")
+            for position in positions:
+                errors[position] = e
+        self.batches += 1
+        self.operations += len(batch)
+        
+        for item, error in zip(batch, errors):
+            if item.on_done is not None:
+                try:
+                    item.on_done(error)
+                except Exception as e:
+                    logger.error(f"Erro no callback de escrita de checkpoint: {e}")
+            elif error is not None:
+                logger.error(f"Erro ao gravar {item.operation}: {error}")
+            if error is None:
+                item.done.set_result(None)
+            else:
+                item.done.set_exception(error)
 
 
 # ==================== CHECKPOINT SAVER AVANÇADO ====================
@@ -338,38 +2151,114 @@ class AdvancedCheckpointSaver(BaseCheckpointSaver):
     Checkpoint saver avançado com recursos empresariais.
     """
     
-    def __init__(self, config: CheckpointConfig = None):
+    def __init__(
+        self,
+        config: CheckpointConfig = None,
+        storage: SQLiteCheckpointStorage = None,
+        serde: Optional[SerializerProtocol] = None
+    ):
+        super().__init__(serde=serde)
         self.config = config or CheckpointConfig()
-        self.storage = self._init_storage()
-        self.compression_manager = CompressionManager()
-        self._auto_checkpoint_task = None
+        self.storage = storage or self._init_storage()
+        self.state_serializer = STATE_SERIALIZERS[self.config.serialization_format]
+        # pickle só é lido com opt-in explícito (ou se o próprio formato for pickle)
+        self._allow_pickle = (
+            self.config.allow_legacy_pickle or self.config.serialization_format == SerializationFormat.PICKLE
+        )
+        self.compression_manager = CompressionManager(
+            level=self.config.compression_level,
+            dictionary_loader=getattr(self.storage, "load_compression_dictionary", None),
+            allow_pickle=self._allow_pickle
+        )
+        self._load_compression_dictionary()
+        # session_id -> (checkpoint_id, estado, metadados) do último checkpoint
+        self._delta_heads: "OrderedDict[str, Tuple[str, Dict[str, Any], CheckpointMetadata]]" = OrderedDict()
+        self._delta_lock = threading.Lock()
+        self._retention_thread: Optional[threading.Thread] = None
+        self._retention_stop = threading.Event()
+        # Fila de escrita (write-behind) fora do modo SYNC
+        self._write_queue: Optional[WriteBehindQueue] = None
+        if self.config.durability_mode != DurabilityMode.SYNC and hasattr(self.storage, "write_batch"):
+            self._write_queue = WriteBehindQueue(self.storage, self.config)
+        # Agendador de checkpoints automáticos ativo (marca as threads a cada put)
+        self.auto_checkpoints: Optional["AutoCheckpointScheduler"] = None
         
-        # Iniciar auto-checkpointing se habilitado
-        if self.config.auto_checkpoint_interval > 0:
-            self._start_auto_checkpoint()
+        if self.config.retention_worker_interval > 0:
+            self.start_retention_worker()
     
     def _init_storage(self):
         """Inicializa o backend de armazenamento."""
         if self.config.storage_backend == StorageBackend.SQLITE:
             return SQLiteCheckpointStorage()
+        elif self.config.storage_backend == StorageBackend.FILE:
+            return FileCheckpointStorage()
         elif self.config.storage_backend == StorageBackend.MEMORY:
             return MemorySaver()
         else:
             raise ValueError(f"Backend não suportado: {self.config.storage_backend}")
     
-    def _start_auto_checkpoint(self):
-        """Inicia checkpointing automático."""
-        async def auto_checkpoint_loop():
-            while True:
-                await asyncio.sleep(self.config.auto_checkpoint_interval)
-                await self._perform_auto_checkpoint()
+    def _compress_blob(self, data: bytes) -> Tuple[bytes, CompressionType]:
+        """
+        Comprime um blob se a compressão estiver habilitada e valer a pena.
+        
+        Com dicionário treinado ativo, estados pequenos também são
+        comprimidos (dictionary_compression_threshold); sem dicionário,
+        ZSTD_DICT recai em zstd simples.
+        """
+        compression_type = self.config.compression_type
+        threshold = self.config.enable_compression_threshold
+        if compression_type == CompressionType.ZSTD_DICT:
+            if self.compression_manager.active_dictionary_id is None:
+                compression_type = CompressionType.ZSTD
+            else:
+                threshold = self.config.dictionary_compression_threshold
         
-        self._auto_checkpoint_task = asyncio.create_task(auto_checkpoint_loop())
+        if not self.config.compression_enabled or len(data) < threshold:
+            return data, CompressionType.NONE
+        return self.compression_manager.compress(data, compression_type), compression_type
+    
+    def _load_compression_dictionary(self):
+        """Ativa a versão mais recente do dicionário gravada no storage."""
+        if self.config.compression_type != CompressionType.ZSTD_DICT:
+            return
+        latest = getattr(self.storage, "latest_compression_dictionary", None)
+        data = latest() if latest else None
+        if data is not None:
+            self.compression_manager.use_dictionary(data)
     
-    async def _perform_auto_checkpoint(self):
-        """Executa checkpoint automático."""
-        # Implementar lógica de checkpoint automático baseado em sessões ativas
-        logger.info("Executando checkpoint automático")
+    def train_compression_dictionary(
+        self,
+        sample_size: int = ZSTD_DICT_SAMPLE_SIZE,
+        dict_size: int = ZSTD_DICT_SIZE
+    ) -> Optional[int]:
+        """
+        Treina um dicionário zstd com uma amostra dos checkpoints gravados.
+        
+        O dicionário é gravado como nova versão no storage e passa a ser
+        usado pelo modo ZSTD_DICT; checkpoints antigos continuam legíveis,
+        pois cada frame referencia o dicionário com que foi comprimido.
+        Retorna o ID do dicionário, ou None se não houver amostras suficientes.
+        """
+        if not ZSTD_AVAILABLE:
+            raise ValueError("Compressão zstd requer o pacote zstandard")
+        
+        samples = [
+            self.compression_manager.decompress(data, CompressionType(compression))
+            for data, compression in self.storage.sample_payloads(sample_size)
+        ]
+        try:
+            dictionary = zstandard.train_dictionary(dict_size, samples)
+        except zstandard.ZstdError as e:
+            logger.warning(f"Amostras insuficientes para treinar dicionário ({len(samples)}): {e}")
+            return None
+        
+        data = dictionary.as_bytes()
+        version = self.storage.save_compression_dictionary(
+            dictionary.dict_id(), data, len(samples), sum(len(sample) for sample in samples)
+        )
+        dict_id = self.compression_manager.use_dictionary(data)
+        logger.info(f"Dicionário de compressão {dict_id} (versão {version}) treinado com {len(samples)} amostras")
+        return dict_id
     
     def save_checkpoint(
         self,
@@ -384,104 +2273,387 @@ class AdvancedCheckpointSaver(BaseCheckpointSaver):
     ) -> str:
         """
         Salva um checkpoint com metadados avançados.
+        
+        Com enable_incremental, grava apenas o delta em relação ao checkpoint
+        pai (o informado ou o último da sessão). Um checkpoint completo é
+        gravado a cada full_checkpoint_interval deltas, na ausência de pai e
+        sempre para milestones, limitando a cadeia reconstruída no load.
         """
         # Gerar ID único
         checkpoint_id = self._generate_checkpoint_id(session_id, state)
         
-        # Serializar estado
-        state_bytes = pickle.dumps(state)
+        # Escolher entre delta e checkpoint completo
+        parent = self._resolve_delta_parent(session_id, parent_checkpoint_id)
+        delta_parent = None
+        if (self.config.enable_incremental and parent is not None
+                and checkpoint_type != CheckpointType.MILESTONE
+                and parent[2].chain_length + 1 < self.config.full_checkpoint_interval):
+            delta_parent = parent
+        if parent is not None and parent_checkpoint_id is None:
+            parent_checkpoint_id = parent[0]
         
-        # Aplicar compressão se necessário
-        if (self.config.compression_enabled and 
-            len(state_bytes) >= self.config.enable_compression_threshold):
-            compressed_data = self.compression_manager.compress(
-                state_bytes, self.config.compression_type
+        # Serializar estado (ou apenas o delta); checkpoints completos viram
+        # um manifesto que referencia chunks deduplicados
+        chunks = None
+        if delta_parent is not None:
+            state_bytes = encode_state_payload(
+                compute_state_delta(delta_parent[1], state), self.state_serializer
             )
-            compression_type = self.config.compression_type
+        elif self.config.content_addressed:
+            manifest, chunks = self._split_into_chunks(state)
+            state_bytes = encode_state_payload(manifest, self.state_serializer)
         else:
-            compressed_data = state_bytes
-            compression_type = CompressionType.NONE
+            state_bytes = encode_state_payload(state, self.state_serializer, lazy=True)
         
-        # Criar metadados
+        # Criar metadados (tamanho e compressão definidos ao comprimir)
         metadata = CheckpointMetadata(
             id=checkpoint_id,
             session_id=session_id,
             checkpoint_type=checkpoint_type,
             created_at=datetime.now(),
-            size_bytes=len(compressed_data),
-            compression=compression_type,
+            size_bytes=0,
+            compression=CompressionType.NONE,
             tags=tags or [],
             description=description,
             node_name=node_name,
             step_number=step_number,
-            parent_checkpoint_id=parent_checkpoint_id
+            parent_checkpoint_id=parent_checkpoint_id,
+            is_delta=delta_parent is not None,
+            base_checkpoint_id=(
+                (delta_parent[2].base_checkpoint_id or delta_parent[0])
+                if delta_parent is not None else None
+            ),
+            chain_length=delta_parent[2].chain_length + 1 if delta_parent is not None else 0,
+            chunked=chunks is not None
         )
         
-        # Salvar no storage
-        success = self.storage.save_checkpoint(
-            checkpoint_id, session_id, compressed_data, metadata
-        )
+        def prepare() -> Tuple:
+            # Aplicar compressão se necessário
+            compressed_data, metadata.compression = self._compress_blob(state_bytes)
+            if chunks is not None:
+                self._compress_chunks(chunks)
+            metadata.size_bytes = len(compressed_data) + (
+                sum(len(chunk) for chunk, _ in chunks.leaves.values()) if chunks else 0
+            )
+            return checkpoint_id, session_id, compressed_data, metadata, chunks
         
-        if success:
-            logger.info(f"Checkpoint salvo: {checkpoint_id} para sessão {session_id}")
-            
-            # Cleanup se necessário
-            self._cleanup_old_checkpoints(session_id)
-            
+        if self._write_queue is None:
+            # Salvar no storage
+            if not self.storage.save_checkpoint(*prepare()):
+                # A cabeça em cache pode não existir mais; o próximo save
+                # volta a resolver o pai pelo armazenamento
+                self._forget_delta_head(session_id)
+                raise RuntimeError(f"Falha ao salvar checkpoint: {checkpoint_id}")
+            self._remember_delta_head(session_id, checkpoint_id, state, metadata)
+            self._checkpoint_written(session_id, checkpoint_id, None)
             return checkpoint_id
-        else:
-            raise RuntimeError(f"Falha ao salvar checkpoint: {checkpoint_id}")
+        
+        # Write-behind: o próximo delta já parte deste checkpoint; se a
+        # gravação falhar, _checkpoint_written descarta a referência
+        self._remember_delta_head(session_id, checkpoint_id, state, metadata)
+        try:
+            done = self._write_queue.submit(
+                "checkpoint", prepare,
+                on_done=lambda error: self._checkpoint_written(session_id, checkpoint_id, error)
+            )
+        except RuntimeError:
+            self._forget_delta_head(session_id, checkpoint_id)
+            raise
+        if self.config.durability_mode == DurabilityMode.BATCHED:
+            error = done.exception()
+            if error is not None:
+                raise RuntimeError(f"Falha ao salvar checkpoint: {checkpoint_id}") from error
+        return checkpoint_id
+    
+    def _checkpoint_written(self, session_id: str, checkpoint_id: str, error: Optional[Exception]):
+        """Conclusão da gravação de um checkpoint (na hora ou pela fila)."""
+        if error is not None:
+            logger.error(f"Falha ao salvar checkpoint {checkpoint_id} da sessão {session_id}: {error}")
+            self._forget_delta_head(session_id, checkpoint_id)
+            return
+        
+        logger.info(f"Checkpoint salvo: {checkpoint_id} para sessão {session_id}")
+        
+        # Cleanup se necessário (ou na thread de retenção)
+        if self.config.retention_worker_interval <= 0:
+            self._cleanup_old_checkpoints(session_id)
+    
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Aguarda a gravação das escritas enfileiradas (no-op no modo SYNC)."""
+        if self._write_queue is None:
+            return True
+        return self._write_queue.flush(timeout)
+    
+    def shutdown(self, timeout: Optional[float] = None):
+        """
+        Grava as escritas pendentes e encerra as threads de escrita e de
+        retenção; chamado no encerramento do processo.
+        """
+        if self._write_queue is not None:
+            self._write_queue.close(timeout)
+        self.stop_retention_worker()
     
-    def load_checkpoint(self, checkpoint_id: str) -> Optional[Dict[str, Any]]:
+    def load_checkpoint(
+        self,
+        checkpoint_id: str,
+        keys: Optional[Sequence[str]] = None
+    ) -> Optional[Dict[str, Any]]:
         """
         Carrega um checkpoint específico.
+        
+        Checkpoints incrementais são reconstruídos a partir da base, aplicando
+        em ordem os deltas da cadeia (no máximo full_checkpoint_interval).
+        Com keys, apenas essas chaves do estado são lidas e decodificadas.
         """
-        result = self.storage.load_checkpoint(checkpoint_id)
+        self.flush()
+        loaded = self._load_with_metadata(checkpoint_id, keys)
         
-        if result:
-            data, metadata = result
-            
-            # Descomprimir se necessário
-            if metadata.compression != CompressionType.NONE:
-                decompressed_data = self.compression_manager.decompress(
-                    data, metadata.compression
-                )
-            else:
-                decompressed_data = data
-            
-            # Deserializar estado
-            state = pickle.loads(decompressed_data)
-            
+        if loaded:
             logger.info(f"Checkpoint carregado: {checkpoint_id}")
-            return state
+            return loaded[0]
         
         return None
     
+    def _decode_payload(
+        self,
+        data: bytes,
+        metadata: CheckpointMetadata,
+        keys: Optional[Sequence[str]] = None
+    ) -> Any:
+        """Descomprime e desserializa o conteúdo gravado de um checkpoint."""
+        if metadata.compression != CompressionType.NONE:
+            data = self.compression_manager.decompress(data, metadata.compression)
+        if metadata.chunked:
+            return self._assemble_chunks(self._decode_state(data), keys)
+        if metadata.is_delta:
+            return _restrict_delta(self._decode_state(data), keys)
+        return self._decode_state(data, keys)
+    
+    def _decode_state(self, data: bytes, keys: Optional[Sequence[str]] = None) -> Any:
+        return decode_state_payload(data, keys, allow_pickle=self._allow_pickle)
+    
+    def _split_into_chunks(self, state: Dict[str, Any]) -> Tuple[Dict[str, Any], ChunkSet]:
+        """
+        Divide o estado em chunks endereçados por conteúdo.
+        
+        Cada item de listas e dicionários de primeiro nível (mensagens,
+        tool_logs, registros) vira um chunk, agrupado com os vizinhos em
+        grupos de CHUNK_GROUP_SIZE; demais valores viram um chunk cada. Como
+        os grupos têm fronteiras fixas, acrescentar mensagens só cria o
+        grupo final, e o manifesto guarda poucos hashes por chave.
+        """
+        chunks = ChunkSet(leaves={}, groups={}, refs=[])
+        
+        def add_leaf(value: Any) -> str:
+            raw = encode_state_payload(value, self.state_serializer)
+            chunk_hash = hashlib.blake2b(raw, digest_size=16).hexdigest()
+            if chunk_hash not in chunks.leaves:
+                # Comprimido depois, em _compress_chunks
+                chunks.leaves[chunk_hash] = (raw, CompressionType.NONE.value)
+            return chunk_hash
+        
+        def add_groups(items: List[Any]) -> List[str]:
+            group_hashes = []
+            for start in range(0, len(items), CHUNK_GROUP_SIZE):
+                children = [add_leaf(item) for item in items[start:start + CHUNK_GROUP_SIZE]]
+                group_hash = hashlib.blake2b(
+                    bytes.fromhex("".join(children)), digest_size=16
+                ).hexdigest()
+                chunks.groups[group_hash] = children
+                group_hashes.append(group_hash)
+            return group_hashes
+        
+        manifest: Dict[str, Any] = {}
+        for key, value in state.items():
+            if isinstance(value, list):
+                manifest[key] = ("list", add_groups(value))
+            elif isinstance(value, dict):
+                manifest[key] = ("dict", list(value.keys()), add_groups(list(value.values())))
+            else:
+                manifest[key] = ("value", add_leaf(value))
+        
+        for entry in manifest.values():
+            if entry[0] == "value":
+                chunks.refs.append(entry[1])
+            else:
+                chunks.refs.extend(entry[-1])
+        return manifest, chunks
+    
+    def _compress_chunks(self, chunks: ChunkSet):
+        """Comprime os itens de _split_into_chunks (no pool de compressão, com write-behind)."""
+        for chunk_hash, (raw, _) in chunks.leaves.items():
+            chunk, compression = self._compress_blob(raw)
+            chunks.leaves[chunk_hash] = (chunk, compression.value)
+    
+    def _assemble_chunks(
+        self,
+        manifest: Dict[str, Any],
+        keys: Optional[Sequence[str]] = None
+    ) -> Dict[str, Any]:
+        """Reconstrói o estado (ou as chaves pedidas) a partir do manifesto e dos chunks."""
+        if keys is not None:
+            manifest = {key: entry for key, entry in manifest.items() if key in keys}
+        
+        top_level = set()
+        for entry in manifest.values():
+            if entry[0] == "value":
+                top_level.add(entry[1])
+            else:
+                top_level.update(entry[-1])
+        stored = self.storage.load_chunks(list(top_level))
+        
+        group_items = {
+            chunk_hash: [data[i:i + 16].hex() for i in range(0, len(data), 16)]
+            for chunk_hash, (data, compression) in stored.items()
+            if compression == "group"
+        }
+        leaf_hashes = {child for children in group_items.values() for child in children}
+        stored.update(self.storage.load_chunks(list(leaf_hashes.difference(stored))))
+        
+        missing = top_level.union(leaf_hashes).difference(stored)
+        if missing:
+            raise RuntimeError(f"Chunks ausentes no armazenamento: {len(missing)}")
+        
+        raw = {}
+        for chunk_hash, (chunk, compression) in stored.items():
+            if compression == "group":
+                continue
+            if compression != CompressionType.NONE.value:
+                chunk = self.compression_manager.decompress(chunk, CompressionType(compression))
+            raw[chunk_hash] = chunk
+        
+        def expand(group_hashes: List[str]) -> List[Any]:
+            # Um objeto por referência: itens iguais não passam a ser o mesmo objeto
+            return [
+                self._decode_state(raw[child])
+                for group_hash in group_hashes
+                for child in group_items[group_hash]
+            ]
+        
+        state = {}
+        for key, entry in manifest.items():
+            if entry[0] == "list":
+                state[key] = expand(entry[1])
+            elif entry[0] == "dict":
+                state[key] = dict(zip(entry[1], expand(entry[2])))
+            else:
+                state[key] = self._decode_state(raw[entry[1]])
+        return state
+    
+    def _load_with_metadata(
+        self,
+        checkpoint_id: str,
+        keys: Optional[Sequence[str]] = None
+    ) -> Optional[Tuple[Dict[str, Any], CheckpointMetadata]]:
+        """Reconstrói o estado de um checkpoint, percorrendo a cadeia de deltas."""
+        deltas = []
+        current_id = checkpoint_id
+        head_metadata = None
+        
+        while True:
+            result = self.storage.load_checkpoint(current_id)
+            if not result:
+                if deltas:
+                    logger.error(f"Cadeia de deltas quebrada em {current_id} ({checkpoint_id})")
+                return None
+            
+            data, metadata = result
+            head_metadata = head_metadata or metadata
+            payload = self._decode_payload(data, metadata, keys)
+            if not metadata.is_delta:
+                state = payload
+                break
+            deltas.append(payload)
+            current_id = metadata.parent_checkpoint_id
+        
+        for delta in reversed(deltas):
+            state = apply_state_delta(state, delta)
+        return state, head_metadata
+    
+    def _resolve_delta_parent(
+        self,
+        session_id: str,
+        parent_checkpoint_id: Optional[str]
+    ) -> Optional[Tuple[str, Dict[str, Any], CheckpointMetadata]]:
+        """
+        Checkpoint pai (id, estado, metadados) contra o qual calcular o delta.
+        
+        A cabeça em cache é descartada se o checkpoint foi removido depois de
+        gravado (delete, retenção); o pai passa a ser o último checkpoint
+        existente da sessão ou, sem nenhum, o save grava um completo. Com
+        fila de escrita a cabeça pode ainda estar pendente e não é conferida.
+        """
+        with self._delta_lock:
+            head = self._delta_heads.get(session_id)
+            if head is not None and parent_checkpoint_id in (None, head[0]):
+                self._delta_heads.move_to_end(session_id)
+            else:
+                head = None
+        if head is not None:
+            if self._write_queue is not None or self.storage.checkpoint_exists(head[0]):
+                return head
+            self._forget_delta_head(session_id, head[0])
+        
+        if not self.config.enable_incremental:
+            return None
+        
+        if parent_checkpoint_id is None:
+            # Continuar a cadeia do último checkpoint da sessão (ex.: após reinício)
+            self.flush()
+            latest = self.storage.list_checkpoints(session_id=session_id, limit=1)
+            if not latest:
+                return None
+            parent_checkpoint_id = latest[0].id
+        
+        loaded = self._load_with_metadata(parent_checkpoint_id)
+        if loaded is None:
+            return None
+        return parent_checkpoint_id, loaded[0], loaded[1]
+    
+    def _remember_delta_head(
+        self,
+        session_id: str,
+        checkpoint_id: str,
+        state: Dict[str, Any],
+        metadata: CheckpointMetadata
+    ):
+        """Guarda o último estado da sessão para o próximo delta."""
+        if not self.config.enable_incremental:
+            return
+        with self._delta_lock:
+            self._delta_heads[session_id] = (checkpoint_id, _snapshot_containers(state), metadata)
+            self._delta_heads.move_to_end(session_id)
+            while len(self._delta_heads) > DELTA_HEAD_CACHE_SIZE:
+                self._delta_heads.popitem(last=False)
+    
+    def _forget_delta_head(self, session_id: str, checkpoint_id: Optional[str] = None):
+        """Descarta o último estado da sessão (só se for o checkpoint indicado, quando informado)."""
+        with self._delta_lock:
+            head = self._delta_heads.get(session_id)
+            if head is not None and checkpoint_id in (None, head[0]):
+                del self._delta_heads[session_id]
+    
     def list_checkpoints(
         self,
         session_id: Optional[str] = None,
         checkpoint_type: Optional[CheckpointType] = None,
         tags: Optional[List[str]] = None,
-        limit: int = 100
+        limit: int = 100,
+        match_all_tags: bool = False
     ) -> List[CheckpointMetadata]:
         """
         Lista checkpoints com filtros avançados.
+        
+        O filtro de tags é resolvido no armazenamento, antes do limite.
         """
-        checkpoints = self.storage.list_checkpoints(
+        self.flush()
+        return self.storage.list_checkpoints(
             session_id=session_id,
             checkpoint_type=checkpoint_type,
-            limit=limit
+            limit=limit,
+            tags=tags,
+            match_all_tags=match_all_tags
         )
-        
-        # Filtrar por tags se especificado
-        if tags:
-            filtered_checkpoints = []
-            for cp in checkpoints:
-                if any(tag in cp.tags for tag in tags):
-                    filtered_checkpoints.append(cp)
-            checkpoints = filtered_checkpoints
-        
-        return checkpoints
     
     def create_milestone_checkpoint(
         self,
@@ -533,65 +2705,542 @@ class AdvancedCheckpointSaver(BaseCheckpointSaver):
         if self.config.max_checkpoints_per_session <= 0:
             return
         
-        checkpoints = self.storage.list_checkpoints(
-            session_id=session_id,
-            limit=1000  # Carregar mais para cleanup
+        removed = self.storage.enforce_retention(session_id, self.config.max_checkpoints_per_session)
+        if removed:
+            logger.info(f"{removed} checkpoints removidos (limpeza) da sessão {session_id}")
+    
+    def start_retention_worker(self):
+        """
+        Inicia a thread de retenção: a cada retention_worker_interval
+        segundos aplica o limite por sessão (apenas às sessões acima dele,
+        pela contagem) e a retenção por idade, tirando a limpeza do save.
+        """
+        if self._retention_thread is not None and self._retention_thread.is_alive():
+            return
+        self._retention_stop.clear()
+        self._retention_thread = threading.Thread(
+            target=self._retention_loop, name="checkpoint-retention", daemon=True
         )
-        
-        if len(checkpoints) > self.config.max_checkpoints_per_session:
-            # Manter milestones e remover os mais antigos
-            milestones = [cp for cp in checkpoints if cp.checkpoint_type == CheckpointType.MILESTONE]
-            regular = [cp for cp in checkpoints if cp.checkpoint_type != CheckpointType.MILESTONE]
-            
-            # Ordenar por data (mais antigos primeiro)
-            regular.sort(key=lambda x: x.created_at)
-            
-            # Calcular quantos remover
-            keep_regular = self.config.max_checkpoints_per_session - len(milestones)
-            to_remove = regular[:-keep_regular] if keep_regular > 0 else regular
-            
-            # Remover checkpoints antigos
-            for cp in to_remove:
-                self.storage.delete_checkpoint(cp.id)
-                logger.info(f"Checkpoint removido (limpeza): {cp.id}")
+        self._retention_thread.start()
+    
+    def stop_retention_worker(self, timeout: float = 5.0):
+        """Sinaliza a thread de retenção para parar e aguarda seu término."""
+        self._retention_stop.set()
+        if self._retention_thread is not None:
+            self._retention_thread.join(timeout)
+            self._retention_thread = None
+    
+    def _retention_loop(self):
+        while not self._retention_stop.wait(self.config.retention_worker_interval):
+            try:
+                self.run_retention()
+            except Exception as e:
+                logger.error(f"Erro na thread de retenção: {e}")
+    
+    def run_retention(self) -> int:
+        """Aplica a retenção por sessão e por idade; retorna checkpoints removidos."""
+        removed = 0
+        if self.config.max_checkpoints_per_session > 0:
+            for session_id in self.storage.sessions_over_limit(self.config.max_checkpoints_per_session):
+                removed += self.storage.enforce_retention(
+                    session_id, self.config.max_checkpoints_per_session
+                )
+        if self.config.retention_days > 0:
+            removed += self.storage.cleanup_old_checkpoints(self.config.retention_days)
+        # Backend de arquivos: reaproveita o espaço dos checkpoints removidos
+        compact = getattr(self.storage, "compact", None)
+        if compact is not None:
+            compact()
+        return removed
     
     def get_checkpoint_statistics(self, session_id: Optional[str] = None) -> Dict[str, Any]:
         """Obtém estatísticas dos checkpoints."""
-        checkpoints = self.storage.list_checkpoints(session_id=session_id, limit=1000)
+        self.flush()
+        stats = self.storage.get_statistics(session_id)
         
-        if not checkpoints:
+        if not stats.get("total"):
             return {"total": 0}
         
-        total_size = sum(cp.size_bytes for cp in checkpoints)
-        by_type = {}
-        for cp in checkpoints:
-            type_name = cp.checkpoint_type.value
-            if type_name not in by_type:
-                by_type[type_name] = 0
-            by_type[type_name] += 1
-        
-        compression_stats = {}
-        for cp in checkpoints:
-            comp_name = cp.compression.value
-            if comp_name not in compression_stats:
-                compression_stats[comp_name] = {"count": 0, "total_size": 0}
-            compression_stats[comp_name]["count"] += 1
-            compression_stats[comp_name]["total_size"] += cp.size_bytes
-        
         return {
-            "total": len(checkpoints),
-            "total_size_bytes": total_size,
-            "total_size_mb": round(total_size / (1024 * 1024), 2),
-            "by_type": by_type,
-            "compression_stats": compression_stats,
-            "oldest": min(cp.created_at for cp in checkpoints).isoformat(),
-            "newest": max(cp.created_at for cp in checkpoints).isoformat()
+            "total": stats["total"],
+            "total_size_bytes": stats["total_size_bytes"],
+            "total_size_mb": round(stats["total_size_bytes"] / (1024 * 1024), 2),
+            "by_type": stats["by_type"],
+            "compression_stats": stats["compression_stats"],
+            "oldest": stats["oldest"].isoformat(),
+            "newest": stats["newest"].isoformat(),
+            "chunk_store": self.storage.get_chunk_statistics()
         }
     
     def cleanup_old_checkpoints(self, retention_days: int = None) -> int:
         """Remove checkpoints antigos globalmente."""
         days = retention_days or self.config.retention_days
         return self.storage.cleanup_old_checkpoints(days)
+    
+    # API assíncrona: serialização, compressão e I/O fora do event loop
+    
+    async def asave_checkpoint(self, session_id: str, state: Dict[str, Any], **kwargs) -> str:
+        """Versão assíncrona de save_checkpoint."""
+        return await get_database_executor().run(self.save_checkpoint, session_id, state, **kwargs)
+    
+    async def aload_checkpoint(
+        self,
+        checkpoint_id: str,
+        keys: Optional[Sequence[str]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Versão assíncrona de load_checkpoint."""
+        return await get_database_executor().run(self.load_checkpoint, checkpoint_id, keys)
+    
+    async def alist_checkpoints(self, **kwargs) -> List[CheckpointMetadata]:
+        """Versão assíncrona de list_checkpoints."""
+        return await get_database_executor().run(self.list_checkpoints, **kwargs)
+    
+    async def aget_checkpoint_statistics(self, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """Versão assíncrona de get_checkpoint_statistics."""
+        return await get_database_executor().run(self.get_checkpoint_statistics, session_id)
+
+    # Interface BaseCheckpointSaver: checkpointer dos grafos LangGraph.
+    # Nada fica em memória no processo; cada passo do grafo é serializado
+    # pelo serde, comprimido e gravado no SQLite, e cada thread guarda no
+    # máximo max_checkpoints_per_session checkpoints.
+    
+    def _graph_config(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> RunnableConfig:
+        return {"configurable": {
+            "thread_id": thread_id,
+            "checkpoint_ns": checkpoint_ns,
+            "checkpoint_id": checkpoint_id,
+        }}
+    
+    def for_graph(self, graph_name: str) -> "GraphCheckpointSaver":
+        """Checkpointer de um grafo, com os threads isolados dos demais grafos."""
+        return GraphCheckpointSaver(self, graph_name)
+    
+    def _graph_checkpoint_tuple(self, row: sqlite3.Row) -> CheckpointTuple:
+        """Reconstrói o CheckpointTuple de uma linha de graph_checkpoints."""
+        data = self.compression_manager.decompress(
+            self.storage.graph_checkpoint_data(row), CompressionType(row['compression'])
+        )
+        writes = self.storage.get_graph_writes(
+            row['thread_id'], row['checkpoint_ns'], row['checkpoint_id']
+        )
+        return CheckpointTuple(
+            config=self._graph_config(row['thread_id'], row['checkpoint_ns'], row['checkpoint_id']),
+            checkpoint=self.serde.loads_typed((row['type'], data)),
+            metadata=json.loads(row['metadata']),
+            parent_config=(
+                self._graph_config(row['thread_id'], row['checkpoint_ns'], row['parent_checkpoint_id'])
+                if row['parent_checkpoint_id'] else None
+            ),
+            pending_writes=[
+                (write['task_id'], write['channel'],
+                 self.serde.loads_typed((write['type'], write['value'])))
+                for write in writes
+            ],
+        )
+    
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """Checkpoint pedido em config, ou o mais recente do thread."""
+        self.flush()
+        configurable = config["configurable"]
+        row = self.storage.get_graph_checkpoint(
+            configurable["thread_id"],
+            configurable.get("checkpoint_ns", ""),
+            get_checkpoint_id(config)
+        )
+        return self._graph_checkpoint_tuple(row) if row else None
+    
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        """Checkpoints do grafo, do mais recente para o mais antigo."""
+        self.flush()
+        configurable = (config or {}).get("configurable", {})
+        rows = self.storage.list_graph_checkpoints(
+            thread_id=configurable.get("thread_id"),
+            checkpoint_ns=configurable.get("checkpoint_ns"),
+            checkpoint_id=get_checkpoint_id(config) if config else None,
+            before=get_checkpoint_id(before) if before else None,
+            metadata_filter=filter,
+            limit=limit
+        )
+        for row in rows:
+            yield self._graph_checkpoint_tuple(row)
+    
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: GraphCheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        """Grava um checkpoint do grafo e devolve a config que aponta para ele."""
+        configurable = config["configurable"]
+        thread_id = configurable["thread_id"]
+        checkpoint_ns = configurable.get("checkpoint_ns", "")
+        type_, data = self.serde.dumps_typed(checkpoint)
+        graph_metadata = get_serializable_checkpoint_metadata(config, metadata)
+        
+        def prepare() -> Tuple:
+            compressed, compression = self._compress_blob(data)
+            return (
+                thread_id,
+                checkpoint_ns,
+                checkpoint["id"],
+                configurable.get("checkpoint_id"),
+                type_,
+                compressed,
+                compression.value,
+                graph_metadata,
+                self.config.max_checkpoints_per_session
+            )
+        
+        if self._write_queue is None:
+            self.storage.put_graph_checkpoint(*prepare())
+        else:
+            self._submit_graph_write("graph_checkpoint", prepare)
+        
+        # Passos do grafo principal marcam a thread para o checkpoint automático
+        scheduler = self.auto_checkpoints
+        if scheduler is not None and not checkpoint_ns and metadata.get("source") == "loop":
+            scheduler.mark_dirty(thread_id, _graph_state(checkpoint["channel_values"]))
+        return self._graph_config(thread_id, checkpoint_ns, checkpoint["id"])
+    
+    def _submit_graph_write(self, operation: str, args: Union[Tuple, Callable[[], Tuple]]):
+        """Enfileira uma escrita do grafo; no modo BATCHED aguarda o commit do lote."""
+        done = self._write_queue.submit(operation, args)
+        if self.config.durability_mode == DurabilityMode.BATCHED:
+            done.result()
+    
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        """Grava as escritas pendentes de uma tarefa do grafo."""
+        configurable = config["configurable"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, data = self.serde.dumps_typed(value)
+            rows.append((
+                configurable["thread_id"],
+                configurable.get("checkpoint_ns", ""),
+                configurable["checkpoint_id"],
+                task_id,
+                WRITES_IDX_MAP.get(channel, idx),
+                channel,
+                type_,
+                data,
+                task_path,
+            ))
+        replace = all(channel in WRITES_IDX_MAP for channel, _ in writes)
+        if self._write_queue is None:
+            self.storage.put_graph_writes(rows, replace=replace)
+        else:
+            self._submit_graph_write("graph_writes", (rows, replace))
+    
+    def delete_thread(self, thread_id: str) -> None:
+        """Remove todos os checkpoints e escritas de um thread do grafo."""
+        self.flush()
+        self.storage.delete_graph_thread(thread_id)
+    
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """Versão assíncrona de get_tuple."""
+        return await get_database_executor().run(self.get_tuple, config)
+    
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        """Versão assíncrona de list."""
+        checkpoints = await get_database_executor().run(
+            lambda: [*self.list(config, filter=filter, before=before, limit=limit)]
+        )
+        for checkpoint in checkpoints:
+            yield checkpoint
+    
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: GraphCheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        """Versão assíncrona de put."""
+        return await get_database_executor().run(
+            self.put, config, checkpoint, metadata, new_versions
+        )
+    
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        """Versão assíncrona de put_writes."""
+        await get_database_executor().run(self.put_writes, config, writes, task_id, task_path)
+    
+    async def adelete_thread(self, thread_id: str) -> None:
+        """Versão assíncrona de delete_thread."""
+        await get_database_executor().run(self.delete_thread, thread_id)
+
+
+class GraphCheckpointSaver(BaseCheckpointSaver):
+    """
+    Checkpointer de um grafo sobre o AdvancedCheckpointSaver compartilhado.
+    
+    Todos os grafos gravam nas mesmas tabelas, cuja chave não identifica o
+    grafo; este wrapper grava cada thread como "<grafo>:<thread_id>", de modo
+    que o mesmo thread_id do CopilotKit em dois agentes não carrega nem poda
+    os checkpoints do outro. As configs devolvidas voltam com o thread_id
+    original. O checkpoint automático também vê a sessão com o prefixo.
+    """
+    
+    def __init__(self, saver: AdvancedCheckpointSaver, graph_name: str):
+        super().__init__(serde=saver.serde)
+        self.saver = saver
+        self.graph_name = graph_name
+        self._prefix = f"{graph_name}:"
+    
+    def _scoped(self, config: Optional[RunnableConfig]) -> Optional[RunnableConfig]:
+        configurable = (config or {}).get("configurable", {})
+        if configurable.get("thread_id") is None:
+            return config
+        return {**config, "configurable": {
+            **configurable, "thread_id": f"{self._prefix}{configurable['thread_id']}"
+        }}
+    
+    def _unscoped(self, config: Optional[RunnableConfig]) -> Optional[RunnableConfig]:
+        if config is None:
+            return None
+        configurable = config["configurable"]
+        return {**config, "configurable": {
+            **configurable, "thread_id": configurable["thread_id"][len(self._prefix):]
+        }}
+    
+    def _owns(self, checkpoint: CheckpointTuple) -> bool:
+        return checkpoint.config["configurable"]["thread_id"].startswith(self._prefix)
+    
+    def _unscoped_tuple(self, checkpoint: Optional[CheckpointTuple]) -> Optional[CheckpointTuple]:
+        if checkpoint is None:
+            return None
+        return checkpoint._replace(
+            config=self._unscoped(checkpoint.config),
+            parent_config=self._unscoped(checkpoint.parent_config)
+        )
+    
+    def get_next_version(self, current: Optional[Any], channel: None) -> Any:
+        """Mesma numeração de versões do saver compartilhado."""
+        return self.saver.get_next_version(current, channel)
+    
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """Checkpoint pedido em config, ou o mais recente do thread no grafo."""
+        return self._unscoped_tuple(self.saver.get_tuple(self._scoped(config)))
+    
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        """Checkpoints do grafo, do mais recente para o mais antigo."""
+        scoped = self._scoped(config)
+        # Sem thread_id, a listagem é de todos os threads: filtrar os do grafo
+        filtered = scoped is config
+        checkpoints = self.saver.list(
+            scoped, filter=filter, before=self._scoped(before), limit=None if filtered else limit
+        )
+        if filtered:
+            checkpoints = (checkpoint for checkpoint in checkpoints if self._owns(checkpoint))
+            if limit is not None:
+                checkpoints = itertools.islice(checkpoints, limit)
+        for checkpoint in checkpoints:
+            yield self._unscoped_tuple(checkpoint)
+    
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: GraphCheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        """Grava um checkpoint do grafo e devolve a config com o thread_id original."""
+        return self._unscoped(self.saver.put(self._scoped(config), checkpoint, metadata, new_versions))
+    
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        """Grava as escritas pendentes de uma tarefa do grafo."""
+        self.saver.put_writes(self._scoped(config), writes, task_id, task_path)
+    
+    def delete_thread(self, thread_id: str) -> None:
+        """Remove os checkpoints e escritas do thread neste grafo."""
+        self.saver.delete_thread(f"{self._prefix}{thread_id}")
+    
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """Versão assíncrona de get_tuple."""
+        return await get_database_executor().run(self.get_tuple, config)
+    
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        """Versão assíncrona de list."""
+        checkpoints = await get_database_executor().run(
+            lambda: [*self.list(config, filter=filter, before=before, limit=limit)]
+        )
+        for checkpoint in checkpoints:
+            yield checkpoint
+    
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: GraphCheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        """Versão assíncrona de put."""
+        return await get_database_executor().run(
+            self.put, config, checkpoint, metadata, new_versions
+        )
+    
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        """Versão assíncrona de put_writes."""
+        await get_database_executor().run(self.put_writes, config, writes, task_id, task_path)
+    
+    async def adelete_thread(self, thread_id: str) -> None:
+        """Versão assíncrona de delete_thread."""
+        await get_database_executor().run(self.delete_thread, thread_id)
+
+
+# ==================== CHECKPOINT AUTOMÁTICO ====================
+
+def _graph_state(channel_values: Dict[str, Any]) -> Dict[str, Any]:
+    """Estado de um checkpoint do grafo, sem os canais internos (__start__, branch:...)."""
+    return {
+        key: value for key, value in channel_values.items()
+        if not key.startswith("__") and ":" not in key
+    }
+
+
+class AutoCheckpointScheduler:
+    """
+    Checkpoints automáticos das sessões ativas.
+    
+    Quem altera o estado de uma sessão chama mark_dirty; enquanto o
+    agendador roda, o saver faz isso a cada passo dos grafos que o usam
+    como checkpointer (sessão = thread_id). A cada interval segundos, cada
+    sessão marcada ganha um checkpoint AUTOMATIC com o último estado
+    recebido. Marcações repetidas entre dois ciclos são agrupadas em um
+    único checkpoint. O laço roda no event loop da aplicação: start() e
+    stop() são chamados no lifespan, e stop() grava as sessões ainda
+    pendentes.
+    """
+    
+    def __init__(self, saver: "AdvancedCheckpointSaver", interval: Optional[float] = None):
+        self.saver = saver
+        self.interval = saver.config.auto_checkpoint_interval if interval is None else interval
+        # session_id -> (estado, nó) mais recente desde o último ciclo
+        self._dirty: Dict[str, Tuple[Dict[str, Any], Optional[str]]] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.coalesced = 0
+    
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+    
+    def mark_dirty(self, session_id: str, state: Dict[str, Any], node_name: str = None):
+        """Registra o estado atual da sessão para o próximo ciclo."""
+        snapshot = _snapshot_containers(state)
+        with self._lock:
+            if session_id in self._dirty:
+                self.coalesced += 1
+            self._dirty[session_id] = (snapshot, node_name)
+    
+    @property
+    def dirty_sessions(self) -> int:
+        return len(self._dirty)
+    
+    async def start(self):
+        """Inicia o laço no event loop atual (no-op com interval <= 0)."""
+        if self.interval <= 0 or self.running:
+            return
+        self._task = asyncio.create_task(self._loop(), name="auto-checkpoint")
+        self.saver.auto_checkpoints = self
+    
+    async def stop(self, flush: bool = True):
+        """Encerra o laço e, com flush, grava as sessões pendentes."""
+        if self.saver.auto_checkpoints is self:
+            self.saver.auto_checkpoints = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if flush:
+            await self.run_once()
+    
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Erro no checkpoint automático: {e}")
+    
+    async def run_once(self) -> int:
+        """Grava um checkpoint por sessão marcada; retorna quantos foram gravados."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        
+        saved = 0
+        for session_id, (state, node_name) in dirty.items():
+            try:
+                await self.saver.asave_checkpoint(
+                    session_id=session_id,
+                    state=state,
+                    checkpoint_type=CheckpointType.AUTOMATIC,
+                    tags=["auto"],
+                    description="Checkpoint automático",
+                    node_name=node_name
+                )
+                saved += 1
+            except Exception as e:
+                logger.error(f"Erro no checkpoint automático da sessão {session_id}: {e}")
+        
+        if saved:
+            logger.info(f"Checkpoint automático: {saved} sessões gravadas")
+        return saved
 
 
 # ==================== DECORADORES UTILITÁRIOS ====================
@@ -599,12 +3248,18 @@ class AdvancedCheckpointSaver(BaseCheckpointSaver):
 def auto_checkpoint(
     checkpoint_type: CheckpointType = CheckpointType.AUTOMATIC,
     tags: List[str] = None,
-    description: str = None
+    description: str = None,
+    deferred: bool = False
 ):
     """
     Decorador para checkpointing automático de funções.
+    
+    Usa o saver global. Com deferred, o estado resultante só marca a sessão
+    no agendador (gravado no próximo ciclo, agrupando chamadas seguidas);
+    sem o agendador ativo, o checkpoint é gravado na hora.
     """
     def decorator(func):
+        @functools.wraps(func)
         async def wrapper(*args, **kwargs):
             # Assumir que o primeiro argumento é o estado
             if args and isinstance(args[0], dict):
@@ -613,17 +3268,20 @@ def auto_checkpoint(
                 
                 # Executar função
                 result = await func(*args, **kwargs)
+                final_state = result if isinstance(result, dict) else state
                 
                 # Criar checkpoint após execução
-                saver = AdvancedCheckpointSaver()
-                saver.save_checkpoint(
-                    session_id=session_id,
-                    state=result if isinstance(result, dict) else state,
-                    checkpoint_type=checkpoint_type,
-                    tags=tags or [func.__name__],
-                    description=description or f"Auto-checkpoint de {func.__name__}",
-                    node_name=func.__name__
-                )
+                if deferred and auto_checkpoint_scheduler.running:
+                    auto_checkpoint_scheduler.mark_dirty(session_id, final_state, func.__name__)
+                else:
+                    await advanced_checkpoint_saver.asave_checkpoint(
+                        session_id=session_id,
+                        state=final_state,
+                        checkpoint_type=checkpoint_type,
+                        tags=tags or [func.__name__],
+                        description=description or f"Auto-checkpoint de {func.__name__}",
+                        node_name=func.__name__
+                    )
                 
                 return result
             else:
@@ -642,8 +3300,14 @@ default_config = CheckpointConfig(
     max_checkpoints_per_session=50,
     compression_enabled=True,
     retention_days=7,
-    enable_incremental=True
+    enable_incremental=True,
+    durability_mode=DurabilityMode(os.getenv("CHECKPOINT_DURABILITY", DurabilityMode.SYNC.value)),
+    allow_legacy_pickle=os.getenv("CHECKPOINT_ALLOW_LEGACY_PICKLE", "").lower() in ("1", "true", "yes")
 )
 
 # Instância global
-advanced_checkpoint_saver = AdvancedCheckpointSaver(default_config)
\ No newline at end of file
+advanced_checkpoint_saver = AdvancedCheckpointSaver(default_config)
+atexit.register(advanced_checkpoint_saver.shutdown)
+
+# Agendador de checkpoints automáticos; iniciado no lifespan da aplicação
+auto_checkpoint_scheduler = AutoCheckpointScheduler(advanced_checkpoint_saver)
\ No newline at end of file
@@ -20,13 +20,14 @@ from langchain_core.runnables import RunnableConfig
 from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, START, END
 from langgraph.types import Command
-from langgraph.checkpoint.memory import MemorySaver
 from pydantic import BaseModel, Field
 
 from copilotkit import CopilotKitState
 from copilotkit.langgraph import copilotkit_emit_state
 from copilotkit.langchain import copilotkit_customize_config
 
+from checkpointing import advanced_checkpoint_saver
+
 load_dotenv()
 
 # ==================== CONFIGURAÇÃO DE LOGGING ====================
@@ -704,7 +705,7 @@ def create_handoff_graph() -> StateGraph:
     workflow.add_edge("finalize_handoffs", END)
     
     # Compilar com checkpoint
-    return workflow.compile(checkpointer=MemorySaver())
+    return workflow.compile(checkpointer=advanced_checkpoint_saver.for_graph("handoffs"))
 
 
 # Instanciar o grafo de handoffs
@@ -4,11 +4,12 @@ Sistema multi-agente robusto para o Vieira Pires Advogados.
 """
 
 import os
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
 load_dotenv()  
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 import uvicorn
 from copilotkit.integrations.fastapi import add_fastapi_endpoint
 from copilotkit import CopilotKitRemoteEndpoint, LangGraphAgent
@@ -20,11 +21,29 @@ from agente_tributario import tributario_agent_graph
 from agente_contratos import contratos_agent_graph
 from supervisor import supervisor_graph
 from handoffs import handoff_graph
+from checkpointing import advanced_checkpoint_saver, auto_checkpoint_scheduler
+from fault_tolerance import fault_manager
+from observability import get_observability_manager
+from metrics import CONTENT_TYPE, PrometheusMetrics
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Inicia o checkpoint automático e, no encerramento, grava o que estiver pendente."""
+    await auto_checkpoint_scheduler.start()
+    try:
+        yield
+    finally:
+        await auto_checkpoint_scheduler.stop()
+        advanced_checkpoint_saver.shutdown()
+        get_observability_manager().shutdown()
+
 
 app = FastAPI(
     title="Vieira Pires Advogados - Sistema Multi-Agente",
     description="Sistema jurídico avançado com agentes especializados",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 # Configurar endpoint remoto com agentes especializados
@@ -65,6 +84,14 @@ sdk = CopilotKitRemoteEndpoint(
 
 add_fastapi_endpoint(app, sdk, "/copilotkit")
 
+# Métricas para scrape (cache por intervalo de scrape)
+prometheus_metrics = PrometheusMetrics(
+    observability=get_observability_manager(),
+    fault_manager=fault_manager,
+    checkpoint_saver=advanced_checkpoint_saver,
+    cache_seconds=float(os.getenv("METRICS_CACHE_SECONDS", "15"))
+)
+
 
 @app.get("/healthz")
 def health():
@@ -79,6 +106,12 @@ def health():
     }
 
 
+@app.get("/metrics")
+def metrics():
+    """Métricas no formato Prometheus (rota síncrona: roda no threadpool)."""
+    return Response(content=prometheus_metrics.render(), media_type=CONTENT_TYPE)
+
+
 @app.get("/")
 def root():
     """Root endpoint."""
@@ -88,6 +121,7 @@ def root():
         "endpoints": {
             "copilotkit": "/copilotkit",
             "health": "/healthz",
+            "metrics": "/metrics",
             "docs": "/docs"
         },
         "agents": [
@@ -20,13 +20,14 @@ from langchain_core.runnables import RunnableConfig
 from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, START, END
 from langgraph.types import Command
-from langgraph.checkpoint.memory import MemorySaver
 from pydantic import BaseModel, Field
 
 from copilotkit import CopilotKitState
 from copilotkit.langgraph import copilotkit_emit_state
 from copilotkit.langchain import copilotkit_customize_config
 
+from checkpointing import advanced_checkpoint_saver
+
 load_dotenv()
 
 
@@ -188,11 +189,21 @@ async def execute_parallel_tasks(
     """
     
     try:
+        # Importação tardia: a instância global é criada na primeira importação
+        from observability import get_observability_manager
+        
+        observability = get_observability_manager()
         start_time = datetime.now()
         results = []
         
         # Simular execução paralela
         async def execute_single_task(task_data):
+            # gather() roda cada tarefa numa cópia do contexto atual: o span
+            # aberto aqui é filho do span do chamador e isolado dos irmãos
+            with observability.trace_node(f"map_{task_data['agent']}"):
+                return await run_single_task(task_data)
+        
+        async def run_single_task(task_data):
             task_id = task_data["id"]
             agent = task_data["agent"]
             description = task_data["description"]
@@ -653,7 +664,7 @@ def create_mapreduce_graph() -> StateGraph:
     workflow.add_edge("reduce_phase", "finalize_mapreduce")
     workflow.add_edge("finalize_mapreduce", END)
     
-    return workflow.compile(checkpointer=MemorySaver())
+    return workflow.compile(checkpointer=advanced_checkpoint_saver.for_graph("mapreduce"))
 
 
 mapreduce_graph = create_mapreduce_graph()
\ No newline at end of file
@@ -0,0 +1,192 @@
+"""
+Exposição de Métricas no Formato Prometheus
+Este módulo gera o texto do endpoint /metrics a partir da observabilidade,
+da tolerância a falhas e do checkpointing.
+"""
+
+import time
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+from observability import MetricType, ObservabilityManager, get_observability_manager
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Limites dos buckets de latência, em segundos
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+_LATENCY_BOUNDS_MS = tuple(bound * 1000 for bound in LATENCY_BUCKETS)
+_LATENCY_LE = tuple(f',le="{bound!r}"' for bound in LATENCY_BUCKETS) + (',le="+Inf"',)
+
+CIRCUIT_BREAKER_STATES = ("CLOSED", "OPEN", "HALF_OPEN")
+
+
+# ==================== FORMATAÇÃO ====================
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_pairs(labels: Dict[str, Any]) -> str:
+    return ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricFamily:
+    """Uma família de métricas (HELP/TYPE e amostras)."""
+    
+    def __init__(self, name: str, metric_type: str, help_text: str):
+        self.name = name
+        self.metric_type = metric_type
+        self.help_text = help_text
+        self.lines: List[str] = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    
+    def add(self, value: float, suffix: str = "", **labels: Any):
+        self.add_rendered(value, suffix, _label_pairs(labels))
+    
+    def add_rendered(self, value: float, suffix: str, label_pairs: str):
+        """Amostra com rótulos já formatados (reaproveitados entre buckets)."""
+        labels = f"{{{label_pairs}}}" if label_pairs else ""
+        self.lines.append(f"{self.name}{suffix}{labels} {_number(value)}")
+    
+    def render(self) -> str:
+        return "\n".join(self.lines)
+
+
+# ==================== COLETA ====================
+
+class PrometheusMetrics:
+    """
+    Renderiza as métricas no formato de exposição do Prometheus.
+    
+    O texto fica em cache por cache_seconds (o intervalo de scrape): scrapes
+    dentro do intervalo só devolvem a string pronta, e apenas um render roda
+    por vez — os demais scrapes recebem o texto anterior enquanto isso.
+    """
+    
+    def __init__(
+        self,
+        observability: Optional[ObservabilityManager] = None,
+        fault_manager: Any = None,
+        checkpoint_saver: Any = None,
+        cache_seconds: float = 15.0
+    ):
+        self.observability = observability
+        self.fault_manager = fault_manager
+        self.checkpoint_saver = checkpoint_saver
+        self.cache_seconds = cache_seconds
+        self._cached: Optional[str] = None
+        self._cached_at = 0.0
+        self._render_lock = threading.Lock()
+        self.renders = 0
+    
+    def render(self) -> str:
+        """Texto de /metrics (do cache, se ainda válido)."""
+        cached = self._cached
+        if cached is not None and time.monotonic() - self._cached_at < self.cache_seconds:
+            return cached
+        
+        # Só um render por vez; com um em andamento, serve o texto anterior
+        if not self._render_lock.acquire(blocking=cached is None):
+            return cached
+        try:
+            if self._cached is None or time.monotonic() - self._cached_at >= self.cache_seconds:
+                self._cached = self._render()
+                self._cached_at = time.monotonic()
+                self.renders += 1
+            return self._cached
+        finally:
+            self._render_lock.release()
+    
+    def _render(self) -> str:
+        families: List[MetricFamily] = []
+        for collect in (self._collect_observability, self._collect_fault_tolerance, self._collect_checkpoints):
+            try:
+                families.extend(collect())
+            except Exception as e:
+                # Uma fonte com erro não derruba o scrape inteiro
+                logger.warning(f"Erro ao coletar métricas em {collect.__name__}: {e}")
+        return "\n".join(family.render() for family in families) + "\n"
+    
+    def _collect_observability(self) -> Iterable[MetricFamily]:
+        manager = self.observability or get_observability_manager()
+        monitor = manager.performance_monitor
+        
+        latency = MetricFamily("agent_latency_seconds", "histogram", "Latência de nodos e operações dos agentes.")
+        for agent_name, node_name, name, histogram in monitor.get_cumulative_histograms(MetricType.LATENCY):
+            labels = _label_pairs({
+                "agent": agent_name,
+                "node": node_name or "",
+                "operation": name[:-len("_latency")] if name.endswith("_latency") else name
+            })
+            # Latências são registradas em ms; os buckets são em segundos
+            counts = histogram.cumulative_counts(_LATENCY_BOUNDS_MS) + [histogram.count]
+            for le, count in zip(_LATENCY_LE, counts):
+                latency.add_rendered(count, "_bucket", labels + le)
+            latency.add_rendered(histogram.total / 1000, "_sum", labels)
+            latency.add_rendered(histogram.count, "_count", labels)
+        
+        tokens = MetricFamily("agent_tokens_total", "counter", "Tokens de LLM consumidos.")
+        for agent_name, node_name, name, histogram in monitor.get_cumulative_histograms(MetricType.TOKEN_COUNT):
+            tokens.add(histogram.total, agent=agent_name, node=node_name or "", metric=name)
+        
+        counters = manager.get_counters()
+        tool_calls = MetricFamily("agent_tool_calls_total", "counter", "Chamadas de ferramentas por resultado.")
+        for (agent_name, tool_name, status), count in sorted(counters["tool_calls"].items()):
+            tool_calls.add(count, agent=agent_name, tool=tool_name, status=status)
+        
+        errors = MetricFamily("agent_errors_total", "counter", "Eventos de erro registrados nos traces.")
+        for (agent_name, node_name), count in sorted(counters["errors"].items(), key=str):
+            errors.add(count, agent=agent_name, node=node_name or "")
+        
+        families = [latency, tokens, tool_calls, errors]
+        if manager.exporter is not None:
+            stats = manager.exporter.get_stats()
+            exporter = MetricFamily(
+                "observability_export_events_total", "counter", "Eventos de trace por resultado da exportação."
+            )
+            for outcome in ("exported", "dropped", "failed"):
+                exporter.add(stats[outcome], outcome=outcome)
+            families.append(exporter)
+        return families
+    
+    def _collect_fault_tolerance(self) -> Iterable[MetricFamily]:
+        if self.fault_manager is None:
+            return []
+        health = self.fault_manager.get_system_health()
+        
+        state = MetricFamily("circuit_breaker_state", "gauge", "Estado do circuit breaker (1 no estado atual).")
+        failures = MetricFamily("circuit_breaker_failures", "gauge", "Falhas consecutivas do circuit breaker.")
+        for component, breaker in sorted(health["circuit_breakers"].items()):
+            for name in CIRCUIT_BREAKER_STATES:
+                state.add(int(breaker["state"] == name), component=component, state=name)
+            failures.add(breaker["failure_count"], component=component)
+        
+        incidents = MetricFamily("fault_incidents_recent", "gauge", "Incidentes na última hora por tipo de falha.")
+        for failure_type, count in sorted(health["failure_by_type"].items()):
+            incidents.add(count, failure_type=failure_type)
+        return [state, failures, incidents]
+    
+    def _collect_checkpoints(self) -> Iterable[MetricFamily]:
+        if self.checkpoint_saver is None:
+            return []
+        # Direto no storage: o saver faria flush da fila de escrita antes de ler
+        stats = self.checkpoint_saver.storage.get_statistics()
+        
+        count = MetricFamily("checkpoints", "gauge", "Checkpoints armazenados por tipo.")
+        for checkpoint_type, total in sorted(stats.get("by_type", {}).items()):
+            count.add(total, type=checkpoint_type)
+        
+        size = MetricFamily("checkpoint_size_bytes", "gauge", "Bytes armazenados de checkpoints por compressão.")
+        by_compression = MetricFamily("checkpoints_by_compression", "gauge", "Checkpoints por compressão.")
+        for compression, values in sorted(stats.get("compression_stats", {}).items()):
+            size.add(values["total_size"], compression=compression)
+            by_compression.add(values["count"], compression=compression)
+        return [count, size, by_compression]
@@ -5,19 +5,29 @@ Este módulo implementa observabilidade avançada para agentes LangGraph com int
 
 import os
 import json
+import atexit
+import gzip
 import time
+import hashlib
+import urllib.request
 import uuid
 import asyncio
 import traceback
+from abc import ABC, abstractmethod
 from typing import Any, Dict, List, Optional, Union, Callable
 from enum import Enum
 from datetime import datetime, timedelta
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field
 from contextlib import contextmanager, asynccontextmanager
 from functools import wraps
 import logging
 import threading
-from collections import defaultdict, deque
+import itertools
+import math
+from collections import OrderedDict, defaultdict, deque
+from pathlib import Path
+from contextvars import ContextVar
+from typing import NamedTuple
 
 from dotenv import load_dotenv
 from langchain_core.callbacks import BaseCallbackHandler
@@ -51,6 +61,10 @@ class TraceLevel(Enum):
     CRITICAL = "critical"
 
 
+_LEVEL_ORDER = {level: order for order, level in enumerate(TraceLevel)}
+_ERROR_LEVELS = frozenset({TraceLevel.ERROR, TraceLevel.CRITICAL})
+
+
 class EventType(Enum):
     AGENT_START = "agent_start"
     AGENT_END = "agent_end"
@@ -64,6 +78,11 @@ class EventType(Enum):
     STATE_UPDATE = "state_update"
 
 
+# Entrada e saída de um nodo/sessão: no OTLP, o par vira um único span
+_SPAN_START_TYPES = frozenset({EventType.AGENT_START, EventType.NODE_ENTER})
+_SPAN_END_TYPES = frozenset({EventType.AGENT_END, EventType.NODE_EXIT})
+
+
 class MetricType(Enum):
     LATENCY = "latency"
     TOKEN_COUNT = "token_count"
@@ -76,30 +95,104 @@ class MetricType(Enum):
 
 # ==================== MODELOS DE DADOS ====================
 
-@dataclass
+# IDs de evento: prefixo aleatório por processo + contador (uuid4 custa ~3us por chamada)
+_ID_PREFIX = uuid.uuid4().hex[:12]
+_id_counter = itertools.count(1)
+
+# Timestamps são monotonic_ns; a conversão para relógio de parede usa este offset
+_WALL_OFFSET_NS = time.time_ns() - time.monotonic_ns()
+
+
+def new_event_id() -> str:
+    """Gera um ID de evento/span único no processo."""
+    return f"{_ID_PREFIX}-{next(_id_counter):x}"
+
+
 class TraceEvent:
-    """Evento de trace."""
-    id: str
-    trace_id: str
-    parent_id: Optional[str]
-    event_type: EventType
-    timestamp: datetime
-    level: TraceLevel
-    agent_name: str
-    node_name: Optional[str]
-    message: str
-    data: Dict[str, Any]
-    duration_ms: Optional[float] = None
-    error: Optional[str] = None
-    stack_trace: Optional[str] = None
+    """
+    Evento de trace.
+    
+    Registro compacto (__slots__) com timestamp em monotonic_ns; `timestamp`
+    (datetime) e `message` (template % message_args) só são montados quando
+    lidos, normalmente na exportação.
+    """
+    
+    __slots__ = (
+        "id", "trace_id", "parent_id", "event_type", "timestamp_ns", "level",
+        "agent_name", "node_name", "_message", "message_args", "data",
+        "duration_ms", "error", "stack_trace"
+    )
+    
+    def __init__(
+        self,
+        id: str,
+        trace_id: Optional[str],
+        parent_id: Optional[str],
+        event_type: EventType,
+        timestamp: Optional[datetime] = None,
+        level: TraceLevel = TraceLevel.INFO,
+        agent_name: str = "unknown",
+        node_name: Optional[str] = None,
+        message: str = "",
+        data: Optional[Dict[str, Any]] = None,
+        duration_ms: Optional[float] = None,
+        error: Optional[str] = None,
+        stack_trace: Optional[str] = None,
+        *,
+        message_args: tuple = (),
+        timestamp_ns: Optional[int] = None
+    ):
+        self.id = id
+        self.trace_id = trace_id
+        self.parent_id = parent_id
+        self.event_type = event_type
+        if timestamp_ns is None:
+            timestamp_ns = (
+                time.monotonic_ns() if timestamp is None
+                else int(timestamp.timestamp() * 1e9) - _WALL_OFFSET_NS
+            )
+        self.timestamp_ns = timestamp_ns
+        self.level = level
+        self.agent_name = agent_name
+        self.node_name = node_name
+        self._message = message
+        self.message_args = message_args
+        self.data = {} if data is None else data
+        self.duration_ms = duration_ms
+        self.error = error
+        self.stack_trace = stack_trace
+    
+    @property
+    def timestamp(self) -> datetime:
+        return datetime.fromtimestamp((self.timestamp_ns + _WALL_OFFSET_NS) / 1e9)
+    
+    @property
+    def message(self) -> str:
+        if self.message_args:
+            return self._message % self.message_args
+        return self._message
+    
+    def __repr__(self) -> str:
+        return (f"TraceEvent(id={self.id!r}, trace_id={self.trace_id!r}, "
+                f"event_type={self.event_type.value}, node_name={self.node_name!r})")
     
     def to_dict(self) -> Dict[str, Any]:
         """Converte para dicionário."""
-        result = asdict(self)
-        result['timestamp'] = self.timestamp.isoformat()
-        result['event_type'] = self.event_type.value
-        result['level'] = self.level.value
-        return result
+        return {
+            "id": self.id,
+            "trace_id": self.trace_id,
+            "parent_id": self.parent_id,
+            "event_type": self.event_type.value,
+            "timestamp": self.timestamp.isoformat(),
+            "level": self.level.value,
+            "agent_name": self.agent_name,
+            "node_name": self.node_name,
+            "message": self.message,
+            "data": self.data,
+            "duration_ms": self.duration_ms,
+            "error": self.error,
+            "stack_trace": self.stack_trace
+        }
 
 
 @dataclass
@@ -123,12 +216,77 @@ class PerformanceMetric:
         return result
 
 
+@dataclass
+class TraceAggregate:
+    """Índice de um trace: últimos eventos e agregados mantidos a cada append."""
+    trace_id: str
+    agent_name: str
+    events: deque
+    start_ns: Optional[int] = None
+    end_ns: Optional[int] = None
+    total_events: int = 0
+    error_count: int = 0
+    event_counts: Dict[str, int] = field(default_factory=dict)
+    nodes_visited: Dict[str, None] = field(default_factory=dict)  # conjunto ordenado
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    
+    def add(self, event: TraceEvent):
+        """Registra evento no buffer circular e atualiza os agregados."""
+        with self.lock:
+            self.events.append(event)
+            self.total_events += 1
+            key = event.event_type.value
+            self.event_counts[key] = self.event_counts.get(key, 0) + 1
+            if event.level in _ERROR_LEVELS:
+                self.error_count += 1
+            if event.node_name:
+                self.nodes_visited[event.node_name] = None
+            timestamp_ns = event.timestamp_ns
+            if self.start_ns is None or timestamp_ns < self.start_ns:
+                self.start_ns = timestamp_ns
+            if self.end_ns is None or timestamp_ns > self.end_ns:
+                self.end_ns = timestamp_ns
+    
+    def summary(self) -> Dict[str, Any]:
+        """Resumo do trace a partir dos agregados (não percorre eventos)."""
+        with self.lock:
+            return {
+                "trace_id": self.trace_id,
+                "agent_name": self.agent_name,
+                "start_time": datetime.fromtimestamp((self.start_ns + _WALL_OFFSET_NS) / 1e9).isoformat(),
+                "end_time": datetime.fromtimestamp((self.end_ns + _WALL_OFFSET_NS) / 1e9).isoformat(),
+                "duration_ms": (self.end_ns - self.start_ns) / 1e6,
+                "total_events": self.total_events,
+                "error_count": self.error_count,
+                "event_counts": dict(self.event_counts),
+                "nodes_visited": list(self.nodes_visited),
+                "success": self.error_count == 0
+            }
+
+
+class TraceContext(NamedTuple):
+    """Contexto de trace da task/thread atual (imutável; cada span cria um novo)."""
+    trace_id: Optional[str]
+    agent_name: str
+    node_name: Optional[str]
+    span_id: Optional[str]
+
+
+_ROOT_CONTEXT = TraceContext(None, "unknown", None, None)
+
+# Contexto por task asyncio/thread: asyncio.gather e create_task copiam o
+# contexto na criação, então spans concorrentes não interferem entre si.
+_trace_context: ContextVar[TraceContext] = ContextVar("trace_context", default=_ROOT_CONTEXT)
+
+
 class ObservabilityConfig(BaseModel):
     """Configuração de observabilidade."""
     langsmith_enabled: bool = True
     langsmith_project_name: str = "open-gemini-canvas"
     trace_level: TraceLevel = TraceLevel.INFO
     max_trace_events: int = 10000
+    max_indexed_traces: int = 1000
+    max_events_per_trace: int = 1000
     max_metrics: int = 50000
     enable_performance_monitoring: bool = True
     enable_error_tracking: bool = True
@@ -136,6 +294,13 @@ class ObservabilityConfig(BaseModel):
     enable_cost_tracking: bool = True
     flush_interval_seconds: int = 30
     retention_days: int = 7
+    export_jsonl_dir: Optional[str] = None
+    export_jsonl_max_bytes: int = 64 * 1024 * 1024
+    export_jsonl_max_files: int = 10
+    otlp_endpoint: Optional[str] = None
+    otlp_headers: Dict[str, str] = Field(default_factory=dict)
+    export_queue_size: int = 10000
+    export_batch_size: int = 512
 
 
 # ==================== LANGSMITH INTEGRATION ====================
@@ -184,7 +349,8 @@ class ObservabilityCallbackHandler(BaseCallbackHandler):
     
     def __init__(self, observability_manager: 'ObservabilityManager'):
         self.manager = observability_manager
-        self.run_stack = []
+        # run_id -> id do evento de início (span da chamada LLM)
+        self._llm_spans: Dict[Any, str] = {}
     
     def on_llm_start(
         self, 
@@ -194,16 +360,17 @@ class ObservabilityCallbackHandler(BaseCallbackHandler):
     ) -> None:
         """Início de chamada LLM."""
         run_id = kwargs.get('run_id', str(uuid.uuid4()))
+        context = _trace_context.get()
+        span_id = new_event_id()
         
         event = TraceEvent(
-            id=str(uuid.uuid4()),
-            trace_id=self.manager.current_trace_id,
-            parent_id=self.run_stack[-1] if self.run_stack else None,
+            id=span_id,
+            trace_id=context.trace_id,
+            parent_id=context.span_id,
             event_type=EventType.LLM_CALL,
-            timestamp=datetime.now(),
             level=TraceLevel.INFO,
-            agent_name=self.manager.current_agent_name,
-            node_name=self.manager.current_node_name,
+            agent_name=context.agent_name,
+            node_name=context.node_name,
             message="LLM call started",
             data={
                 "model": serialized.get("name", "unknown"),
@@ -213,25 +380,26 @@ class ObservabilityCallbackHandler(BaseCallbackHandler):
         )
         
         self.manager.add_trace_event(event)
-        self.run_stack.append(run_id)
+        if self.manager.is_level_enabled(TraceLevel.INFO):
+            # Só eventos registrados servem de span pai para o fim da chamada
+            self._llm_spans[run_id] = span_id
     
     def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
         """Fim de chamada LLM."""
-        if self.run_stack:
-            self.run_stack.pop()
+        context = _trace_context.get()
+        span_id = self._llm_spans.pop(kwargs.get('run_id'), None)
         
         # Extrair tokens se disponível
         token_usage = getattr(response, 'llm_output', {}).get('token_usage', {})
         
         event = TraceEvent(
-            id=str(uuid.uuid4()),
-            trace_id=self.manager.current_trace_id,
-            parent_id=self.run_stack[-1] if self.run_stack else None,
+            id=new_event_id(),
+            trace_id=context.trace_id,
+            parent_id=span_id or context.span_id,
             event_type=EventType.LLM_CALL,
-            timestamp=datetime.now(),
             level=TraceLevel.INFO,
-            agent_name=self.manager.current_agent_name,
-            node_name=self.manager.current_node_name,
+            agent_name=context.agent_name,
+            node_name=context.node_name,
             message="LLM call completed",
             data={
                 "generations_count": len(response.generations),
@@ -249,25 +417,25 @@ class ObservabilityCallbackHandler(BaseCallbackHandler):
                 value=token_usage.get('total_tokens', 0),
                 unit="tokens",
                 timestamp=datetime.now(),
-                agent_name=self.manager.current_agent_name,
-                node_name=self.manager.current_node_name
+                agent_name=context.agent_name,
+                node_name=context.node_name
             ))
     
     def on_llm_error(self, error: Exception, **kwargs: Any) -> None:
         """Erro em chamada LLM."""
-        if self.run_stack:
-            self.run_stack.pop()
+        context = _trace_context.get()
+        span_id = self._llm_spans.pop(kwargs.get('run_id'), None)
         
         event = TraceEvent(
-            id=str(uuid.uuid4()),
-            trace_id=self.manager.current_trace_id,
-            parent_id=self.run_stack[-1] if self.run_stack else None,
+            id=new_event_id(),
+            trace_id=context.trace_id,
+            parent_id=span_id or context.span_id,
             event_type=EventType.ERROR,
-            timestamp=datetime.now(),
             level=TraceLevel.ERROR,
-            agent_name=self.manager.current_agent_name,
-            node_name=self.manager.current_node_name,
-            message=f"LLM error: {str(error)}",
+            agent_name=context.agent_name,
+            node_name=context.node_name,
+            message="LLM error: %s",
+            message_args=(error,),
             data={"error_type": type(error).__name__},
             error=str(error),
             stack_trace=traceback.format_exc()
@@ -278,14 +446,197 @@ class ObservabilityCallbackHandler(BaseCallbackHandler):
 
 # ==================== PERFORMANCE MONITOR ====================
 
+class StreamingHistogram:
+    """
+    Histograma de memória fixa no estilo DDSketch.
+    
+    Cada valor positivo cai no bucket ceil(log_gamma(v)); os quantis têm erro
+    relativo <= relative_accuracy. Valores <= 0 são contados no bucket zero.
+    """
+    
+    def __init__(self, relative_accuracy: float = 0.01, max_bins: int = 2048):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.max_bins = max_bins
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+    
+    def key(self, value: float) -> Optional[int]:
+        """Índice do bucket do valor (None para o bucket zero)."""
+        return math.ceil(math.log(value) / self._log_gamma) if value > 0 else None
+    
+    def add(self, value: float, key: Optional[int] = ...):
+        """Registra um valor (O(1) amortizado); `key` evita recalcular o índice."""
+        if key is ...:
+            key = self.key(value)
+        if key is None:
+            self.zero_count += 1
+        else:
+            bins = self.bins
+            bins[key] = bins.get(key, 0) + 1
+            if len(bins) > self.max_bins:
+                self._collapse()
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+    
+    def merge(self, other: 'StreamingHistogram'):
+        """Soma outro histograma com a mesma precisão."""
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+    
+    def _collapse(self):
+        """Funde os buckets mais baixos para respeitar max_bins."""
+        keys = sorted(self.bins)
+        excess = keys[:len(keys) - self.max_bins + 1]
+        self.bins[excess[-1]] = sum(self.bins.pop(k) for k in excess[:-1]) + self.bins[excess[-1]]
+    
+    def quantile(self, q: float) -> Optional[float]:
+        """Valor aproximado do quantil q (0..1)."""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return min(max(self.min, 0.0), self.max)
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if rank < seen:
+                value = 2 * self.gamma ** key / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+    
+    def count_at_or_below(self, value: float) -> int:
+        """Quantidade aproximada de valores <= value (para buckets cumulativos)."""
+        if value < 0:
+            return 0
+        below = self.zero_count
+        if value > 0:
+            limit = math.ceil(math.log(value) / self._log_gamma)
+            below += sum(count for key, count in self.bins.items() if key <= limit)
+        return below
+    
+    def cumulative_counts(self, bounds: List[float]) -> List[int]:
+        """count_at_or_below para limites crescentes, em uma passada pelos buckets."""
+        counts = []
+        below = self.zero_count
+        keys = iter(sorted(self.bins))
+        key = next(keys, None)
+        for bound in bounds:
+            if bound < 0:
+                counts.append(0)
+                continue
+            if bound > 0:
+                limit = math.ceil(math.log(bound) / self._log_gamma)
+                while key is not None and key <= limit:
+                    below += self.bins[key]
+                    key = next(keys, None)
+            counts.append(below)
+        return counts
+    
+    def summary(self) -> Dict[str, Any]:
+        """Estatísticas do histograma."""
+        if self.count == 0:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "avg": self.total / self.count,
+            "min": self.min,
+            "max": self.max,
+            "total": self.total,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99)
+        }
+
+
+class RollingHistogram:
+    """Janela deslizante de StreamingHistogram em buckets de tempo fixos."""
+    
+    def __init__(
+        self, 
+        bucket_seconds: int = 60, 
+        num_buckets: int = 60, 
+        relative_accuracy: float = 0.01
+    ):
+        self.bucket_seconds = bucket_seconds
+        self.num_buckets = num_buckets
+        self.relative_accuracy = relative_accuracy
+        # slot -> (índice do intervalo de tempo, histograma)
+        self._slots: List[Optional[tuple]] = [None] * num_buckets
+        self.total = StreamingHistogram(relative_accuracy)  # acumulado desde o início
+    
+    def _epoch(self, now: float) -> int:
+        return int(now // self.bucket_seconds)
+    
+    def add(self, value: float, now: float = None):
+        """Registra valor no bucket de tempo corrente."""
+        epoch = self._epoch(time.time() if now is None else now)
+        slot = epoch % self.num_buckets
+        current = self._slots[slot]
+        if current is None or current[0] != epoch:
+            current = (epoch, StreamingHistogram(self.relative_accuracy))
+            self._slots[slot] = current
+        key = self.total.key(value)
+        current[1].add(value, key)
+        self.total.add(value, key)
+    
+    def window(self, seconds: float, now: float = None) -> StreamingHistogram:
+        """Histograma dos últimos `seconds` (limitado a num_buckets buckets)."""
+        epoch = self._epoch(time.time() if now is None else now)
+        buckets = min(self.num_buckets, max(1, math.ceil(seconds / self.bucket_seconds)))
+        merged = StreamingHistogram(self.relative_accuracy)
+        for entry in self._slots:
+            if entry is not None and epoch - buckets < entry[0] <= epoch:
+                merged.merge(entry[1])
+        return merged
+
+
 class PerformanceMonitor:
     """Monitor de performance para agentes."""
     
-    def __init__(self):
-        self.metrics = deque(maxlen=50000)
-        self.aggregated_metrics = defaultdict(list)
+    def __init__(
+        self, 
+        max_metrics: int = 50000, 
+        bucket_seconds: int = 60, 
+        num_buckets: int = 60, 
+        relative_accuracy: float = 0.01
+    ):
+        self.metrics = deque(maxlen=max_metrics)
+        # (tipo, agente, nodo, nome) -> RollingHistogram; memória fixa por chave
+        self.histograms: Dict[tuple, RollingHistogram] = {}
+        self.bucket_seconds = bucket_seconds
+        self.num_buckets = num_buckets
+        self.relative_accuracy = relative_accuracy
         self._lock = threading.Lock()
     
+    def record(self, metric: PerformanceMetric):
+        """Registra métrica no histórico e no histograma da sua chave."""
+        key = (metric.metric_type, metric.agent_name, metric.node_name, metric.name)
+        with self._lock:
+            self.metrics.append(metric)
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = RollingHistogram(
+                    self.bucket_seconds, self.num_buckets, self.relative_accuracy
+                )
+            histogram.add(metric.value, metric.timestamp.timestamp())
+    
     def record_latency(
         self, 
         operation: str, 
@@ -294,7 +645,7 @@ class PerformanceMonitor:
         node_name: str = None
     ):
         """Registra latência de operação."""
-        metric = PerformanceMetric(
+        self.record(PerformanceMetric(
             name=f"{operation}_latency",
             metric_type=MetricType.LATENCY,
             value=duration_ms,
@@ -302,11 +653,7 @@ class PerformanceMonitor:
             timestamp=datetime.now(),
             agent_name=agent_name,
             node_name=node_name
-        )
-        
-        with self._lock:
-            self.metrics.append(metric)
-            self.aggregated_metrics[f"{agent_name}_{operation}"].append(duration_ms)
+        ))
     
     def record_token_usage(
         self, 
@@ -315,7 +662,7 @@ class PerformanceMonitor:
         node_name: str = None
     ):
         """Registra uso de tokens."""
-        metric = PerformanceMetric(
+        self.record(PerformanceMetric(
             name="token_usage",
             metric_type=MetricType.TOKEN_COUNT,
             value=tokens,
@@ -323,96 +670,535 @@ class PerformanceMonitor:
             timestamp=datetime.now(),
             agent_name=agent_name,
             node_name=node_name
-        )
-        
+        ))
+    
+    def get_histogram(
+        self, 
+        metric_type: MetricType, 
+        time_window_minutes: int = 60, 
+        **filters: Optional[str]
+    ) -> StreamingHistogram:
+        """Funde os histogramas do tipo na janela, filtrando por agent_name/node_name/name."""
+        merged = StreamingHistogram(self.relative_accuracy)
+        now = time.time()
         with self._lock:
-            self.metrics.append(metric)
+            for (kind, agent_name, node_name, name), histogram in self.histograms.items():
+                labels = {"agent_name": agent_name, "node_name": node_name, "name": name}
+                if kind == metric_type and all(labels[k] == v for k, v in filters.items()):
+                    merged.merge(histogram.window(time_window_minutes * 60, now))
+        return merged
     
-    def get_metrics_summary(self, time_window_minutes: int = 60) -> Dict[str, Any]:
-        """Obtém resumo de métricas."""
-        cutoff_time = datetime.now() - timedelta(minutes=time_window_minutes)
-        
+    def get_cumulative_histograms(self, metric_type: MetricType) -> List[tuple]:
+        """Cópias dos histogramas acumulados do tipo: [(agente, nodo, nome, histograma)]."""
+        result = []
+        with self._lock:
+            for (kind, agent_name, node_name, name), histogram in self.histograms.items():
+                if kind == metric_type:
+                    copy = StreamingHistogram(self.relative_accuracy)
+                    copy.merge(histogram.total)
+                    result.append((agent_name, node_name, name, copy))
+        return result
+    
+    def get_histogram_summaries(self, time_window_minutes: int = 60) -> List[Dict[str, Any]]:
+        """Percentis por chave (tipo, agente, nodo, operação) na janela."""
+        now = time.time()
+        summaries = []
         with self._lock:
-            recent_metrics = [
-                m for m in self.metrics 
-                if m.timestamp > cutoff_time
-            ]
+            for (kind, agent_name, node_name, name), histogram in self.histograms.items():
+                window = histogram.window(time_window_minutes * 60, now)
+                if window.count:
+                    summaries.append({
+                        "metric_type": kind.value,
+                        "agent_name": agent_name,
+                        "node_name": node_name,
+                        "name": name,
+                        **window.summary()
+                    })
+        return summaries
+    
+    def get_metrics_summary(self, time_window_minutes: int = 60) -> Dict[str, Any]:
+        """Obtém resumo de métricas (com p50/p95/p99) a partir dos histogramas."""
+        summary = {}
+        for metric_type in MetricType:
+            window = self.get_histogram(metric_type, time_window_minutes)
+            if window.count:
+                summary[metric_type.value] = window.summary()
         
-        if not recent_metrics:
+        if not summary:
             return {"message": "Nenhuma métrica no período"}
         
-        # Agrupar por tipo
-        by_type = defaultdict(list)
-        for metric in recent_metrics:
-            by_type[metric.metric_type].append(metric.value)
-        
-        # Calcular estatísticas
-        summary = {}
-        for metric_type, values in by_type.items():
-            if values:
-                summary[metric_type.value] = {
-                    "count": len(values),
-                    "avg": sum(values) / len(values),
-                    "min": min(values),
-                    "max": max(values),
-                    "total": sum(values)
-                }
-        
         return summary
 
 
+# ==================== EXPORTAÇÃO ====================
+
+class TraceSink(ABC):
+    """Destino de exportação de eventos de trace (chamado na thread do exportador)."""
+    
+    name = "sink"
+    # Sinks de spans recebem também o fim de nodos e sessões abaixo do nível
+    # de trace (ver BatchExporter.submit_span)
+    exports_spans = False
+    
+    @abstractmethod
+    def export(self, events: List[TraceEvent]):
+        """Envia um lote de eventos ao destino."""
+    
+    def close(self):
+        pass
+
+
+class JSONLFileSink(TraceSink):
+    """
+    Arquivos JSONL comprimidos com gzip, com rotação por tamanho.
+    
+    Cada lote é gravado e descarregado (flush) de uma vez; ao passar de
+    max_bytes (não comprimidos) o arquivo é fechado e um novo é aberto.
+    Mantém no máximo max_files arquivos, apagando os mais antigos.
+    """
+    
+    name = "jsonl"
+    
+    def __init__(self, directory: str, max_bytes: int = 64 * 1024 * 1024, max_files: int = 10):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self._file = None
+        self._path: Optional[Path] = None
+        self._written = 0
+        self._sequence = 0
+    
+    def _open(self):
+        self._sequence += 1
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        self._path = self.directory / f"traces-{stamp}-{os.getpid()}-{self._sequence:04d}.jsonl.gz"
+        self._file = gzip.open(self._path, "wb", compresslevel=6)
+        self._written = 0
+        
+        files = sorted(self.directory.glob("traces-*.jsonl.gz"), key=lambda p: p.stat().st_mtime)
+        for old in files[:max(0, len(files) - self.max_files)]:
+            if old != self._path:
+                old.unlink(missing_ok=True)
+    
+    def export(self, events: List[TraceEvent]):
+        if self._file is None:
+            self._open()
+        payload = "".join(
+            json.dumps(event.to_dict(), ensure_ascii=False, default=str) + "\n" for event in events
+        ).encode("utf-8")
+        self._file.write(payload)
+        self._file.flush()
+        self._written += len(payload)
+        if self._written >= self.max_bytes:
+            self.close()
+    
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class OTLPHTTPSink(TraceSink):
+    """
+    Exportador OTLP/HTTP (JSON) para um coletor OpenTelemetry.
+    
+    Cada nodo (NodeSpan) e cada sessão de agente vira um único span, emitido
+    na saída (NODE_EXIT/AGENT_END) com o ID aberto na entrada e o intervalo
+    medido; NODE_ENTER/AGENT_START não geram span. Os demais eventos viram
+    spans instantâneos filhos do nodo ou da sessão corrente. Como o fim dos
+    spans chega a este sink em qualquer nível de trace, parentSpanId sempre
+    aponta para um span exportado.
+    """
+    
+    name = "otlp"
+    exports_spans = True
+    
+    def __init__(
+        self, 
+        endpoint: str, 
+        headers: Dict[str, str] = None, 
+        timeout: float = 10.0, 
+        service_name: str = "open-gemini-canvas"
+    ):
+        self.endpoint = endpoint
+        self.headers = {"Content-Type": "application/json", **(headers or {})}
+        self.timeout = timeout
+        self.service_name = service_name
+    
+    @staticmethod
+    def _hex_id(value: Optional[str], size: int) -> str:
+        if not value:
+            return ""
+        if size == 16:
+            try:
+                return uuid.UUID(value).hex
+            except ValueError:
+                pass
+        return hashlib.blake2b(value.encode("utf-8"), digest_size=size).hexdigest()
+    
+    @staticmethod
+    def _attribute(key: str, value: Any) -> Dict[str, Any]:
+        if isinstance(value, bool):
+            return {"key": key, "value": {"boolValue": value}}
+        if isinstance(value, int):
+            return {"key": key, "value": {"intValue": str(value)}}
+        if isinstance(value, float):
+            return {"key": key, "value": {"doubleValue": value}}
+        if not isinstance(value, str):
+            value = json.dumps(value, ensure_ascii=False, default=str)
+        return {"key": key, "value": {"stringValue": value}}
+    
+    def _span(self, event: TraceEvent) -> Dict[str, Any]:
+        end_ns = event.timestamp_ns + _WALL_OFFSET_NS
+        start_ns = end_ns - int((event.duration_ms or 0) * 1e6)
+        if event.event_type in _SPAN_END_TYPES:
+            # O span é o do nodo/sessão; o evento de saída só o fecha
+            span_id, parent_id = event.parent_id, event.data.get("parent_span_id")
+            name = event.node_name or event.agent_name
+        else:
+            span_id, parent_id, name = event.id, event.parent_id, event.event_type.value
+        attributes = [
+            self._attribute("event.type", event.event_type.value),
+            self._attribute("event.level", event.level.value),
+            self._attribute("agent.name", event.agent_name),
+            self._attribute("event.message", event.message),
+        ]
+        if event.node_name:
+            attributes.append(self._attribute("node.name", event.node_name))
+        attributes.extend(
+            self._attribute(f"data.{k}", v) for k, v in event.data.items() if k != "parent_span_id"
+        )
+        span = {
+            "traceId": self._hex_id(event.trace_id or event.id, 16),
+            "spanId": self._hex_id(span_id, 8),
+            "parentSpanId": self._hex_id(parent_id, 8),
+            "name": name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(start_ns),
+            "endTimeUnixNano": str(end_ns),
+            "attributes": attributes,
+        }
+        if event.error or event.level in _ERROR_LEVELS:
+            span["status"] = {"code": 2, "message": event.error or event.message}  # STATUS_CODE_ERROR
+        return span
+    
+    def export(self, events: List[TraceEvent]):
+        spans = [self._span(event) for event in events if event.event_type not in _SPAN_START_TYPES]
+        if not spans:
+            return
+        body = json.dumps({
+            "resourceSpans": [{
+                "resource": {"attributes": [self._attribute("service.name", self.service_name)]},
+                "scopeSpans": [{
+                    "scope": {"name": "open-gemini-canvas.observability"},
+                    "spans": spans
+                }]
+            }]
+        }).encode("utf-8")
+        request = urllib.request.Request(self.endpoint, data=body, headers=self.headers, method="POST")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class BatchExporter:
+    """
+    Pipeline de exportação em lotes.
+    
+    submit() nunca bloqueia: só anexa o evento a um deque (append é atômico)
+    e, com o buffer cheio ou o exportador encerrado, descarta e conta em
+    `dropped`. Uma thread envia lotes aos sinks quando o buffer chega a
+    batch_size ou a cada flush_interval segundos. Falhas de um sink contam
+    em `failed` (eventos por sink) sem afetar os demais. submit_span() usa
+    uma fila à parte, entregue só aos sinks com exports_spans.
+    """
+    
+    def __init__(
+        self, 
+        sinks: List[TraceSink], 
+        max_queue_size: int = 10000, 
+        batch_size: int = 512, 
+        flush_interval: float = 5.0
+    ):
+        self.sinks = sinks
+        self.span_sinks = [sink for sink in sinks if sink.exports_spans]
+        self.max_queue_size = max(1, max_queue_size)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._buffer: deque = deque()
+        self._span_buffer: deque = deque()
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._flush_requests: List[threading.Event] = []
+        self._closed = False
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self._worker = threading.Thread(target=self._run, name="observability-exporter", daemon=True)
+        self._worker.start()
+    
+    def submit(self, event: TraceEvent) -> bool:
+        """Enfileira evento para exportação; retorna False se foi descartado."""
+        buffer = self._buffer
+        if self._closed or len(buffer) >= self.max_queue_size:
+            with self._lock:
+                self.dropped += 1
+            return False
+        buffer.append(event)
+        if len(buffer) >= self.batch_size and not self._wakeup.is_set():
+            self._wakeup.set()
+        return True
+    
+    def submit_span(self, event: TraceEvent) -> bool:
+        """Enfileira o fim de um span não registrado, só para os sinks de spans."""
+        buffer = self._span_buffer
+        if self._closed or not self.span_sinks or len(buffer) >= self.max_queue_size:
+            with self._lock:
+                self.dropped += 1
+            return False
+        buffer.append(event)
+        if len(buffer) >= self.batch_size and not self._wakeup.is_set():
+            self._wakeup.set()
+        return True
+    
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Exporta tudo o que foi enfileirado até agora."""
+        if self._closed:
+            return not self._worker.is_alive()
+        done = threading.Event()
+        with self._lock:
+            self._flush_requests.append(done)
+        self._wakeup.set()
+        return done.wait(timeout)
+    
+    def shutdown(self, timeout: Optional[float] = 10.0):
+        """Recusa novos eventos, exporta os pendentes e fecha os sinks."""
+        if self._closed:
+            return
+        self._closed = True
+        self._wakeup.set()
+        self._worker.join(timeout)
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except Exception as e:
+                logger.warning(f"Erro ao fechar sink {sink.name}: {e}")
+    
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "queued": len(self._buffer) + len(self._span_buffer),
+            "exported": self.exported,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "batches": self.batches
+        }
+    
+    def _run(self):
+        while True:
+            # Acorda por tamanho (submit), flush/encerramento ou intervalo
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            with self._lock:
+                requests, self._flush_requests = self._flush_requests, []
+            stopping = self._closed
+            
+            for buffer, sinks in ((self._buffer, self.sinks), (self._span_buffer, self.span_sinks)):
+                while buffer:
+                    batch = [buffer.popleft() for _ in range(min(self.batch_size, len(buffer)))]
+                    self._export(batch, sinks)
+            
+            for done in requests:
+                done.set()
+            if stopping:
+                break
+    
+    def _export(self, batch: List[TraceEvent], sinks: List[TraceSink]):
+        for sink in sinks:
+            try:
+                sink.export(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                logger.warning(f"Falha ao exportar {len(batch)} eventos para {sink.name}: {e}")
+        self.exported += len(batch)
+        self.batches += 1
+
+
 # ==================== OBSERVABILITY MANAGER ====================
 
+class NodeSpan:
+    """
+    Span de nodo usado por ObservabilityManager.trace_node.
+    
+    Classe com __slots__ em vez de @contextmanager: o gerador do contextlib
+    custava mais que o próprio registro do span.
+    """
+    
+    __slots__ = ("manager", "node_name", "span_id", "parent", "token", "record_debug", "start_ns")
+    
+    def __init__(self, manager: 'ObservabilityManager', node_name: str):
+        self.manager = manager
+        self.node_name = node_name
+    
+    def __enter__(self) -> str:
+        manager = self.manager
+        parent = self.parent = _trace_context.get()
+        span_id = self.span_id = new_event_id()
+        self.token = _trace_context.set(
+            TraceContext(parent.trace_id, parent.agent_name, self.node_name, span_id)
+        )
+        self.record_debug = TraceLevel.DEBUG in manager._enabled_levels
+        self.start_ns = time.monotonic_ns()
+        
+        # Evento de entrada no nodo (identifica o span)
+        if self.record_debug:
+            manager.add_trace_event(TraceEvent(
+                span_id, parent.trace_id, parent.span_id, EventType.NODE_ENTER,
+                level=TraceLevel.DEBUG,
+                agent_name=parent.agent_name,
+                node_name=self.node_name,
+                message="Entering node %s",
+                message_args=(self.node_name,),
+                timestamp_ns=self.start_ns
+            ))
+        return span_id
+    
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        manager = self.manager
+        parent = self.parent
+        node_name = self.node_name
+        end_ns = time.monotonic_ns()
+        duration_ms = (end_ns - self.start_ns) / 1e6
+        
+        if exc_type is not None and issubclass(exc_type, Exception):
+            # Registrar erro
+            manager.add_trace_event(TraceEvent(
+                new_event_id(), parent.trace_id, self.span_id, EventType.ERROR,
+                level=TraceLevel.ERROR,
+                agent_name=parent.agent_name,
+                node_name=node_name,
+                message="Error in node %s: %s",
+                message_args=(node_name, exc),
+                data={"error_type": exc_type.__name__},
+                error=str(exc),
+                stack_trace="".join(traceback.format_exception(exc_type, exc, tb)),
+                timestamp_ns=end_ns
+            ))
+        
+        # Evento de saída do nodo (fecha o span; sinks OTLP o recebem em qualquer nível)
+        if self.record_debug or manager._span_exporter is not None:
+            manager._end_span(TraceEvent(
+                new_event_id(), parent.trace_id, self.span_id, EventType.NODE_EXIT,
+                level=TraceLevel.DEBUG,
+                agent_name=parent.agent_name,
+                node_name=node_name,
+                message="Exiting node %s",
+                message_args=(node_name,),
+                data={"parent_span_id": parent.span_id},
+                duration_ms=duration_ms,
+                error=str(exc) if exc_type is not None else None,
+                timestamp_ns=end_ns
+            ))
+        
+        # Registrar métrica de latência
+        manager.performance_monitor.record_latency(
+            f"node_{node_name}",
+            duration_ms,
+            parent.agent_name,
+            node_name
+        )
+        
+        try:
+            _trace_context.reset(self.token)
+        except ValueError:
+            # Saída em outro contexto (ex.: corrotina finalizada em outra task)
+            _trace_context.set(parent)
+        return False
+
+
 class ObservabilityManager:
     """Gerenciador principal de observabilidade."""
     
     def __init__(self, config: ObservabilityConfig = None):
         self.config = config or ObservabilityConfig()
         self.trace_events = deque(maxlen=self.config.max_trace_events)
-        self.performance_monitor = PerformanceMonitor()
+        # trace_id -> TraceAggregate, na ordem de criação (o mais antigo sai primeiro)
+        self._trace_index: OrderedDict[str, TraceAggregate] = OrderedDict()
+        self.performance_monitor = PerformanceMonitor(max_metrics=self.config.max_metrics)
         self.langsmith_integration = LangSmithIntegration(self.config)
         self.callback_handler = ObservabilityCallbackHandler(self)
         
-        # Estado atual
-        self.current_trace_id = None
-        self.current_agent_name = "unknown"
-        self.current_node_name = None
+        # Estado atual (trace/nodo corrente vivem em _trace_context, por task)
         self.active_sessions = {}
         
+        # Contadores acumulados (independem do nível de trace)
+        self.tool_call_counts: Dict[tuple, int] = defaultdict(int)  # (agente, ferramenta, status)
+        self.error_counts: Dict[tuple, int] = defaultdict(int)  # (agente, nodo)
+        self._counter_lock = threading.Lock()
+        
+        # Níveis registrados, pré-calculados (evita montar eventos descartados)
+        self.set_trace_level(self.config.trace_level)
+        
         # Locks para thread safety
         self._trace_lock = threading.Lock()
         self._session_lock = threading.Lock()
         
-        # Iniciar flush automático
-        self._start_auto_flush()
+        # Exportação em lotes (thread própria; nunca bloqueia os nodos)
+        self.exporter = self._create_exporter()
+        self._span_exporter = self.exporter if self.exporter is not None and self.exporter.span_sinks else None
+    
+    # ---------- Contexto corrente ----------
+    
+    @property
+    def current_trace_id(self) -> Optional[str]:
+        return _trace_context.get().trace_id
+    
+    @property
+    def current_agent_name(self) -> str:
+        return _trace_context.get().agent_name
+    
+    @property
+    def current_node_name(self) -> Optional[str]:
+        return _trace_context.get().node_name
+    
+    @property
+    def current_span_id(self) -> Optional[str]:
+        return _trace_context.get().span_id
+    
+    def get_trace_context(self) -> TraceContext:
+        """Retorna o contexto de trace da task atual."""
+        return _trace_context.get()
     
     def start_trace(self, agent_name: str, session_id: str = None) -> str:
-        """Inicia um novo trace."""
+        """Inicia um novo trace no contexto da task atual."""
         trace_id = str(uuid.uuid4())
+        span_id = new_event_id()
+        parent_context = _trace_context.get()
+        _trace_context.set(TraceContext(trace_id, agent_name, None, span_id))
         
         with self._session_lock:
-            self.current_trace_id = trace_id
-            self.current_agent_name = agent_name
-            
             session_info = {
                 "trace_id": trace_id,
                 "agent_name": agent_name,
                 "start_time": datetime.now(),
-                "session_id": session_id or trace_id
+                "session_id": session_id or trace_id,
+                "span_id": span_id,
+                "start_ns": time.monotonic_ns(),
+                "parent_context": parent_context
             }
             self.active_sessions[trace_id] = session_info
         
-        # Criar evento de início
+        # Criar evento de início (raiz do trace)
         event = TraceEvent(
-            id=str(uuid.uuid4()),
+            id=span_id,
             trace_id=trace_id,
             parent_id=None,
             event_type=EventType.AGENT_START,
-            timestamp=datetime.now(),
             level=TraceLevel.INFO,
             agent_name=agent_name,
             node_name=None,
-            message=f"Agent {agent_name} started",
+            message="Agent %s started",
+            message_args=(agent_name,),
             data={"session_id": session_id}
         )
         
@@ -431,118 +1217,103 @@ class ObservabilityManager:
         with self._session_lock:
             session_info = self.active_sessions.get(target_trace_id)
             if session_info:
-                duration = (datetime.now() - session_info["start_time"]).total_seconds() * 1000
+                end_ns = time.monotonic_ns()
+                duration = (end_ns - session_info["start_ns"]) / 1e6
                 
                 # Criar evento de fim
                 event = TraceEvent(
-                    id=str(uuid.uuid4()),
+                    id=new_event_id(),
                     trace_id=target_trace_id,
-                    parent_id=None,
+                    parent_id=session_info["span_id"],
                     event_type=EventType.AGENT_END,
-                    timestamp=datetime.now(),
                     level=TraceLevel.INFO,
                     agent_name=session_info["agent_name"],
                     node_name=None,
-                    message=f"Agent {session_info['agent_name']} completed",
+                    message="Agent %s completed",
+                    message_args=(session_info["agent_name"],),
                     data={"duration_ms": duration},
-                    duration_ms=duration
+                    duration_ms=duration,
+                    timestamp_ns=end_ns
                 )
                 
-                self.add_trace_event(event)
+                self._end_span(event)
                 
                 # Remover sessão ativa
                 del self.active_sessions[target_trace_id]
                 
+                # Restaura o contexto anterior ao trace, se ele for o corrente
                 if target_trace_id == self.current_trace_id:
-                    self.current_trace_id = None
-                    self.current_agent_name = "unknown"
-                    self.current_node_name = None
+                    _trace_context.set(session_info["parent_context"])
                 
                 logger.info(f"Trace finalizado: {target_trace_id} ({duration:.2f}ms)")
     
-    @contextmanager
-    def trace_node(self, node_name: str):
-        """Context manager para trace de nodo."""
-        old_node_name = self.current_node_name
-        self.current_node_name = node_name
-        start_time = time.time()
-        
-        # Evento de entrada no nodo
-        enter_event = TraceEvent(
-            id=str(uuid.uuid4()),
-            trace_id=self.current_trace_id,
-            parent_id=None,
-            event_type=EventType.NODE_ENTER,
-            timestamp=datetime.now(),
-            level=TraceLevel.DEBUG,
-            agent_name=self.current_agent_name,
-            node_name=node_name,
-            message=f"Entering node {node_name}",
-            data={}
+    def trace_node(self, node_name: str) -> 'NodeSpan':
+        """Context manager para trace de nodo (abre um span filho do corrente)."""
+        return NodeSpan(self, node_name)
+    
+    def set_trace_level(self, level: TraceLevel):
+        """Altera o nível mínimo de trace (recalcula o filtro)."""
+        self.config.trace_level = level
+        self._enabled_levels = frozenset(
+            l for l in TraceLevel if _LEVEL_ORDER[l] >= _LEVEL_ORDER[level]
         )
-        self.add_trace_event(enter_event)
-        
-        try:
-            yield
-        except Exception as e:
-            # Registrar erro
-            error_event = TraceEvent(
-                id=str(uuid.uuid4()),
-                trace_id=self.current_trace_id,
-                parent_id=None,
-                event_type=EventType.ERROR,
-                timestamp=datetime.now(),
-                level=TraceLevel.ERROR,
-                agent_name=self.current_agent_name,
-                node_name=node_name,
-                message=f"Error in node {node_name}: {str(e)}",
-                data={"error_type": type(e).__name__},
-                error=str(e),
-                stack_trace=traceback.format_exc()
-            )
-            self.add_trace_event(error_event)
-            raise
-        finally:
-            # Evento de saída do nodo
-            duration_ms = (time.time() - start_time) * 1000
-            
-            exit_event = TraceEvent(
-                id=str(uuid.uuid4()),
-                trace_id=self.current_trace_id,
-                parent_id=None,
-                event_type=EventType.NODE_EXIT,
-                timestamp=datetime.now(),
-                level=TraceLevel.DEBUG,
-                agent_name=self.current_agent_name,
-                node_name=node_name,
-                message=f"Exiting node {node_name}",
-                data={},
-                duration_ms=duration_ms
-            )
-            self.add_trace_event(exit_event)
-            
-            # Registrar métrica de latência
-            self.performance_monitor.record_latency(
-                f"node_{node_name}",
-                duration_ms,
-                self.current_agent_name,
-                node_name
-            )
-            
-            self.current_node_name = old_node_name
+    
+    def is_level_enabled(self, level: TraceLevel) -> bool:
+        """Indica se eventos do nível informado são registrados."""
+        return level in self._enabled_levels
     
     def add_trace_event(self, event: TraceEvent):
         """Adiciona evento de trace."""
-        if event.level.value not in [l.value for l in [self.config.trace_level] + 
-                                    [TraceLevel.WARNING, TraceLevel.ERROR, TraceLevel.CRITICAL]]:
+        if event.level not in self._enabled_levels:
             return
         
+        if event.level in _ERROR_LEVELS:
+            with self._counter_lock:
+                self.error_counts[(event.agent_name, event.node_name)] += 1
+        
         with self._trace_lock:
             self.trace_events.append(event)
+            aggregate = self._index_trace(event) if event.trace_id else None
+        
+        if self.exporter is not None:
+            self.exporter.submit(event)
+        
+        # Agregados têm lock próprio: leituras de um trace não bloqueiam os demais
+        if aggregate is not None:
+            aggregate.add(event)
+    
+    def _index_trace(self, event: TraceEvent) -> TraceAggregate:
+        """Obtém (ou cria) o índice do trace do evento. Chamado sob _trace_lock."""
+        aggregate = self._trace_index.get(event.trace_id)
+        if aggregate is None:
+            aggregate = TraceAggregate(
+                trace_id=event.trace_id,
+                agent_name=event.agent_name,
+                events=deque(maxlen=self.config.max_events_per_trace)
+            )
+            self._trace_index[event.trace_id] = aggregate
+            while len(self._trace_index) > self.config.max_indexed_traces:
+                self._trace_index.popitem(last=False)
+        return aggregate
+    
+    def _end_span(self, event: TraceEvent):
+        """Registra o fim de um span; abaixo do nível de trace, vai só para os sinks de spans."""
+        if event.level in self._enabled_levels:
+            self.add_trace_event(event)
+        elif self._span_exporter is not None:
+            self._span_exporter.submit_span(event)
+    
+    def get_trace_events(self, trace_id: str = None) -> List[TraceEvent]:
+        """Retorna os eventos retidos de um trace (até max_events_per_trace)."""
+        aggregate = self._trace_index.get(trace_id or self.current_trace_id)
+        if aggregate is None:
+            return []
+        with aggregate.lock:
+            return list(aggregate.events)
     
     def add_metric(self, metric: PerformanceMetric):
         """Adiciona métrica de performance."""
-        self.performance_monitor.metrics.append(metric)
+        self.performance_monitor.record(metric)
     
     def log_tool_call(
         self, 
@@ -552,22 +1323,24 @@ class ObservabilityManager:
         error: Exception = None
     ):
         """Registra chamada de ferramenta."""
-        level = TraceLevel.ERROR if error else TraceLevel.INFO
-        message = f"Tool call: {tool_name}"
+        context = _trace_context.get()
+        with self._counter_lock:
+            self.tool_call_counts[(context.agent_name, tool_name, "error" if error else "success")] += 1
         
-        if error:
-            message += f" - Error: {str(error)}"
+        level = TraceLevel.ERROR if error else TraceLevel.INFO
+        if level not in self._enabled_levels:
+            return
         
         event = TraceEvent(
-            id=str(uuid.uuid4()),
-            trace_id=self.current_trace_id,
-            parent_id=None,
+            id=new_event_id(),
+            trace_id=context.trace_id,
+            parent_id=context.span_id,
             event_type=EventType.TOOL_CALL,
-            timestamp=datetime.now(),
             level=level,
-            agent_name=self.current_agent_name,
-            node_name=self.current_node_name,
-            message=message,
+            agent_name=context.agent_name,
+            node_name=context.node_name,
+            message="Tool call: %s - Error: %s" if error else "Tool call: %s",
+            message_args=(tool_name, error) if error else (tool_name,),
             data={
                 "tool_name": tool_name,
                 "args": args,
@@ -582,7 +1355,7 @@ class ObservabilityManager:
     
     def log_state_update(self, old_state: Dict[str, Any], new_state: Dict[str, Any]):
         """Registra atualização de estado."""
-        if not self.config.enable_state_tracking:
+        if not self.config.enable_state_tracking or TraceLevel.DEBUG not in self._enabled_levels:
             return
         
         # Calcular diff simplificado
@@ -591,16 +1364,17 @@ class ObservabilityManager:
             if old_state.get(key) != new_state.get(key):
                 changed_keys.append(key)
         
+        context = _trace_context.get()
         event = TraceEvent(
-            id=str(uuid.uuid4()),
-            trace_id=self.current_trace_id,
-            parent_id=None,
+            id=new_event_id(),
+            trace_id=context.trace_id,
+            parent_id=context.span_id,
             event_type=EventType.STATE_UPDATE,
-            timestamp=datetime.now(),
             level=TraceLevel.DEBUG,
-            agent_name=self.current_agent_name,
-            node_name=self.current_node_name,
-            message=f"State updated: {len(changed_keys)} keys changed",
+            agent_name=context.agent_name,
+            node_name=context.node_name,
+            message="State updated: %d keys changed",
+            message_args=(len(changed_keys),),
             data={
                 "changed_keys": changed_keys,
                 "state_size": len(new_state)
@@ -616,59 +1390,57 @@ class ObservabilityManager:
         if not target_trace_id:
             return {"error": "Nenhum trace ativo"}
         
-        with self._trace_lock:
-            trace_events = [e for e in self.trace_events if e.trace_id == target_trace_id]
-        
-        if not trace_events:
+        # Leitura sem _trace_lock: get() em dict é atômico e o agregado tem lock próprio
+        aggregate = self._trace_index.get(target_trace_id)
+        if aggregate is None:
             return {"error": f"Trace {target_trace_id} não encontrado"}
         
-        # Estatísticas básicas
-        start_time = min(e.timestamp for e in trace_events)
-        end_time = max(e.timestamp for e in trace_events)
-        duration_ms = (end_time - start_time).total_seconds() * 1000
-        
-        # Contar eventos por tipo
-        event_counts = defaultdict(int)
-        error_count = 0
-        
-        for event in trace_events:
-            event_counts[event.event_type.value] += 1
-            if event.level == TraceLevel.ERROR:
-                error_count += 1
-        
-        # Nodos visitados
-        nodes_visited = list(set(e.node_name for e in trace_events if e.node_name))
-        
-        return {
-            "trace_id": target_trace_id,
-            "agent_name": trace_events[0].agent_name,
-            "start_time": start_time.isoformat(),
-            "end_time": end_time.isoformat(),
-            "duration_ms": duration_ms,
-            "total_events": len(trace_events),
-            "error_count": error_count,
-            "event_counts": dict(event_counts),
-            "nodes_visited": nodes_visited,
-            "success": error_count == 0
-        }
+        return aggregate.summary()
+    
+    def get_counters(self) -> Dict[str, Dict[tuple, int]]:
+        """Cópia dos contadores de chamadas de ferramenta e de erros."""
+        with self._counter_lock:
+            return {
+                "tool_calls": dict(self.tool_call_counts),
+                "errors": dict(self.error_counts)
+            }
     
     def get_performance_summary(self) -> Dict[str, Any]:
         """Obtém resumo de performance."""
         return self.performance_monitor.get_metrics_summary()
     
-    def _start_auto_flush(self):
-        """Inicia flush automático de dados."""
-        async def auto_flush_loop():
-            while True:
-                await asyncio.sleep(self.config.flush_interval_seconds)
-                await self._flush_data()
-        
-        asyncio.create_task(auto_flush_loop())
+    def _create_exporter(self) -> Optional[BatchExporter]:
+        """Cria o exportador com os sinks configurados (None se não houver)."""
+        sinks: List[TraceSink] = []
+        if self.config.export_jsonl_dir:
+            sinks.append(JSONLFileSink(
+                self.config.export_jsonl_dir,
+                max_bytes=self.config.export_jsonl_max_bytes,
+                max_files=self.config.export_jsonl_max_files
+            ))
+        if self.config.otlp_endpoint:
+            sinks.append(OTLPHTTPSink(
+                self.config.otlp_endpoint,
+                headers=self.config.otlp_headers,
+                service_name=self.config.langsmith_project_name
+            ))
+        if not sinks:
+            return None
+        return BatchExporter(
+            sinks,
+            max_queue_size=self.config.export_queue_size,
+            batch_size=self.config.export_batch_size,
+            flush_interval=self.config.flush_interval_seconds
+        )
     
-    async def _flush_data(self):
-        """Flush dados para sistemas externos."""
-        # Implementar flush para LangSmith ou outros sistemas
-        logger.debug("Flush automático de dados de observabilidade")
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Exporta os eventos pendentes."""
+        return self.exporter.flush(timeout) if self.exporter else True
+    
+    def shutdown(self, timeout: Optional[float] = 10.0):
+        """Drena a fila de exportação e fecha os sinks."""
+        if self.exporter:
+            self.exporter.shutdown(timeout)
 
 
 # ==================== DECORADORES ====================
@@ -743,15 +1515,26 @@ def get_observability_manager() -> ObservabilityManager:
     global _global_observability_manager
     
     if _global_observability_manager is None:
+        otlp_endpoint = os.getenv("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT")
+        if not otlp_endpoint and os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+            otlp_endpoint = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT").rstrip("/") + "/v1/traces"
+        otlp_headers = dict(
+            item.split("=", 1) for item in os.getenv("OTEL_EXPORTER_OTLP_HEADERS", "").split(",") if "=" in item
+        )
+        
         config = ObservabilityConfig(
             langsmith_enabled=os.getenv("LANGSMITH_API_KEY") is not None,
             langsmith_project_name=os.getenv("LANGSMITH_PROJECT", "open-gemini-canvas"),
             trace_level=TraceLevel.INFO,
             enable_performance_monitoring=True,
             enable_error_tracking=True,
-            enable_state_tracking=True
+            enable_state_tracking=True,
+            export_jsonl_dir=os.getenv("OBSERVABILITY_EXPORT_DIR"),
+            otlp_endpoint=otlp_endpoint,
+            otlp_headers={k.strip(): v.strip() for k, v in otlp_headers.items()}
         )
         _global_observability_manager = ObservabilityManager(config)
+        atexit.register(_global_observability_manager.shutdown)
     
     return _global_observability_manager
 
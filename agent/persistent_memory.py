@@ -4,29 +4,116 @@ Vieira Pires Advogados - Knowledge Management System
 """
 
 import os
+import re
 import json
 import sqlite3
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 from enum import Enum
 from datetime import datetime, timedelta
 from dataclasses import dataclass, asdict
 import hashlib
 import pickle
 import asyncio
+import atexit
+import gzip
+import io
 import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict, defaultdict
 from pathlib import Path
 
 from dotenv import load_dotenv
 from langchain_core.tools import tool
 from langchain_core.embeddings import Embeddings
-from langchain_core.vectorstores import VectorStore
 from pydantic import BaseModel, Field
 
+from sqlite_pool import SQLiteConnectionManager, get_database_executor
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstandard = None
+    ZSTD_AVAILABLE = False
+
 load_dotenv()
 
 MEMORY_DIR = Path(os.getenv("MEMORY_DIR", "./memory"))
 MEMORY_DIR.mkdir(exist_ok=True)
 
+# Modo do índice vetorial: "flat" (força bruta), "ivf" (aproximado) ou "off"
+VECTOR_INDEX_MODE = os.getenv("MEMORY_VECTOR_INDEX", "flat")
+
+# Fração de vetores removidos (tombstones) acima da qual o índice vetorial
+# é regravado só com as linhas vivas e o IVF é retreinado
+VECTOR_TOMBSTONE_RATIO = 0.2
+
+# Entradas lidas e vetorizadas por vez ao indexar linhas antigas
+VECTOR_MIGRATION_BATCH_SIZE = 1000
+
+# Constante da Reciprocal Rank Fusion usada na busca híbrida
+RRF_K = 60
+
+# Entradas gravadas por transação ao restaurar backups
+RESTORE_BATCH_SIZE = 1000
+
+# Formato dos backups em streaming: cabeçalho + uma entrada JSON por linha
+BACKUP_FORMAT = "memory-ndjson"
+BACKUP_FORMAT_VERSION = 1
+
+# Páginas copiadas por passo da API de backup do SQLite; entre passos o
+# banco fica livre para escritas
+SNAPSHOT_PAGES_PER_STEP = 1024
+
+# Contadores de acesso ficam em memória e são gravados em lote a cada
+# intervalo (segundos) ou quando o buffer atinge o tamanho máximo
+ACCESS_FLUSH_INTERVAL = float(os.getenv("MEMORY_ACCESS_FLUSH_SECONDS", "5"))
+ACCESS_FLUSH_MAX_PENDING = 500
+# Após falhas de gravação, o intervalo dobra a cada tentativa até este teto
+ACCESS_FLUSH_MAX_BACKOFF = 300.0
+
+# Entradas mantidas no cache LRU de leituras por ID
+ENTRY_CACHE_SIZE = int(os.getenv("MEMORY_ENTRY_CACHE_SIZE", "1024"))
+
+# Pesos BM25 por coluna do índice FTS (title, content): títulos pesam mais
+BM25_WEIGHTS = (4.0, 1.0)
+
+# Palavras muito frequentes em português que não ajudam a discriminar
+# documentos e forçariam o BM25 a pontuar quase toda a base
+PORTUGUESE_STOPWORDS = frozenset({
+    "a", "ao", "aos", "as", "com", "da", "das", "de", "do", "dos", "e", "em",
+    "na", "nas", "no", "nos", "o", "os", "ou", "para", "pela", "pelas", "pelo",
+    "pelos", "por", "que", "se", "sem", "sob", "sobre", "um", "uma", "uns", "umas",
+})
+
+
+def _build_fts_query(query: str) -> str:
+    """Converte texto livre em expressão MATCH segura para FTS5.
+
+    Cada termo vira uma frase entre aspas, unidas por AND implícito, e o
+    último termo casa por prefixo. Stopwords são descartadas; acentos e
+    caixa são normalizados pelo tokenizador. Retorna "" se não sobrar
+    nenhum termo (consulta só com stopwords ou pontuação).
+    """
+    tokens = [
+        token for token in re.findall(r"\w+", query)
+        if token.lower() not in PORTUGUESE_STOPWORDS
+    ]
+    if not tokens:
+        return ""
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += "*"
+    return " ".join(terms)
+
 
 class MemoryType(Enum):
     CASE_LAW = "case_law"
@@ -44,6 +131,12 @@ class AccessLevel(Enum):
     RESTRICTED = "restricted"
 
 
+class StoreOutcome(Enum):
+    INSERTED = "inserted"
+    UPDATED = "updated"
+    ERROR = "error"
+
+
 @dataclass
 class MemoryEntry:
     """Entrada de memória persistente."""
@@ -72,113 +165,838 @@ class MemoryEntry:
         return data
 
 
+# Colunas de memory_entries na ordem esperada por _row_to_entry
+ENTRY_COLUMNS = (
+    "m.id, m.memory_type, m.title, m.content, m.tags, m.access_level, "
+    "m.created_at, m.updated_at, m.accessed_count, m.last_accessed, "
+    "m.source, m.confidence_score, m.metadata"
+)
+
+_MEMORY_TYPES = {member.value: member for member in MemoryType}
+_ACCESS_LEVELS = {member.value: member for member in AccessLevel}
+
+
+# ==================== ÍNDICE VETORIAL ====================
+
+def _normalize_text(text: str) -> List[str]:
+    """Minúsculas, sem acentos e sem stopwords."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    plain = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return [token for token in re.findall(r"\w+", plain) if token not in PORTUGUESE_STOPWORDS]
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Embeddings locais e determinísticos por feature hashing.
+    
+    Substituto offline para um modelo de embeddings: unigramas e bigramas
+    normalizados são projetados em um vetor de dimensão fixa com sinal
+    pseudoaleatório e normalizados em L2. Mesma entrada, mesmo vetor.
+    """
+    
+    def __init__(self, dimension: int = 256):
+        self.dimension = dimension
+    
+    def _embed(self, text: str) -> List[float]:
+        tokens = _normalize_text(text)
+        features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        
+        vector = [0.0] * self.dimension
+        for feature in features:
+            digest = zlib.crc32(feature.encode())
+            sign = 1.0 if digest & 0x80000000 else -1.0
+            vector[digest % self.dimension] += sign
+        
+        norm = sum(v * v for v in vector) ** 0.5
+        return [v / norm for v in vector] if norm else vector
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+    
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+class VectorIndex:
+    """
+    Índice vetorial mapeado em memória.
+    
+    Os vetores (float32, normalizados) ficam em `<base>.vec` e os IDs, um por
+    linha, em `<base>.vec.ids`. No modo "flat" a busca é exata por produto
+    interno; no modo "ivf" os vetores são agrupados por k-means e apenas os
+    `nprobe` grupos mais próximos da consulta são examinados.
+    
+    upsert sobrescreve a linha de um ID já indexado no próprio arquivo; delete
+    marca a linha como removida em `<base>.vec.deleted` e a busca a ignora.
+    Quando os removidos passam de VECTOR_TOMBSTONE_RATIO, os arquivos são
+    regravados sem eles e o IVF é retreinado na busca seguinte.
+    """
+    
+    def __init__(
+        self,
+        base_path: Path,
+        embeddings: Embeddings,
+        mode: str = "flat",
+        nprobe: int = 16,
+        min_ivf_size: int = 4096
+    ):
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("numpy é necessário para o índice vetorial")
+        if mode not in ("flat", "ivf"):
+            raise ValueError(f"Modo de índice vetorial inválido: {mode}")
+        
+        self.embeddings = embeddings
+        self.mode = mode
+        self.nprobe = nprobe
+        self.min_ivf_size = min_ivf_size
+        self.vectors_path = Path(f"{base_path}.vec")
+        self.ids_path = Path(f"{base_path}.vec.ids")
+        self.ivf_path = Path(f"{base_path}.vec.ivf.npz")
+        self.deleted_path = Path(f"{base_path}.vec.deleted")
+        self.compacting_path = Path(f"{base_path}.vec.compacting")
+        
+        self._lock = threading.Lock()
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._deleted = set()  # linhas removidas (tombstones)
+        self._live = None  # máscara das linhas vivas, recalculada sob demanda
+        self._matrix = None
+        self._dimension = None
+        self._centroids = None
+        self._assignments = None
+        self._inverted_lists = None
+        self._trained_count = 0
+        self._load()
+    
+    def __len__(self) -> int:
+        return len(self._ids) - len(self._deleted)
+    
+    def __contains__(self, memory_id: str) -> bool:
+        row = self._rows.get(memory_id)
+        return row is not None and row not in self._deleted
+    
+    def ids(self) -> List[str]:
+        """IDs indexados (sem os removidos)."""
+        return [memory_id for row, memory_id in enumerate(self._ids) if row not in self._deleted]
+    
+    def _load(self):
+        """Mapeia os arquivos existentes, descartando gravações incompletas."""
+        if self.compacting_path.exists():
+            # Compactação interrompida: os arquivos podem estar desalinhados, então
+            # o índice é descartado e refeito a partir do banco
+            for path in (self.vectors_path, self.ids_path, self.deleted_path, self.ivf_path,
+                         Path(f"{self.vectors_path}.tmp"), Path(f"{self.ids_path}.tmp")):
+                path.unlink(missing_ok=True)
+            self.compacting_path.unlink()
+        
+        ids = []
+        if self.ids_path.exists():
+            ids = self.ids_path.read_text(encoding="utf-8").splitlines()
+        
+        self._dimension = len(self.embeddings.embed_query("dimensao"))
+        row_bytes = self._dimension * 4
+        vector_rows = self.vectors_path.stat().st_size // row_bytes if self.vectors_path.exists() else 0
+        count = min(len(ids), vector_rows)
+        
+        # Alinhar os dois arquivos caso uma gravação tenha sido interrompida
+        if count < len(ids) or (self.vectors_path.exists() and
+                                self.vectors_path.stat().st_size != count * row_bytes):
+            ids = ids[:count]
+            self.ids_path.write_text("".join(f"{i}\n" for i in ids), encoding="utf-8")
+            with open(self.vectors_path, "r+b") as f:
+                f.truncate(count * row_bytes)
+        
+        self._ids = ids
+        self._rows = {memory_id: row for row, memory_id in enumerate(ids)}
+        self._deleted = set()
+        if self.deleted_path.exists():
+            self._deleted = {
+                self._rows[memory_id]
+                for memory_id in self.deleted_path.read_text(encoding="utf-8").splitlines()
+                if memory_id in self._rows
+            }
+        self._live = None
+        self._matrix = None
+        
+        if self.mode == "ivf" and self.ivf_path.exists():
+            saved = np.load(self.ivf_path)
+            if saved["centroids"].shape[1] == self._dimension and len(saved["assignments"]) <= count:
+                self._centroids = saved["centroids"]
+                self._assignments = saved["assignments"]
+                self._trained_count = int(saved["trained_count"])
+    
+    def _get_matrix(self):
+        """Retorna a matriz de vetores como memmap (somente leitura)."""
+        if self._matrix is None and self._ids:
+            self._matrix = np.memmap(
+                self.vectors_path, dtype=np.float32, mode="r",
+                shape=(len(self._ids), self._dimension)
+            )
+        return self._matrix
+    
+    def _live_mask(self):
+        """Máscara booleana das linhas não removidas."""
+        if self._live is None:
+            live = np.ones(len(self._ids), dtype=bool)
+            live[list(self._deleted)] = False
+            self._live = live
+        return self._live
+    
+    def add(self, ids: List[str], texts: List[str]) -> int:
+        """Adiciona vetores de forma incremental; IDs já indexados são ignorados."""
+        with self._lock:
+            pending = [(i, t) for i, t in zip(ids, texts) if i not in self]
+            if not pending:
+                return 0
+            return self._write([i for i, _ in pending], [t for _, t in pending])
+    
+    def upsert(self, ids: List[str], texts: List[str]) -> int:
+        """Indexa os textos, substituindo o vetor de IDs já indexados."""
+        with self._lock:
+            if not ids:
+                return 0
+            return self._write(list(ids), list(texts))
+    
+    def _write(self, ids: List[str], texts: List[str]) -> int:
+        """Sobrescreve as linhas de IDs conhecidos e anexa as dos novos (com o lock)."""
+        latest = {memory_id: i for i, memory_id in enumerate(ids)}  # repetidos: vale o último
+        vectors = np.asarray(
+            self.embeddings.embed_documents([texts[i] for i in latest.values()]), dtype=np.float32
+        )
+        existing, new = [], []
+        for position, memory_id in enumerate(latest):
+            row = self._rows.get(memory_id)
+            if row is None:
+                new.append((memory_id, position))
+            else:
+                existing.append((row, position))
+        
+        if existing:
+            row_bytes = self._dimension * 4
+            with open(self.vectors_path, "r+b") as f:
+                for row, position in sorted(existing):
+                    f.seek(row * row_bytes)
+                    f.write(vectors[position].tobytes())
+            
+            revived = {row for row, _ in existing} & self._deleted
+            if revived:
+                self._deleted -= revived
+                self._save_tombstones()
+            
+            if self._assignments is not None:
+                # Linhas já atribuídas mudam de grupo conforme o novo vetor
+                assigned = [(row, position) for row, position in existing if row < len(self._assignments)]
+                if assigned:
+                    rows, positions = zip(*assigned)
+                    self._assignments[list(rows)] = self._assign(vectors[list(positions)])
+                    self._inverted_lists = None
+                    self._save_ivf()
+        
+        if new:
+            with open(self.vectors_path, "ab") as f:
+                f.write(vectors[[position for _, position in new]].tobytes())
+            with open(self.ids_path, "a", encoding="utf-8") as f:
+                f.write("".join(f"{memory_id}\n" for memory_id, _ in new))
+            for memory_id, _ in new:
+                self._rows[memory_id] = len(self._ids)
+                self._ids.append(memory_id)
+        
+        # Remapear na próxima busca para enxergar as linhas novas e alteradas
+        self._matrix = None
+        self._live = None
+        return len(latest)
+    
+    def delete(self, ids: List[str]) -> int:
+        """Marca vetores como removidos; compacta o índice se houver removidos demais."""
+        with self._lock:
+            rows = {self._rows[i] for i in ids if i in self._rows} - self._deleted
+            if not rows:
+                return 0
+            
+            self._deleted |= rows
+            self._live = None
+            self._save_tombstones()
+            if len(self._deleted) > VECTOR_TOMBSTONE_RATIO * len(self._ids):
+                self._compact()
+            return len(rows)
+    
+    def _save_tombstones(self):
+        """Regrava a lista de IDs removidos (troca atômica do arquivo)."""
+        if not self._deleted:
+            self.deleted_path.unlink(missing_ok=True)
+            return
+        tmp_path = Path(f"{self.deleted_path}.tmp")
+        tmp_path.write_text(
+            "".join(f"{self._ids[row]}\n" for row in sorted(self._deleted)), encoding="utf-8"
+        )
+        os.replace(tmp_path, self.deleted_path)
+    
+    def _compact(self):
+        """Regrava os arquivos só com as linhas vivas e descarta o IVF (com o lock)."""
+        keep = np.flatnonzero(self._live_mask())
+        matrix = self._get_matrix()
+        ids = [self._ids[row] for row in keep]
+        
+        tmp_vectors = Path(f"{self.vectors_path}.tmp")
+        tmp_ids = Path(f"{self.ids_path}.tmp")
+        with open(tmp_vectors, "wb") as f:
+            for start in range(0, len(keep), 65536):
+                f.write(np.asarray(matrix[keep[start:start + 65536]], dtype=np.float32).tobytes())
+        tmp_ids.write_text("".join(f"{memory_id}\n" for memory_id in ids), encoding="utf-8")
+        
+        # Soltar o mapeamento antes de substituir o arquivo
+        del matrix
+        self._matrix = None
+        
+        self.compacting_path.touch()
+        os.replace(tmp_vectors, self.vectors_path)
+        os.replace(tmp_ids, self.ids_path)
+        self.deleted_path.unlink(missing_ok=True)
+        self.ivf_path.unlink(missing_ok=True)
+        self.compacting_path.unlink()
+        
+        self._ids = ids
+        self._rows = {memory_id: row for row, memory_id in enumerate(ids)}
+        self._deleted = set()
+        self._live = None
+        self._centroids = None
+        self._assignments = None
+        self._inverted_lists = None
+        self._trained_count = 0
+    
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Retorna (id, similaridade de cosseno) dos k vetores mais próximos."""
+        with self._lock:
+            matrix = self._get_matrix()
+            if matrix is None or k <= 0:
+                return []
+            
+            q = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+            
+            if self.mode == "ivf" and self._ensure_ivf(matrix):
+                centroid_scores = self._centroids @ q
+                probe = np.argsort(-centroid_scores)[:self.nprobe]
+                order, bounds = self._inverted_lists
+                candidates = np.concatenate([order[bounds[c]:bounds[c + 1]] for c in probe])
+                if self._deleted:
+                    candidates = candidates[self._live_mask()[candidates]]
+                if len(candidates) == 0:
+                    return []
+                scores = matrix[candidates] @ q
+            else:
+                candidates = None
+                scores = matrix @ q
+                if self._deleted:
+                    scores[~self._live_mask()] = -np.inf
+            
+            k = min(k, len(scores), len(self))
+            if k <= 0:
+                return []
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            rows = candidates[top] if candidates is not None else top
+            return [(self._ids[row], float(scores[i])) for row, i in zip(rows, top)]
+    
+    # ---------- IVF ----------
+    
+    def _ensure_ivf(self, matrix) -> bool:
+        """Treina (ou estende) o IVF; retorna False se a base é pequena demais."""
+        count = len(matrix)
+        if self._centroids is None or count > 4 * self._trained_count:
+            # Retreinar quando a base cresce muito além da amostra original
+            if count < self.min_ivf_size:
+                return False
+            self._train_ivf(matrix)
+        
+        if len(self._assignments) < count:
+            extra = self._assign(matrix[len(self._assignments):])
+            self._assignments = np.concatenate([self._assignments, extra])
+            self._inverted_lists = None
+        
+        if self._inverted_lists is None:
+            order = np.argsort(self._assignments, kind="stable")
+            bounds = np.searchsorted(
+                self._assignments[order], np.arange(len(self._centroids) + 1)
+            )
+            self._inverted_lists = (order, bounds)
+        return True
+    
+    def _assign(self, vectors):
+        """Atribui cada vetor ao centroide mais próximo (em blocos)."""
+        result = []
+        for start in range(0, len(vectors), 65536):
+            block = np.asarray(vectors[start:start + 65536])
+            result.append(np.argmax(block @ self._centroids.T, axis=1).astype(np.int32))
+        return np.concatenate(result) if result else np.empty(0, dtype=np.int32)
+    
+    def _train_ivf(self, matrix, iterations: int = 10, seed: int = 0):
+        """k-means esférico sobre uma amostra; nlist ~ sqrt(n)."""
+        count = len(matrix)
+        nlist = max(8, int(count ** 0.5))
+        rng = np.random.default_rng(seed)
+        sample_size = min(count, nlist * 64)
+        sample = np.asarray(matrix[np.sort(rng.choice(count, sample_size, replace=False))])
+        
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # Grupos vazios mantêm o centroide anterior
+            centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+        
+        self._centroids = centroids.astype(np.float32)
+        self._assignments = self._assign(matrix)
+        self._inverted_lists = None
+        self._trained_count = count
+        self._save_ivf()
+    
+    def _save_ivf(self):
+        np.savez(
+            self.ivf_path, centroids=self._centroids,
+            assignments=self._assignments, trained_count=self._trained_count
+        )
+
+
+# ==================== MEMÓRIA PERSISTENTE ====================
+
 class PersistentMemorySystem:
     """Sistema de memória persistente avançado."""
     
-    def __init__(self, db_path: str = None):
+    def __init__(
+        self,
+        db_path: str = None,
+        embeddings: Embeddings = None,
+        vector_index_mode: str = None
+    ):
         self.db_path = db_path or str(MEMORY_DIR / "legal_memory.db")
-        self._local = threading.local()
+        self._connections = SQLiteConnectionManager(self.db_path)
+        self._executor = get_database_executor()
+        self._fts_enabled = False
+        self._access_lock = threading.Lock()
+        self._pending_access: Dict[str, Tuple[int, datetime]] = {}
+        self._access_flush_timer: Optional[threading.Timer] = None
+        self._access_flush_failures = 0
+        self._cache_lock = threading.Lock()
+        self._entry_cache: "OrderedDict[str, MemoryEntry]" = OrderedDict()
+        self._cache_generation = 0  # incrementada a cada invalidação
         self._init_database()
+        self.vector_index = self._init_vector_index(
+            embeddings or HashingEmbeddings(),
+            vector_index_mode or VECTOR_INDEX_MODE
+        )
         
-    def _get_connection(self) -> sqlite3.Connection:
-        """Obtém conexão thread-safe."""
-        if not hasattr(self._local, 'connection'):
-            self._local.connection = sqlite3.connect(
-                self.db_path,
-                check_same_thread=False,
-                timeout=30.0
-            )
-            self._local.connection.row_factory = sqlite3.Row
-        return self._local.connection
-    
     def _init_database(self):
         """Inicializa o banco de dados."""
-        conn = self._get_connection()
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS memory_entries (
-                id TEXT PRIMARY KEY,
-                memory_type TEXT NOT NULL,
-                title TEXT NOT NULL,
-                content TEXT NOT NULL,
-                tags TEXT NOT NULL,
-                access_level TEXT NOT NULL,
-                created_at TIMESTAMP NOT NULL,
-                updated_at TIMESTAMP NOT NULL,
-                accessed_count INTEGER DEFAULT 0,
-                last_accessed TIMESTAMP,
-                source TEXT,
-                confidence_score REAL DEFAULT 1.0,
-                metadata TEXT,
-                content_hash TEXT
-            )
-        """)
-        
-        # Índices para performance
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_memory_type ON memory_entries(memory_type)")
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_tags ON memory_entries(tags)")
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_access_level ON memory_entries(access_level)")
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_created_at ON memory_entries(created_at)")
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_content_hash ON memory_entries(content_hash)")
-        
-        conn.commit()
+        with self._connections.connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS memory_entries (
+                    id TEXT PRIMARY KEY,
+                    memory_type TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    tags TEXT NOT NULL,
+                    access_level TEXT NOT NULL,
+                    created_at TIMESTAMP NOT NULL,
+                    updated_at TIMESTAMP NOT NULL,
+                    accessed_count INTEGER DEFAULT 0,
+                    last_accessed TIMESTAMP,
+                    source TEXT,
+                    confidence_score REAL DEFAULT 1.0,
+                    metadata TEXT,
+                    content_hash TEXT
+                )
+            """)
+            
+            # Índices para performance
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_memory_type ON memory_entries(memory_type)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_access_level ON memory_entries(access_level)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_created_at ON memory_entries(created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_content_hash ON memory_entries(content_hash)")
+            
+            self._fts_enabled = self._init_fts_index(conn)
+            self._init_tag_index(conn)
+            self._init_stats_counters(conn)
+            
+            conn.commit()
     
-    def store_memory(self, entry: MemoryEntry) -> bool:
-        """Armazena entrada de memória."""
+    def _init_fts_index(self, conn: sqlite3.Connection) -> bool:
+        """Cria o índice FTS5 sincronizado por triggers.
+        
+        O tokenizador unicode61 com remove_diacritics remove acentos, de modo
+        que "tributária" e "tributaria" casam entre si. Em bancos existentes o
+        índice é populado uma única vez a partir de memory_entries.
+        """
         try:
-            conn = self._get_connection()
+            exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'memory_fts'"
+            ).fetchone()
             
-            # Calcular hash do conteúdo para deduplicação
-            content_hash = hashlib.sha256(
-                (entry.title + entry.content).encode()
-            ).hexdigest()
+            conn.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS memory_fts USING fts5(
+                    title,
+                    content,
+                    content='memory_entries',
+                    content_rowid='rowid',
+                    tokenize='unicode61 remove_diacritics 2',
+                    prefix='2 3'
+                )
+            """)
+            conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS memory_fts_ai AFTER INSERT ON memory_entries BEGIN
+                    INSERT INTO memory_fts(rowid, title, content)
+                    VALUES (new.rowid, new.title, new.content);
+                END
+            """)
+            conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS memory_fts_ad AFTER DELETE ON memory_entries BEGIN
+                    INSERT INTO memory_fts(memory_fts, rowid, title, content)
+                    VALUES ('delete', old.rowid, old.title, old.content);
+                END
+            """)
+            conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS memory_fts_au AFTER UPDATE OF title, content ON memory_entries BEGIN
+                    INSERT INTO memory_fts(memory_fts, rowid, title, content)
+                    VALUES ('delete', old.rowid, old.title, old.content);
+                    INSERT INTO memory_fts(rowid, title, content)
+                    VALUES (new.rowid, new.title, new.content);
+                END
+            """)
             
-            # Verificar duplicatas
-            existing = conn.execute(
-                "SELECT id FROM memory_entries WHERE content_hash = ?",
-                (content_hash,)
-            ).fetchone()
+            if not exists:
+                # Migração: indexar entradas gravadas antes do FTS existir
+                conn.execute("INSERT INTO memory_fts(memory_fts) VALUES ('rebuild')")
             
-            if existing:
-                # Atualizar entrada existente
-                return self._update_existing_memory(existing['id'], entry)
+            return True
             
-            # Inserir nova entrada
+        except sqlite3.OperationalError as e:
+            print(f"FTS5 indisponível, usando busca por LIKE: {e}")
+            return False
+    
+    def _init_tag_index(self, conn: sqlite3.Connection):
+        """Cria a tabela normalizada de tags sincronizada por triggers.
+        
+        Cada tag vira uma linha (tag, memory_id), em minúsculas, servida pela
+        chave primária composta. Em bancos existentes a tabela é populada uma
+        única vez a partir da coluna JSON memory_entries.tags.
+        """
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'memory_tags'"
+        ).fetchone()
+        
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS memory_tags (
+                tag TEXT NOT NULL,
+                memory_id TEXT NOT NULL,
+                PRIMARY KEY (tag, memory_id)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_memory_tags_memory_id ON memory_tags(memory_id)")
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS memory_tags_ai AFTER INSERT ON memory_entries BEGIN
+                INSERT OR IGNORE INTO memory_tags(tag, memory_id)
+                SELECT lower(trim(value)), new.id FROM json_each(new.tags)
+                WHERE trim(value) != '';
+            END
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS memory_tags_ad AFTER DELETE ON memory_entries BEGIN
+                DELETE FROM memory_tags WHERE memory_id = old.id;
+            END
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS memory_tags_au AFTER UPDATE OF tags ON memory_entries BEGIN
+                DELETE FROM memory_tags WHERE memory_id = old.id;
+                INSERT OR IGNORE INTO memory_tags(tag, memory_id)
+                SELECT lower(trim(value)), new.id FROM json_each(new.tags)
+                WHERE trim(value) != '';
+            END
+        """)
+        
+        # O índice sobre o JSON bruto não atende filtros por tag
+        conn.execute("DROP INDEX IF EXISTS idx_tags")
+        
+        if not exists:
+            # Migração: extrair tags da coluna JSON das entradas existentes
             conn.execute("""
-                INSERT INTO memory_entries 
-                (id, memory_type, title, content, tags, access_level, created_at, 
-                 updated_at, source, confidence_score, metadata, content_hash)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                entry.id, entry.memory_type.value, entry.title, entry.content,
-                json.dumps(entry.tags), entry.access_level.value,
-                entry.created_at, entry.updated_at, entry.source,
-                entry.confidence_score, json.dumps(entry.metadata or {}),
-                content_hash
-            ))
+                INSERT OR IGNORE INTO memory_tags(tag, memory_id)
+                SELECT lower(trim(j.value)), m.id
+                FROM memory_entries m, json_each(m.tags) j
+                WHERE json_valid(m.tags) AND trim(j.value) != ''
+            """)
+    
+    def _init_stats_counters(self, conn: sqlite3.Connection):
+        """Cria os contadores de estatísticas mantidos por triggers.
+        
+        memory_counters guarda o total e a contagem por tipo; memory_daily_counts
+        guarda inserções por dia de created_at. Como os triggers rodam na mesma
+        transação da escrita, os contadores nunca divergem da tabela.
+        """
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'memory_counters'"
+        ).fetchone()
+        
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS memory_counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            ) WITHOUT ROWID
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS memory_daily_counts (
+                day TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            ) WITHOUT ROWID
+        """)
+        
+        increment = """
+            INSERT INTO memory_counters(name, value) VALUES ('total', {d}), ('type:' || {row}.memory_type, {d})
+            ON CONFLICT(name) DO UPDATE SET value = value + excluded.value;
+            INSERT INTO memory_daily_counts(day, value) VALUES (substr({row}.created_at, 1, 10), {d})
+            ON CONFLICT(day) DO UPDATE SET value = value + excluded.value;
+        """
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS memory_counters_ai AFTER INSERT ON memory_entries BEGIN
+                {increment.format(row="new", d=1)}
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS memory_counters_ad AFTER DELETE ON memory_entries BEGIN
+                {increment.format(row="old", d=-1)}
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS memory_counters_au
+            AFTER UPDATE OF memory_type, created_at ON memory_entries BEGIN
+                {increment.format(row="old", d=-1)}
+                {increment.format(row="new", d=1)}
+            END
+        """)
+        
+        if not exists:
+            # Migração: contar as entradas existentes uma única vez
+            conn.execute("""
+                INSERT INTO memory_counters(name, value)
+                SELECT 'total', COUNT(*) FROM memory_entries
+                UNION ALL
+                SELECT 'type:' || memory_type, COUNT(*) FROM memory_entries GROUP BY memory_type
+            """)
+            conn.execute("""
+                INSERT INTO memory_daily_counts(day, value)
+                SELECT substr(created_at, 1, 10), COUNT(*) FROM memory_entries
+                GROUP BY substr(created_at, 1, 10)
+            """)
+    
+    def _init_vector_index(self, embeddings: Embeddings, mode: str) -> Optional[VectorIndex]:
+        """Abre o índice vetorial ao lado do banco e indexa entradas faltantes."""
+        if mode == "off" or not NUMPY_AVAILABLE:
+            return None
+        
+        try:
+            index = VectorIndex(Path(self.db_path).with_suffix(""), embeddings, mode=mode)
+            
+            with self._connections.connection() as conn:
+                total = conn.execute("SELECT COUNT(*) FROM memory_entries").fetchone()[0]
+                if total != len(index):
+                    # Entradas removidas do banco sem passar por delete_memories
+                    db_ids = {row["id"] for row in conn.execute("SELECT id FROM memory_entries")}
+                    stale = [memory_id for memory_id in index.ids() if memory_id not in db_ids]
+                    if stale:
+                        index.delete(stale)
+                    
+                    # Migração: vetorizar entradas gravadas antes do índice existir,
+                    # lendo o banco em lotes para não carregá-lo inteiro na memória
+                    cursor = conn.execute("SELECT id, title, content FROM memory_entries")
+                    while True:
+                        rows = cursor.fetchmany(VECTOR_MIGRATION_BATCH_SIZE)
+                        if not rows:
+                            break
+                        batch = [row for row in rows if row["id"] not in index]
+                        if batch:
+                            index.add(
+                                [row["id"] for row in batch],
+                                [f"{row['title']}\n{row['content']}" for row in batch]
+                            )
+                return index
             
+        except Exception as e:
+            print(f"Índice vetorial indisponível: {e}")
+            return None
+    
+    def rebuild_fts_index(self):
+        """Reconstrói o índice FTS (ex.: após VACUUM, que pode renumerar rowids)."""
+        if not self._fts_enabled:
+            return
+        with self._connections.connection() as conn:
+            conn.execute("INSERT INTO memory_fts(memory_fts) VALUES ('rebuild')")
             conn.commit()
-            return True
+    
+    def store_memory(self, entry: MemoryEntry) -> bool:
+        """Armazena entrada de memória."""
+        _, outcome = self.store_memories_bulk([entry])[0]
+        return outcome != StoreOutcome.ERROR
+    
+    def store_memories_bulk(self, entries: List[MemoryEntry]) -> List[Tuple[str, StoreOutcome]]:
+        """
+        Armazena um lote de entradas em uma única transação.
+        
+        A deduplicação por content_hash é feita para o lote inteiro em uma
+        consulta; entradas novas são inseridas com executemany e duplicatas
+        atualizam a entrada existente, como em store_memory. Retorna, na
+        ordem de entrada, (id, resultado) para cada item.
+        """
+        if not entries:
+            return []
+        
+        # Calcular hash do conteúdo para deduplicação
+        hashes = [
+            hashlib.sha256((entry.title + entry.content).encode()).hexdigest()
+            for entry in entries
+        ]
+        outcomes: List[StoreOutcome] = []
+        
+        try:
+            with self._connections.connection() as conn:
+                # Verificar duplicatas e IDs já usados do lote inteiro de uma vez
+                existing_by_hash = {
+                    row['content_hash']: row['id'] for row in conn.execute(
+                        "SELECT content_hash, id FROM memory_entries "
+                        "WHERE content_hash IN (SELECT value FROM json_each(?))",
+                        (json.dumps(hashes),)
+                    )
+                }
+                taken_ids = {
+                    row['id'] for row in conn.execute(
+                        "SELECT id FROM memory_entries WHERE id IN (SELECT value FROM json_each(?))",
+                        (json.dumps([entry.id for entry in entries]),)
+                    )
+                }
+                
+                inserts, updates, inserted = [], [], []
+                for entry, content_hash in zip(entries, hashes):
+                    existing_id = existing_by_hash.get(content_hash)
+                    if existing_id is not None:
+                        # Atualizar entrada existente (inclusive repetidas no lote)
+                        updates.append((datetime.now(), entry.confidence_score, existing_id))
+                        outcomes.append(StoreOutcome.UPDATED)
+                    elif entry.id in taken_ids:
+                        # Mesmo ID com conteúdo diferente violaria a chave primária
+                        outcomes.append(StoreOutcome.ERROR)
+                    else:
+                        inserts.append((
+                            entry.id, entry.memory_type.value, entry.title, entry.content,
+                            json.dumps(entry.tags), entry.access_level.value,
+                            entry.created_at, entry.updated_at, entry.accessed_count,
+                            entry.last_accessed, entry.source, entry.confidence_score,
+                            json.dumps(entry.metadata or {}), content_hash
+                        ))
+                        existing_by_hash[content_hash] = entry.id
+                        taken_ids.add(entry.id)
+                        inserted.append(entry)
+                        outcomes.append(StoreOutcome.INSERTED)
+                
+                with conn:
+                    conn.executemany("""
+                        INSERT INTO memory_entries 
+                        (id, memory_type, title, content, tags, access_level, created_at, 
+                         updated_at, accessed_count, last_accessed, source, confidence_score,
+                         metadata, content_hash)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """, inserts)
+                    conn.executemany("""
+                        UPDATE memory_entries SET
+                            updated_at = ?,
+                            accessed_count = accessed_count + 1,
+                            confidence_score = MAX(confidence_score, ?)
+                        WHERE id = ?
+                    """, updates)
+                self._invalidate_cache(memory_id for _, _, memory_id in updates)
             
         except Exception as e:
             print(f"Erro ao armazenar memória: {e}")
-            return False
+            return [(entry.id, StoreOutcome.ERROR) for entry in entries]
+        
+        if self.vector_index is not None and inserted:
+            try:
+                self.vector_index.add(
+                    [entry.id for entry in inserted],
+                    [f"{entry.title}\n{entry.content}" for entry in inserted]
+                )
+            except Exception as e:
+                # O índice é completado a partir do banco na próxima abertura
+                print(f"Erro ao atualizar índice vetorial: {e}")
+        
+        return [(entry.id, outcome) for entry, outcome in zip(entries, outcomes)]
     
-    def _update_existing_memory(self, memory_id: str, entry: MemoryEntry) -> bool:
-        """Atualiza entrada existente."""
+    def update_memory(self, entry: MemoryEntry) -> bool:
+        """Substitui o conteúdo de uma entrada existente e o seu vetor no índice."""
+        content_hash = hashlib.sha256((entry.title + entry.content).encode()).hexdigest()
         try:
-            conn = self._get_connection()
-            conn.execute("""
-                UPDATE memory_entries SET
-                    updated_at = ?,
-                    accessed_count = accessed_count + 1,
-                    confidence_score = MAX(confidence_score, ?)
-                WHERE id = ?
-            """, (datetime.now(), entry.confidence_score, memory_id))
+            with self._connections.connection() as conn:
+                with conn:
+                    cursor = conn.execute("""
+                        UPDATE memory_entries SET
+                            memory_type = ?, title = ?, content = ?, tags = ?, access_level = ?,
+                            updated_at = ?, source = ?, confidence_score = ?, metadata = ?,
+                            content_hash = ?
+                        WHERE id = ?
+                    """, (
+                        entry.memory_type.value, entry.title, entry.content,
+                        json.dumps(entry.tags), entry.access_level.value, datetime.now(),
+                        entry.source, entry.confidence_score, json.dumps(entry.metadata or {}),
+                        content_hash, entry.id
+                    ))
+                self._invalidate_cache([entry.id])
+                if cursor.rowcount == 0:
+                    return False
             
-            conn.commit()
-            return True
-        except Exception:
+        except Exception as e:
+            print(f"Erro ao atualizar memória: {e}")
             return False
+        
+        if self.vector_index is not None:
+            try:
+                self.vector_index.upsert([entry.id], [f"{entry.title}\n{entry.content}"])
+            except Exception as e:
+                print(f"Erro ao atualizar índice vetorial: {e}")
+                # Sem o vetor antigo, a próxima abertura reindexa a entrada
+                try:
+                    self.vector_index.delete([entry.id])
+                except Exception:
+                    pass
+        return True
+    
+    def delete_memories(self, memory_ids: List[str]) -> int:
+        """Remove entradas e seus vetores; retorna quantas existiam."""
+        if not memory_ids:
+            return 0
+        
+        try:
+            with self._connections.connection() as conn:
+                with conn:
+                    cursor = conn.execute(
+                        "DELETE FROM memory_entries WHERE id IN (SELECT value FROM json_each(?))",
+                        (json.dumps(list(memory_ids)),)
+                    )
+                self._invalidate_cache(memory_ids)
+                deleted = cursor.rowcount
+            
+        except Exception as e:
+            print(f"Erro ao remover memória: {e}")
+            return 0
+        
+        if self.vector_index is not None:
+            try:
+                self.vector_index.delete(memory_ids)
+            except Exception as e:
+                # Vetores órfãos são descartados na próxima abertura
+                print(f"Erro ao atualizar índice vetorial: {e}")
+        return deleted
+    
+    def delete_memory(self, memory_id: str) -> bool:
+        """Remove uma entrada de memória."""
+        return self.delete_memories([memory_id]) > 0
     
     def search_memories(
         self,
@@ -186,113 +1004,489 @@ class PersistentMemorySystem:
         memory_types: List[MemoryType] = None,
         tags: List[str] = None,
         access_level: AccessLevel = AccessLevel.PUBLIC,
-        limit: int = 10
+        limit: int = 10,
+        tag_mode: str = "all"
     ) -> List[MemoryEntry]:
-        """Busca entradas de memória."""
+        """Busca entradas de memória.
+        
+        Com tag_mode="all" a entrada precisa ter todas as tags informadas;
+        com tag_mode="any", basta uma delas. Tags casam por igualdade exata,
+        sem diferenciar maiúsculas.
+        """
+        if tag_mode not in ("all", "any"):
+            raise ValueError(f"tag_mode inválido: {tag_mode}")
+        
+        fts_query = _build_fts_query(query) if self._fts_enabled and query else ""
+        if fts_query == "" and self._fts_enabled and query and query.strip():
+            # Consulta sem termos úteis não é "sem consulta": não lista a base inteira
+            return []
+        
         try:
-            conn = self._get_connection()
-            
-            sql = """
-                SELECT * FROM memory_entries 
-                WHERE (title LIKE ? OR content LIKE ?)
-            """
-            params = [f"%{query}%", f"%{query}%"]
-            
-            if memory_types:
-                placeholders = ",".join("?" * len(memory_types))
-                sql += f" AND memory_type IN ({placeholders})"
-                params.extend([mt.value for mt in memory_types])
-            
-            if tags:
-                for tag in tags:
-                    sql += " AND tags LIKE ?"
-                    params.append(f"%{tag}%")
-            
-            sql += " AND access_level IN (?, ?)"
-            params.extend([AccessLevel.PUBLIC.value, access_level.value])
-            
-            sql += " ORDER BY confidence_score DESC, accessed_count DESC LIMIT ?"
-            params.append(limit)
-            
-            rows = conn.execute(sql, params).fetchall()
-            
-            memories = []
-            for row in rows:
-                memory = MemoryEntry(
-                    id=row['id'],
-                    memory_type=MemoryType(row['memory_type']),
-                    title=row['title'],
-                    content=row['content'],
-                    tags=json.loads(row['tags']),
-                    access_level=AccessLevel(row['access_level']),
-                    created_at=datetime.fromisoformat(row['created_at']),
-                    updated_at=datetime.fromisoformat(row['updated_at']),
-                    accessed_count=row['accessed_count'],
-                    last_accessed=datetime.fromisoformat(row['last_accessed']) if row['last_accessed'] else None,
-                    source=row['source'],
-                    confidence_score=row['confidence_score'],
-                    metadata=json.loads(row['metadata']) if row['metadata'] else {}
+            with self._connections.connection() as conn:
+                
+                if fts_query:
+                    sql = f"""
+                        SELECT {ENTRY_COLUMNS} FROM memory_fts
+                        JOIN memory_entries m ON m.rowid = memory_fts.rowid
+                        WHERE memory_fts MATCH ?
+                    """
+                    params = [fts_query]
+                elif query and not self._fts_enabled:
+                    sql = f"""
+                        SELECT {ENTRY_COLUMNS} FROM memory_entries m
+                        WHERE (title LIKE ? OR content LIKE ?)
+                    """
+                    params = [f"%{query}%", f"%{query}%"]
+                else:
+                    sql = f"SELECT {ENTRY_COLUMNS} FROM memory_entries m WHERE 1=1"
+                    params = []
+                
+                filter_sql, filter_params = self._filter_clauses(
+                    memory_types, tags, access_level, tag_mode
                 )
-                memories.append(memory)
-            
-            return memories
+                sql += filter_sql
+                params.extend(filter_params)
+                
+                if fts_query:
+                    # bm25() retorna valores menores para documentos mais relevantes
+                    sql += " ORDER BY bm25(memory_fts, ?, ?), m.confidence_score DESC LIMIT ?"
+                    params.extend(BM25_WEIGHTS)
+                else:
+                    sql += " ORDER BY m.confidence_score DESC, m.accessed_count DESC LIMIT ?"
+                params.append(limit)
+                
+                rows = conn.execute(sql, params).fetchall()
+                return [self._row_to_entry(row) for row in rows]
             
         except Exception as e:
             print(f"Erro na busca: {e}")
             return []
     
+    def vector_search(
+        self,
+        query: str,
+        memory_types: List[MemoryType] = None,
+        tags: List[str] = None,
+        access_level: AccessLevel = AccessLevel.PUBLIC,
+        limit: int = 10,
+        tag_mode: str = "all"
+    ) -> List[MemoryEntry]:
+        """Busca por similaridade vetorial, aplicando os mesmos filtros."""
+        if tag_mode not in ("all", "any"):
+            raise ValueError(f"tag_mode inválido: {tag_mode}")
+        if self.vector_index is None or not query:
+            return []
+        
+        # Buscar mais candidatos que o limite para compensar os filtros
+        hits = [
+            (memory_id, score)
+            for memory_id, score in self.vector_index.search(query, k=max(limit * 4, 20))
+            if score > 0
+        ]
+        entries = self._load_filtered(
+            [memory_id for memory_id, _ in hits], memory_types, tags, access_level, tag_mode
+        )
+        return [entries[memory_id] for memory_id, _ in hits if memory_id in entries][:limit]
+    
+    def hybrid_search(
+        self,
+        query: str,
+        memory_types: List[MemoryType] = None,
+        tags: List[str] = None,
+        access_level: AccessLevel = AccessLevel.PUBLIC,
+        limit: int = 10,
+        tag_mode: str = "all",
+        vector_weight: float = 0.5
+    ) -> List[MemoryEntry]:
+        """
+        Combina busca lexical (BM25) e vetorial via Reciprocal Rank Fusion.
+        
+        Cada lista contribui com peso / (RRF_K + posição); vector_weight
+        controla a parcela da busca vetorial (0 = só lexical, 1 = só vetorial).
+        """
+        pool = max(limit * 4, 20)
+        lexical = self.search_memories(
+            query, memory_types, tags, access_level, limit=pool, tag_mode=tag_mode
+        )
+        vector = self.vector_search(
+            query, memory_types, tags, access_level, limit=pool, tag_mode=tag_mode
+        )
+        
+        scores = defaultdict(float)
+        entries = {}
+        for weight, ranking in ((1.0 - vector_weight, lexical), (vector_weight, vector)):
+            for rank, memory in enumerate(ranking):
+                scores[memory.id] += weight / (RRF_K + rank + 1)
+                entries[memory.id] = memory
+        
+        ranked = sorted(scores, key=scores.get, reverse=True)
+        return [entries[memory_id] for memory_id in ranked[:limit]]
+    
+    def _filter_clauses(
+        self,
+        memory_types: Optional[List[MemoryType]],
+        tags: Optional[List[str]],
+        access_level: AccessLevel,
+        tag_mode: str
+    ) -> Tuple[str, List[Any]]:
+        """Monta as cláusulas WHERE comuns (alias m para memory_entries)."""
+        sql = ""
+        params: List[Any] = []
+        
+        if memory_types:
+            placeholders = ",".join("?" * len(memory_types))
+            sql += f" AND m.memory_type IN ({placeholders})"
+            params.extend([mt.value for mt in memory_types])
+        
+        if tags:
+            unique_tags = list({tag.strip().lower(): tag for tag in tags}.values())
+            placeholders = ",".join("lower(trim(?))" for _ in unique_tags)
+            sql += f" AND m.id IN (SELECT memory_id FROM memory_tags WHERE tag IN ({placeholders})"
+            params.extend(unique_tags)
+            if tag_mode == "all":
+                sql += " GROUP BY memory_id HAVING COUNT(*) = ?"
+                params.append(len(unique_tags))
+            sql += ")"
+        
+        # "+" impede o uso de idx_access_level, pouco seletivo, como
+        # índice principal quando há filtros melhores (FTS, tags)
+        sql += " AND +m.access_level IN (?, ?)"
+        params.extend([AccessLevel.PUBLIC.value, access_level.value])
+        
+        return sql, params
+    
+    def _load_filtered(
+        self,
+        memory_ids: List[str],
+        memory_types: Optional[List[MemoryType]],
+        tags: Optional[List[str]],
+        access_level: AccessLevel,
+        tag_mode: str
+    ) -> Dict[str, MemoryEntry]:
+        """Carrega entradas por ID, descartando as que não passam nos filtros."""
+        if not memory_ids:
+            return {}
+        
+        try:
+            with self._connections.connection() as conn:
+                placeholders = ",".join("?" * len(memory_ids))
+                filter_sql, filter_params = self._filter_clauses(
+                    memory_types, tags, access_level, tag_mode
+                )
+                rows = conn.execute(
+                    f"SELECT {ENTRY_COLUMNS} FROM memory_entries m "
+                    f"WHERE m.id IN ({placeholders}){filter_sql}",
+                    [*memory_ids, *filter_params]
+                ).fetchall()
+                return {row[0]: self._row_to_entry(row) for row in rows}
+            
+        except Exception as e:
+            print(f"Erro ao carregar memórias: {e}")
+            return {}
+    
+    @staticmethod
+    def _row_to_entry(row: sqlite3.Row) -> MemoryEntry:
+        """
+        Converte uma linha selecionada com ENTRY_COLUMNS em MemoryEntry.
+        
+        Acesso posicional, enums por dicionário e JSON vazio ("[]", "{}")
+        sem passar por json.loads, que domina o custo em leituras grandes.
+        """
+        (memory_id, memory_type, title, content, tags, access_level,
+         created_at, updated_at, accessed_count, last_accessed,
+         source, confidence_score, metadata) = row
+        return MemoryEntry(
+            id=memory_id,
+            memory_type=_MEMORY_TYPES[memory_type],
+            title=title,
+            content=content,
+            tags=json.loads(tags) if tags != "[]" else [],
+            access_level=_ACCESS_LEVELS[access_level],
+            created_at=datetime.fromisoformat(created_at),
+            updated_at=datetime.fromisoformat(updated_at),
+            accessed_count=accessed_count,
+            last_accessed=datetime.fromisoformat(last_accessed) if last_accessed else None,
+            source=source,
+            confidence_score=confidence_score,
+            metadata=json.loads(metadata) if metadata and metadata != "{}" else {}
+        )
+    
     def get_memory_by_id(self, memory_id: str) -> Optional[MemoryEntry]:
-        """Obtém memória por ID."""
-        memories = self.search_memories("", limit=1)
-        return memories[0] if memories else None
+        """Obtém memória por ID (chave primária, com cache LRU)."""
+        return self.get_many([memory_id]).get(memory_id)
+    
+    def get_many(self, memory_ids: List[str]) -> Dict[str, MemoryEntry]:
+        """
+        Obtém várias memórias por ID em uma consulta.
+        
+        Retorna {id: MemoryEntry} na ordem pedida, omitindo IDs inexistentes.
+        Entradas quentes vêm do cache LRU; as demais são lidas pela chave
+        primária e passam a ocupar o cache. As instâncias são compartilhadas
+        com o cache e não devem ser modificadas pelo chamador.
+        
+        Uma invalidação concorrente com a leitura pode ter alterado as
+        linhas depois de lidas; nesse caso o resultado não entra no cache.
+        """
+        found: Dict[str, MemoryEntry] = {}
+        missing: List[str] = []
+        with self._cache_lock:
+            generation = self._cache_generation
+            for memory_id in memory_ids:
+                entry = self._entry_cache.get(memory_id)
+                if entry is not None:
+                    self._entry_cache.move_to_end(memory_id)
+                    found[memory_id] = entry
+                else:
+                    missing.append(memory_id)
+        
+        if missing:
+            try:
+                with self._connections.connection() as conn:
+                    rows = conn.execute(
+                        f"SELECT {ENTRY_COLUMNS} FROM memory_entries m "
+                        "WHERE m.id IN (SELECT value FROM json_each(?))",
+                        (json.dumps(missing),)
+                    ).fetchall()
+            except Exception as e:
+                print(f"Erro ao carregar memórias: {e}")
+                rows = []
+            
+            loaded = [self._row_to_entry(row) for row in rows]
+            for entry in loaded:
+                found[entry.id] = entry
+            with self._cache_lock:
+                if generation == self._cache_generation:
+                    for entry in loaded:
+                        self._entry_cache[entry.id] = entry
+                        self._entry_cache.move_to_end(entry.id)
+                    while len(self._entry_cache) > ENTRY_CACHE_SIZE:
+                        self._entry_cache.popitem(last=False)
+        
+        return {memory_id: found[memory_id] for memory_id in memory_ids if memory_id in found}
+    
+    def _invalidate_cache(self, memory_ids):
+        """Remove entradas do cache LRU após alterações no banco."""
+        with self._cache_lock:
+            self._cache_generation += 1
+            for memory_id in memory_ids:
+                self._entry_cache.pop(memory_id, None)
     
     def update_access_stats(self, memory_id: str):
-        """Atualiza estatísticas de acesso."""
+        """Atualiza estatísticas de acesso (gravação adiada, ver record_access)."""
+        self.record_access([memory_id])
+    
+    def record_access(self, memory_ids: List[str]):
+        """
+        Registra acessos em memória para gravação posterior em lote.
+        
+        Buscas são somente leitura: em vez de um UPDATE + commit por resultado,
+        os contadores são acumulados e gravados por flush_access_stats em uma
+        única transação. accessed_count no banco é eventualmente consistente.
+        """
+        if not memory_ids:
+            return
+        
+        now = datetime.now()
+        with self._access_lock:
+            for memory_id in memory_ids:
+                count, _ = self._pending_access.get(memory_id, (0, None))
+                self._pending_access[memory_id] = (count + 1, now)
+            
+            # Buffer cheio: o flush é antecipado no timer, nunca feito aqui (a
+            # busca pode estar no event loop). Com gravações falhando, o buffer
+            # espera o timer de nova tentativa
+            timer = self._access_flush_timer
+            if (len(self._pending_access) >= ACCESS_FLUSH_MAX_PENDING
+                    and not self._access_flush_failures
+                    and (timer is None or timer.interval > 0)):
+                if timer is not None:
+                    timer.cancel()
+                self._schedule_access_flush(0)
+            elif timer is None:
+                self._schedule_access_flush(ACCESS_FLUSH_INTERVAL)
+    
+    def _schedule_access_flush(self, delay: float):
+        """Agenda flush_access_stats (chamado com _access_lock)."""
+        self._access_flush_timer = threading.Timer(delay, self.flush_access_stats)
+        self._access_flush_timer.daemon = True
+        self._access_flush_timer.start()
+    
+    def flush_access_stats(self) -> int:
+        """Grava os acessos pendentes em uma transação; retorna entradas atualizadas."""
+        with self._access_lock:
+            pending, self._pending_access = self._pending_access, {}
+            if self._access_flush_timer is not None:
+                self._access_flush_timer.cancel()
+                self._access_flush_timer = None
+        
+        if not pending:
+            return 0
+        
         try:
-            conn = self._get_connection()
-            conn.execute("""
-                UPDATE memory_entries SET
-                    accessed_count = accessed_count + 1,
-                    last_accessed = ?
-                WHERE id = ?
-            """, (datetime.now(), memory_id))
-            conn.commit()
-        except Exception:
-            pass
+            with self._connections.connection() as conn:
+                with conn:
+                    conn.executemany("""
+                        UPDATE memory_entries SET
+                            accessed_count = accessed_count + ?,
+                            last_accessed = ?
+                        WHERE id = ?
+                    """, [
+                        (count, last_accessed, memory_id)
+                        for memory_id, (count, last_accessed) in pending.items()
+                    ])
+                self._invalidate_cache(pending)
+            with self._access_lock:
+                self._access_flush_failures = 0
+            return len(pending)
+            
+        except Exception as e:
+            print(f"Erro ao gravar estatísticas de acesso: {e}")
+            # Devolver ao buffer e agendar nova tentativa com backoff exponencial
+            with self._access_lock:
+                for memory_id, (count, last_accessed) in pending.items():
+                    current, _ = self._pending_access.get(memory_id, (0, None))
+                    self._pending_access[memory_id] = (current + count, last_accessed)
+                self._access_flush_failures += 1
+                if self._access_flush_timer is None:
+                    self._schedule_access_flush(min(
+                        ACCESS_FLUSH_INTERVAL * 2 ** self._access_flush_failures,
+                        ACCESS_FLUSH_MAX_BACKOFF
+                    ))
+            return 0
+    
+    def shutdown(self):
+        """Grava os acessos pendentes e fecha as conexões; chamado no encerramento do processo."""
+        self.flush_access_stats()
+        self._connections.close_all()
     
     def get_memory_stats(self) -> Dict[str, Any]:
-        """Obtém estatísticas da memória."""
+        """
+        Obtém estatísticas da memória.
+        
+        Lê apenas os contadores mantidos por triggers (uma linha por tipo e
+        por dia), portanto o custo independe do tamanho de memory_entries.
+        """
         try:
-            conn = self._get_connection()
-            
-            # Contagem por tipo
-            type_counts = {}
-            for row in conn.execute("SELECT memory_type, COUNT(*) as count FROM memory_entries GROUP BY memory_type"):
-                type_counts[row['memory_type']] = row['count']
-            
-            # Estatísticas gerais
-            total = conn.execute("SELECT COUNT(*) as count FROM memory_entries").fetchone()['count']
-            recent = conn.execute(
-                "SELECT COUNT(*) as count FROM memory_entries WHERE created_at > ?",
-                (datetime.now() - timedelta(days=30),)
-            ).fetchone()['count']
-            
-            return {
-                "total_memories": total,
-                "recent_memories": recent,
-                "by_type": type_counts,
-                "database_size": os.path.getsize(self.db_path) if os.path.exists(self.db_path) else 0
-            }
+            with self._connections.connection() as conn:
+                # Contagem total e por tipo
+                total = 0
+                type_counts = {}
+                for row in conn.execute("SELECT name, value FROM memory_counters"):
+                    if row['name'] == 'total':
+                        total = row['value']
+                    elif row['value'] > 0:
+                        type_counts[row['name'][len('type:'):]] = row['value']
+                
+                # Entradas criadas nos últimos 30 dias
+                cutoff_day = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
+                recent = conn.execute(
+                    "SELECT COALESCE(SUM(value), 0) FROM memory_daily_counts WHERE day > ?",
+                    (cutoff_day,)
+                ).fetchone()[0]
+                
+                page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+                page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+                
+                return {
+                    "total_memories": total,
+                    "recent_memories": recent,
+                    "by_type": type_counts,
+                    "database_size": page_count * page_size
+                }
         except Exception:
             return {"total_memories": 0}
+    
+    def iter_entries(self, batch_size: int = RESTORE_BATCH_SIZE) -> Iterator[List[MemoryEntry]]:
+        """
+        Percorre todas as entradas em lotes, na ordem de gravação.
+        
+        A leitura é uma única consulta, portanto vê um snapshot consistente
+        do banco (WAL) enquanto o iterador estiver aberto.
+        """
+        with self._connections.connection() as conn:
+            cursor = conn.execute(f"SELECT {ENTRY_COLUMNS} FROM memory_entries m ORDER BY m.rowid")
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield [self._row_to_entry(row) for row in rows]
+    
+    def backup_to(self, target: sqlite3.Connection, pages: int = SNAPSHOT_PAGES_PER_STEP):
+        """Copia o banco para target com a API de backup online do SQLite."""
+        with self._connections.connection() as conn:
+            conn.backup(target, pages=pages)
+    
+    # API assíncrona: as mesmas operações executadas no executor de banco,
+    # para uso em tools e nós de grafo sem bloquear o event loop.
+    
+    async def astore_memory(self, entry: MemoryEntry) -> bool:
+        """Versão assíncrona de store_memory."""
+        return await self._executor.run(self.store_memory, entry)
+    
+    async def astore_memories_bulk(self, entries: List[MemoryEntry]) -> List[Tuple[str, StoreOutcome]]:
+        """Versão assíncrona de store_memories_bulk."""
+        return await self._executor.run(self.store_memories_bulk, entries)
+    
+    async def asearch_memories(self, query: str, **kwargs) -> List[MemoryEntry]:
+        """Versão assíncrona de search_memories."""
+        return await self._executor.run(self.search_memories, query, **kwargs)
+    
+    async def avector_search(self, query: str, **kwargs) -> List[MemoryEntry]:
+        """Versão assíncrona de vector_search."""
+        return await self._executor.run(self.vector_search, query, **kwargs)
+    
+    async def ahybrid_search(self, query: str, **kwargs) -> List[MemoryEntry]:
+        """Versão assíncrona de hybrid_search."""
+        return await self._executor.run(self.hybrid_search, query, **kwargs)
+    
+    async def aget_memory_by_id(self, memory_id: str) -> Optional[MemoryEntry]:
+        """Versão assíncrona de get_memory_by_id."""
+        return await self._executor.run(self.get_memory_by_id, memory_id)
+    
+    async def aget_many(self, memory_ids: List[str]) -> Dict[str, MemoryEntry]:
+        """Versão assíncrona de get_many."""
+        return await self._executor.run(self.get_many, memory_ids)
+    
+    async def aget_memory_stats(self) -> Dict[str, Any]:
+        """Versão assíncrona de get_memory_stats."""
+        return await self._executor.run(self.get_memory_stats)
 
 
 # Instância global
 memory_system = PersistentMemorySystem()
+atexit.register(memory_system.shutdown)
 
 
 # ==================== FERRAMENTAS DE MEMÓRIA ====================
 
+def _build_knowledge_entry(
+    title: str,
+    content: str,
+    memory_type: MemoryType,
+    tags: List[str],
+    access_level: AccessLevel,
+    source: Optional[str]
+) -> MemoryEntry:
+    """Cria a MemoryEntry usada pelas ferramentas de armazenamento."""
+    return MemoryEntry(
+        id=f"mem_{hashlib.sha256(title.encode()).hexdigest()[:12]}",
+        memory_type=memory_type,
+        title=title,
+        content=content,
+        tags=tags,
+        access_level=access_level,
+        created_at=datetime.now(),
+        updated_at=datetime.now(),
+        source=source,
+        confidence_score=0.95,
+        metadata={
+            "word_count": len(content.split()),
+            "char_count": len(content),
+            "stored_by": "system"
+        }
+    )
+
+
 @tool
 async def store_legal_knowledge(
     title: str,
@@ -323,26 +1517,10 @@ async def store_legal_knowledge(
             return {"error": f"Tipo inválido: {e}"}
         
         # Criar entrada de memória
-        memory_entry = MemoryEntry(
-            id=f"mem_{hashlib.sha256(title.encode()).hexdigest()[:12]}",
-            memory_type=mem_type,
-            title=title,
-            content=content,
-            tags=tags,
-            access_level=acc_level,
-            created_at=datetime.now(),
-            updated_at=datetime.now(),
-            source=source,
-            confidence_score=0.95,
-            metadata={
-                "word_count": len(content.split()),
-                "char_count": len(content),
-                "stored_by": "system"
-            }
-        )
+        memory_entry = _build_knowledge_entry(title, content, mem_type, tags, acc_level, source)
         
         # Armazenar na memória
-        success = memory_system.store_memory(memory_entry)
+        success = await memory_system.astore_memory(memory_entry)
         
         if success:
             return {
@@ -367,7 +1545,10 @@ async def search_legal_knowledge(
     query: str,
     memory_types: List[str] = [],
     tags: List[str] = [],
-    limit: int = 5
+    limit: int = 5,
+    tag_mode: str = "all",
+    search_mode: str = "lexical",
+    include_stats: bool = True
 ) -> Dict[str, Any]:
     """
     Busca conhecimento jurídico na memória persistente.
@@ -377,6 +1558,9 @@ async def search_legal_knowledge(
         memory_types: Tipos de memória para filtrar
         tags: Tags para filtrar
         limit: Número máximo de resultados
+        tag_mode: "all" exige todas as tags, "any" aceita qualquer uma
+        search_mode: "lexical" (BM25), "vector" (similaridade) ou "hybrid" (ambos)
+        include_stats: Incluir estatísticas da memória na resposta
     """
     
     try:
@@ -388,20 +1572,29 @@ async def search_legal_knowledge(
             except ValueError:
                 continue
         
+        search_functions = {
+            "lexical": memory_system.asearch_memories,
+            "vector": memory_system.avector_search,
+            "hybrid": memory_system.ahybrid_search,
+        }
+        if search_mode not in search_functions:
+            return {"error": f"Modo de busca inválido: {search_mode}"}
+        
         # Buscar na memória
-        memories = memory_system.search_memories(
+        memories = await search_functions[search_mode](
             query=query,
             memory_types=filter_types if filter_types else None,
             tags=tags if tags else None,
-            limit=limit
+            limit=limit,
+            tag_mode=tag_mode
         )
         
+        # Registrar acessos (gravados em lote, fora do caminho da busca)
+        memory_system.record_access([memory.id for memory in memories])
+        
         # Preparar resultados
         results = []
         for memory in memories:
-            # Atualizar estatísticas de acesso
-            memory_system.update_access_stats(memory.id)
-            
             result = {
                 "id": memory.id,
                 "title": memory.title,
@@ -416,14 +1609,18 @@ async def search_legal_knowledge(
             }
             results.append(result)
         
-        return {
+        response = {
             "search_successful": True,
             "query": query,
+            "search_mode": search_mode,
             "total_results": len(results),
             "results": results,
-            "search_timestamp": datetime.now().isoformat(),
-            "memory_stats": memory_system.get_memory_stats()
+            "search_timestamp": datetime.now().isoformat()
         }
+        if include_stats:
+            response["memory_stats"] = await memory_system.aget_memory_stats()
+        
+        return response
         
     except Exception as e:
         return {"error": f"Erro na busca: {str(e)}"}
@@ -441,7 +1638,7 @@ async def get_memory_insights(
     """
     
     try:
-        stats = memory_system.get_memory_stats()
+        stats = await memory_system.aget_memory_stats()
         
         # Análise de tendências (simulada)
         insights = {
@@ -516,19 +1713,21 @@ async def initialize_legal_knowledge_base():
             }
         ]
         
-        stored_count = 0
-        for knowledge in essential_knowledge:
-            result = await store_legal_knowledge.ainvoke({
-                "title": knowledge["title"],
-                "content": knowledge["content"],
-                "memory_type": knowledge["type"],
-                "tags": knowledge["tags"],
-                "access_level": "internal",
-                "source": "Sistema de Inicialização"
-            })
-            
-            if result.get("memory_stored"):
-                stored_count += 1
+        entries = [
+            _build_knowledge_entry(
+                knowledge["title"],
+                knowledge["content"],
+                MemoryType(knowledge["type"]),
+                knowledge["tags"],
+                AccessLevel.INTERNAL,
+                "Sistema de Inicialização"
+            )
+            for knowledge in essential_knowledge
+        ]
+        
+        # Gravar todo o lote em uma única transação
+        outcomes = await memory_system.astore_memories_bulk(entries)
+        stored_count = sum(1 for _, outcome in outcomes if outcome != StoreOutcome.ERROR)
         
         return {
             "initialization_successful": True,
@@ -549,62 +1748,203 @@ async def initialize_legal_knowledge_base():
 # ==================== SISTEMA DE BACKUP ====================
 
 class MemoryBackupSystem:
-    """Sistema de backup da memória persistente."""
+    """
+    Sistema de backup da memória persistente.
     
-    def __init__(self, backup_dir: str = None):
+    create_backup exporta NDJSON comprimido (zstd, ou gzip sem o pacote
+    zstandard) percorrendo a tabela com um cursor, sem materializar a base
+    em memória; create_snapshot copia o banco online com a API de backup
+    do SQLite. restore_backup aceita os dois formatos e o JSON legado, e
+    grava em lotes pelo caminho de inserção em massa. O tempo e o pico de
+    RSS da última operação ficam em last_report.
+    """
+    
+    def __init__(self, backup_dir: str = None, memory: PersistentMemorySystem = None):
         self.backup_dir = Path(backup_dir or MEMORY_DIR / "backups")
         self.backup_dir.mkdir(exist_ok=True)
+        self.memory = memory or memory_system
+        self.last_report: Dict[str, Any] = {}
+    
+    @staticmethod
+    def _peak_rss_mb() -> Optional[float]:
+        """Pico de memória residente do processo (ru_maxrss é KiB no Linux); None no Windows."""
+        try:
+            import resource
+        except ImportError:
+            return None
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    
+    def _report(self, operation: str, path: Path, entries: int, started: float):
+        """Registra tempo, volume e memória da operação."""
+        self.last_report = {
+            "operation": operation,
+            "file": str(path),
+            "entries": entries,
+            "size_bytes": path.stat().st_size if path.exists() else 0,
+            "seconds": round(time.perf_counter() - started, 3),
+            "peak_rss_mb": self._peak_rss_mb()
+        }
+        print(f"Backup: {self.last_report}")
     
-    def create_backup(self) -> str:
-        """Cria backup da memória."""
+    def create_backup(self, compression: str = None) -> str:
+        """
+        Exporta todas as entradas em NDJSON comprimido.
+        
+        compression: "zstd", "gzip" ou "none"; por padrão zstd se disponível.
+        A consulta única roda em um snapshot consistente do banco (WAL), e o
+        arquivo só aparece com o nome final depois de completo.
+        """
+        compression = compression or ("zstd" if ZSTD_AVAILABLE else "gzip")
+        if compression == "zstd" and not ZSTD_AVAILABLE:
+            raise ValueError("Compressão zstd requer o pacote zstandard")
+        suffix = {"zstd": ".ndjson.zst", "gzip": ".ndjson.gz", "none": ".ndjson"}.get(compression)
+        if suffix is None:
+            raise ValueError(f"Compressão inválida: {compression}")
+        
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_file = self.backup_dir / f"memory_backup_{timestamp}.json"
+        backup_file = self.backup_dir / f"memory_backup_{timestamp}{suffix}"
+        partial_file = backup_file.with_name(backup_file.name + ".partial")
+        started = time.perf_counter()
+        count = 0
         
         try:
-            # Exportar todas as memórias
-            memories = memory_system.search_memories("", limit=10000)
-            
-            backup_data = {
-                "timestamp": timestamp,
-                "total_memories": len(memories),
-                "memories": [memory.to_dict() for memory in memories]
-            }
-            
-            with open(backup_file, 'w', encoding='utf-8') as f:
-                json.dump(backup_data, f, indent=2, ensure_ascii=False)
+            with open(partial_file, "wb") as raw:
+                if compression == "zstd":
+                    stream = zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=False)
+                elif compression == "gzip":
+                    stream = gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6)
+                else:
+                    stream = raw
+                
+                with io.TextIOWrapper(stream, encoding="utf-8", write_through=False) as out:
+                    out.write(json.dumps({
+                        "format": BACKUP_FORMAT,
+                        "version": BACKUP_FORMAT_VERSION,
+                        "timestamp": timestamp
+                    }) + "\n")
+                    
+                    for entries in self.memory.iter_entries():
+                        for entry in entries:
+                            out.write(json.dumps(entry.to_dict(), ensure_ascii=False) + "\n")
+                        count += len(entries)
             
+            os.replace(partial_file, backup_file)
+            self._report("backup", backup_file, count, started)
             return str(backup_file)
             
         except Exception as e:
+            partial_file.unlink(missing_ok=True)
             raise Exception(f"Erro no backup: {e}")
     
-    def restore_backup(self, backup_file: str) -> bool:
-        """Restaura backup da memória."""
+    def create_snapshot(self) -> str:
+        """
+        Copia o banco inteiro com a API de backup online do SQLite.
+        
+        A cópia é feita em passos de SNAPSHOT_PAGES_PER_STEP páginas sem
+        bloquear escritas concorrentes. O índice vetorial não é copiado: ele
+        é reconstruído a partir do banco ao abrir o snapshot.
+        """
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        snapshot_file = self.backup_dir / f"memory_snapshot_{timestamp}.db"
+        started = time.perf_counter()
+        
         try:
-            with open(backup_file, 'r', encoding='utf-8') as f:
-                backup_data = json.load(f)
+            target = sqlite3.connect(snapshot_file)
+            try:
+                self.memory.backup_to(target)
+                count = target.execute("SELECT COUNT(*) FROM memory_entries").fetchone()[0]
+            finally:
+                target.close()
             
-            restored_count = 0
-            for memory_dict in backup_data["memories"]:
-                # Recriar MemoryEntry
-                memory = MemoryEntry(
-                    id=memory_dict["id"],
-                    memory_type=MemoryType(memory_dict["memory_type"]),
-                    title=memory_dict["title"],
-                    content=memory_dict["content"],
-                    tags=memory_dict["tags"],
-                    access_level=AccessLevel(memory_dict["access_level"]),
-                    created_at=datetime.fromisoformat(memory_dict["created_at"]),
-                    updated_at=datetime.fromisoformat(memory_dict["updated_at"]),
-                    accessed_count=memory_dict["accessed_count"],
-                    source=memory_dict.get("source"),
-                    confidence_score=memory_dict.get("confidence_score", 1.0),
-                    metadata=memory_dict.get("metadata", {})
-                )
+            self._report("snapshot", snapshot_file, count, started)
+            return str(snapshot_file)
+            
+        except Exception as e:
+            snapshot_file.unlink(missing_ok=True)
+            raise Exception(f"Erro no snapshot: {e}")
+    
+    @staticmethod
+    def _entry_from_dict(memory_dict: Dict[str, Any]) -> MemoryEntry:
+        """Recria MemoryEntry a partir de MemoryEntry.to_dict()."""
+        last_accessed = memory_dict.get("last_accessed")
+        return MemoryEntry(
+            id=memory_dict["id"],
+            memory_type=MemoryType(memory_dict["memory_type"]),
+            title=memory_dict["title"],
+            content=memory_dict["content"],
+            tags=memory_dict["tags"],
+            access_level=AccessLevel(memory_dict["access_level"]),
+            created_at=datetime.fromisoformat(memory_dict["created_at"]),
+            updated_at=datetime.fromisoformat(memory_dict["updated_at"]),
+            accessed_count=memory_dict["accessed_count"],
+            last_accessed=datetime.fromisoformat(last_accessed) if last_accessed else None,
+            source=memory_dict.get("source"),
+            confidence_score=memory_dict.get("confidence_score", 1.0),
+            metadata=memory_dict.get("metadata", {})
+        )
+    
+    def _iter_backup_entries(self, backup_path: Path):
+        """Percorre as entradas de um backup NDJSON, JSON legado ou snapshot."""
+        with open(backup_path, "rb") as raw:
+            magic = raw.read(16)
+        
+        if magic.startswith(b"SQLite format 3"):
+            snapshot = sqlite3.connect(f"file:{backup_path}?mode=ro", uri=True)
+            try:
+                cursor = snapshot.execute(f"SELECT {ENTRY_COLUMNS} FROM memory_entries m ORDER BY m.rowid")
+                for row in cursor:
+                    yield PersistentMemorySystem._row_to_entry(row)
+            finally:
+                snapshot.close()
+            return
+        
+        with open(backup_path, "rb") as raw:
+            if magic.startswith(b"\x28\xb5\x2f\xfd"):
+                if not ZSTD_AVAILABLE:
+                    raise ValueError("Backup zstd requer o pacote zstandard")
+                stream = zstandard.ZstdDecompressor().stream_reader(raw)
+            elif magic.startswith(b"\x1f\x8b"):
+                stream = gzip.GzipFile(fileobj=raw, mode="rb")
+            else:
+                stream = raw
+            
+            with io.TextIOWrapper(stream, encoding="utf-8") as lines:
+                first_line = lines.readline()
+                try:
+                    header = json.loads(first_line)
+                except json.JSONDecodeError:
+                    header = None
                 
-                if memory_system.store_memory(memory):
-                    restored_count += 1
+                if not isinstance(header, dict) or header.get("format") != BACKUP_FORMAT:
+                    # Formato legado: um único documento JSON com a lista "memories"
+                    backup_data = json.loads(first_line + lines.read())
+                    for memory_dict in backup_data["memories"]:
+                        yield self._entry_from_dict(memory_dict)
+                    return
+                
+                for line in lines:
+                    if line.strip():
+                        yield self._entry_from_dict(json.loads(line))
+    
+    def restore_backup(self, backup_file: str) -> bool:
+        """Restaura backup da memória em lotes de RESTORE_BATCH_SIZE entradas."""
+        backup_path = Path(backup_file)
+        started = time.perf_counter()
+        restored_count = 0
+        
+        try:
+            batch: List[MemoryEntry] = []
+            for entry in self._iter_backup_entries(backup_path):
+                batch.append(entry)
+                if len(batch) >= RESTORE_BATCH_SIZE:
+                    outcomes = self.memory.store_memories_bulk(batch)
+                    restored_count += sum(1 for _, outcome in outcomes if outcome != StoreOutcome.ERROR)
+                    batch = []
+            if batch:
+                outcomes = self.memory.store_memories_bulk(batch)
+                restored_count += sum(1 for _, outcome in outcomes if outcome != StoreOutcome.ERROR)
             
+            self._report("restore", backup_path, restored_count, started)
             return restored_count > 0
             
         except Exception as e:
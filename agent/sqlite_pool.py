@@ -0,0 +1,199 @@
+"""
+Pool de Conexões SQLite
+Gerenciador compartilhado pelos armazenamentos SQLite (memória e checkpoints).
+"""
+
+import os
+import asyncio
+import sqlite3
+import threading
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# ==================== CONFIGURAÇÃO ====================
+
+# Conexões abertas por banco; threads excedentes aguardam uma ficar livre
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "8"))
+
+# Tempo máximo de espera por uma conexão livre do pool (segundos)
+SQLITE_POOL_TIMEOUT = 30.0
+
+# Janela de mmap e cache de páginas por conexão (cache_size negativo é em KiB)
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "16384"))
+
+# Espera por locks de escrita antes de SQLITE_BUSY (milissegundos)
+SQLITE_BUSY_TIMEOUT_MS = 30000
+
+# Tamanho do cache de statements preparados de cada conexão
+SQLITE_STATEMENT_CACHE_SIZE = 256
+
+
+class SQLiteConnectionManager:
+    """
+    Pool limitado de conexões SQLite em modo WAL.
+
+    Em WAL leitores não bloqueiam o escritor nem são bloqueados por ele;
+    com synchronous=NORMAL o commit não faz fsync (só o checkpoint do WAL),
+    o que mantém a durabilidade contra falhas do processo. As conexões são
+    emprestadas por operação via connection(); chamadas aninhadas na mesma
+    thread reutilizam a conexão já emprestada, evitando deadlock no pool.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        max_size: int = None,
+        row_factory: Optional[Callable] = sqlite3.Row,
+        mmap_size: int = None,
+        cache_size_kb: int = None,
+        timeout: float = SQLITE_POOL_TIMEOUT
+    ):
+        self.db_path = db_path
+        self.in_memory = db_path == ":memory:"
+        # Cada conexão a ":memory:" seria um banco distinto
+        self.max_size = 1 if self.in_memory else max(1, max_size or SQLITE_POOL_SIZE)
+        self.row_factory = row_factory
+        self.mmap_size = SQLITE_MMAP_SIZE if mmap_size is None else mmap_size
+        self.cache_size_kb = SQLITE_CACHE_SIZE_KB if cache_size_kb is None else cache_size_kb
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._idle: List[sqlite3.Connection] = []
+        self._all: List[sqlite3.Connection] = []
+        self._held = threading.local()
+        self._closed = False
+
+    def _open(self) -> sqlite3.Connection:
+        """Abre uma conexão e aplica os pragmas de desempenho."""
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+            cached_statements=SQLITE_STATEMENT_CACHE_SIZE
+        )
+        conn.row_factory = self.row_factory
+        if not self.in_memory:
+            conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        conn.execute(f"PRAGMA cache_size=-{self.cache_size_kb}")
+        conn.execute(f"PRAGMA mmap_size={self.mmap_size}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        """Empresta uma conexão, abrindo uma nova enquanto houver vaga."""
+        with self._available:
+            while True:
+                if self._closed:
+                    raise sqlite3.ProgrammingError("Pool de conexões encerrado")
+                if self._idle:
+                    return self._idle.pop()
+                if len(self._all) < self.max_size:
+                    conn = self._open()
+                    self._all.append(conn)
+                    return conn
+                if not self._available.wait(self.timeout):
+                    raise TimeoutError(
+                        f"Nenhuma conexão livre em {self.timeout}s ({self.db_path})"
+                    )
+
+    def release(self, conn: sqlite3.Connection):
+        """Devolve a conexão ao pool, desfazendo transação deixada aberta."""
+        if conn.in_transaction:
+            conn.rollback()
+        with self._available:
+            if self._closed:
+                self._all.remove(conn)
+                conn.close()
+                return
+            self._idle.append(conn)
+            self._available.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Conexão emprestada durante o bloco with."""
+        held = getattr(self._held, "connection", None)
+        if held is not None:
+            yield held
+            return
+
+        conn = self.acquire()
+        self._held.connection = conn
+        try:
+            yield conn
+        finally:
+            self._held.connection = None
+            self.release(conn)
+
+    def close_all(self):
+        """Fecha todas as conexões; as emprestadas fecham ao serem devolvidas."""
+        with self._available:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._all = [conn for conn in self._all if conn not in idle]
+            self._available.notify_all()
+
+        for conn in idle:
+            try:
+                conn.execute("PRAGMA optimize")
+            except sqlite3.Error:
+                pass
+            conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Conexões abertas e livres no pool."""
+        with self._lock:
+            return {
+                "max_size": self.max_size,
+                "open": len(self._all),
+                "idle": len(self._idle),
+            }
+
+
+# ==================== EXECUÇÃO ASSÍNCRONA ====================
+
+class DatabaseExecutor:
+    """
+    Threads dedicadas às chamadas bloqueantes de banco.
+
+    Código assíncrono aguarda run() em vez de chamar sqlite3 diretamente,
+    de modo que consultas longas não travam o event loop que atende os
+    streams. O contexto (contextvars) do chamador é propagado para a thread.
+    """
+
+    def __init__(self, max_workers: int = None, thread_name_prefix: str = "sqlite-db"):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or SQLITE_POOL_SIZE,
+            thread_name_prefix=thread_name_prefix
+        )
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Executa fn(*args, **kwargs) em uma thread do executor."""
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(context.run, fn, *args, **kwargs)
+        )
+
+    def shutdown(self, wait: bool = True):
+        """Encerra as threads após concluir as chamadas pendentes."""
+        self._executor.shutdown(wait=wait)
+
+
+_database_executor: Optional[DatabaseExecutor] = None
+_database_executor_lock = threading.Lock()
+
+
+def get_database_executor() -> DatabaseExecutor:
+    """Executor compartilhado pelos armazenamentos SQLite."""
+    global _database_executor
+    with _database_executor_lock:
+        if _database_executor is None:
+            _database_executor = DatabaseExecutor()
+        return _database_executor
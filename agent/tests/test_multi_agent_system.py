@@ -7,6 +7,7 @@ import pytest
 import asyncio
 import json
 from datetime import datetime
+from pathlib import Path
 from unittest.mock import Mock, patch, AsyncMock
 
 # Imports dos módulos testados
@@ -18,12 +19,24 @@ from master_agent import MasterAgentState, analisar_consulta_juridica
 from agente_societario import SocietarioAgentState, gerar_contrato_social, estruturar_holding
 from agente_tributario import TributarioAgentState, gerar_impugnacao, analisar_reforma_tributaria
 from handoffs import HandoffRequest, HandoffPriority, HandoffReason
-from checkpointing import AdvancedCheckpointSaver, CheckpointType
-from observability import ObservabilityManager, TraceEvent, EventType
+from checkpointing import (
+    AdvancedCheckpointSaver, AutoCheckpointScheduler, CheckpointConfig, CheckpointType, CompressionType,
+    DurabilityMode, FileCheckpointStorage, SQLiteCheckpointStorage, SerializationFormat, StateSerializer, STATE_MAGIC, STATE_SCHEMA_VERSION, STATE_SERIALIZERS,
+    decode_state_payload, encode_state_payload, register_state_type
+)
+from observability import (
+    BatchExporter, ObservabilityConfig, ObservabilityManager, PerformanceMonitor, RollingHistogram, TraceEvent,
+    TraceLevel, TraceSink, EventType
+)
 from mapreduce import decompose_legal_task, execute_parallel_tasks
-from persistent_memory import PersistentMemorySystem, MemoryEntry, MemoryType, AccessLevel
+from persistent_memory import (
+    PersistentMemorySystem, MemoryBackupSystem, MemoryEntry, MemoryType, AccessLevel, StoreOutcome,
+    VectorIndex, HashingEmbeddings
+)
 from routing import IntelligentRouter, RoutingContext, AgentCapability
 from fault_tolerance import FaultToleranceManager, FailureType, RecoveryStrategy
+from metrics import PrometheusMetrics
+from sqlite_pool import SQLiteConnectionManager
 
 
 class TestMasterAgent:
@@ -195,6 +208,523 @@ class TestCheckpointing:
         
         assert checkpoint_id is not None
         assert len(checkpoint_id) > 0
+    
+    def test_incremental_checkpoints_replay_chain(self, tmp_path):
+        """Testa checkpoints delta, base periódica e limpeza que preserva a cadeia."""
+        storage = SQLiteCheckpointStorage(db_path=str(tmp_path / "checkpoints.db"))
+        saver = AdvancedCheckpointSaver(
+            CheckpointConfig(auto_checkpoint_interval=0, full_checkpoint_interval=4,
+                             max_checkpoints_per_session=6),
+            storage=storage
+        )
+        state = {"messages": [], "context": {"step": 0}, "draft": "v0"}
+        
+        checkpoint_ids = []
+        for step in range(10):
+            state["messages"].append({"role": "user", "content": f"mensagem {step}"})
+            state["context"]["step"] = step
+            if step == 5:
+                del state["draft"]
+            checkpoint_ids.append(saver.save_checkpoint(session_id="sessao", state=state))
+        
+        checkpoints = saver.list_checkpoints(session_id="sessao")
+        assert [cp.chain_length for cp in checkpoints][:2] == [1, 0]
+        assert not any(cp.is_delta for cp in checkpoints if cp.chain_length == 0)
+        
+        # Um saver novo (sem cache) reconstrói o estado a partir da base
+        reloaded = AdvancedCheckpointSaver(CheckpointConfig(auto_checkpoint_interval=0), storage=storage)
+        assert reloaded.load_checkpoint(checkpoint_ids[-1]) == state
+        assert len(reloaded.load_checkpoint(checkpoint_ids[6])["messages"]) == 7
+        assert all(reloaded.load_checkpoint(cp.id) is not None for cp in checkpoints)
+    
+    def test_save_after_delta_head_deleted(self, tmp_path):
+        """Testa que remover a cabeça da cadeia de deltas não impede novos saves."""
+        storage = SQLiteCheckpointStorage(db_path=str(tmp_path / "checkpoints.db"))
+        saver = AdvancedCheckpointSaver(
+            CheckpointConfig(auto_checkpoint_interval=0, max_checkpoints_per_session=0), storage=storage
+        )
+        state = {"messages": ["m0"]}
+        first = saver.save_checkpoint(session_id="sessao", state=state)
+        state["messages"].append("m1")
+        head = saver.save_checkpoint(session_id="sessao", state=state)
+        assert storage.delete_checkpoint(head)
+        
+        # Sem a cabeça, o delta parte do último checkpoint existente
+        state["messages"].append("m2")
+        after = saver.save_checkpoint(session_id="sessao", state=state)
+        assert saver.load_checkpoint(after) == state
+        
+        # Sem nenhum checkpoint na sessão, volta a gravar um completo
+        for checkpoint_id in (first, after):
+            storage.delete_checkpoint(checkpoint_id)
+        state["messages"].append("m3")
+        full = saver.save_checkpoint(session_id="sessao", state=state)
+        assert not storage.load_checkpoint(full)[1].is_delta
+        state["messages"].append("m4")
+        assert saver.load_checkpoint(saver.save_checkpoint(session_id="sessao", state=state)) == state
+    
+    def test_retention_keeps_milestones_and_newest(self, tmp_path):
+        """Testa retenção em SQL: milestones preservados, contagem por sessão e worker."""
+        storage = SQLiteCheckpointStorage(db_path=str(tmp_path / "checkpoints.db"))
+        config = CheckpointConfig(auto_checkpoint_interval=0, max_checkpoints_per_session=5,
+                                  enable_incremental=False)
+        saver = AdvancedCheckpointSaver(config, storage=storage)
+        
+        milestone = saver.save_checkpoint(session_id="sessao", state={"step": -1},
+                                          checkpoint_type=CheckpointType.MILESTONE)
+        ids = [saver.save_checkpoint(session_id="sessao", state={"step": step}) for step in range(10)]
+        
+        remaining = {cp.id for cp in storage.list_checkpoints(session_id="sessao")}
+        assert remaining == {milestone, *ids[-4:]}
+        assert storage.sessions_over_limit(4) == ["sessao"]
+        assert storage.sessions_over_limit(5) == []
+        
+        # Com o worker, o save não limpa; run_retention aplica o limite depois
+        background = AdvancedCheckpointSaver(
+            config.model_copy(update={"retention_worker_interval": 3600}), storage=storage
+        )
+        for step in range(3):
+            background.save_checkpoint(session_id="sessao", state={"step": 100 + step})
+        assert len(storage.list_checkpoints(session_id="sessao")) == 8
+        assert background.run_retention() == 3
+        assert len(storage.list_checkpoints(session_id="sessao")) == 5
+        background.stop_retention_worker()
+        
+        # Milestones ocupando todo o limite: o checkpoint recém-salvo (cabeça
+        # dos deltas) continua gravado e os saves seguintes não falham
+        crowded = AdvancedCheckpointSaver(
+            CheckpointConfig(auto_checkpoint_interval=0, max_checkpoints_per_session=2), storage=storage
+        )
+        for name in ("inicio", "revisao"):
+            crowded.create_milestone_checkpoint("lotada", {"messages": [name]}, name)
+        state = {"messages": []}
+        for step in range(3):
+            state["messages"].append(f"mensagem {step}")
+            newest = crowded.save_checkpoint(session_id="lotada", state=state)
+            assert storage.checkpoint_exists(newest)
+        assert crowded.load_checkpoint(newest) == state
+        regular = [cp for cp in storage.list_checkpoints(session_id="lotada")
+                   if cp.checkpoint_type != CheckpointType.MILESTONE]
+        # Além do mais recente, só o que a cadeia de deltas dele precisa
+        assert regular[0].id == newest and len(regular) <= regular[0].chain_length + 1
+    
+    def test_listing_filters_tags_before_limit_and_sql_statistics(self, tmp_path):
+        """Testa filtro de tags antes do LIMIT, colunas tipadas e estatísticas via SQL."""
+        storage = SQLiteCheckpointStorage(db_path=str(tmp_path / "checkpoints.db"))
+        saver = AdvancedCheckpointSaver(
+            CheckpointConfig(auto_checkpoint_interval=0, max_checkpoints_per_session=0),
+            storage=storage
+        )
+        
+        tagged = saver.save_checkpoint(session_id="sessao", state={"step": 0}, tags=["revisao", "fiscal"])
+        for step in range(1, 6):
+            saver.save_checkpoint(session_id="sessao", state={"step": step}, tags=["rotina"])
+        saver.save_checkpoint(session_id="outra", state={"step": 0}, checkpoint_type=CheckpointType.MILESTONE)
+        
+        # O checkpoint marcado é o mais antigo: filtrar depois do LIMIT o perderia
+        assert [cp.id for cp in saver.list_checkpoints(session_id="sessao", tags=["revisao"], limit=2)] == [tagged]
+        assert len(saver.list_checkpoints(tags=["revisao", "rotina"], limit=10)) == 6
+        assert saver.list_checkpoints(tags=["revisao", "rotina"], match_all_tags=True) == []
+        
+        latest = storage.list_checkpoints(session_id="sessao", limit=1)[0]
+        assert latest.is_delta and latest.chain_length == 5
+        assert latest.to_dict() == saver.storage.load_checkpoint(latest.id)[1].to_dict()
+        
+        stats = saver.get_checkpoint_statistics()
+        assert stats["total"] == 7
+        assert stats["by_type"] == {"manual": 6, "milestone": 1}
+        assert sum(c["count"] for c in stats["compression_stats"].values()) == 7
+        assert saver.get_checkpoint_statistics("sessao")["total"] == 6
+        
+        storage.delete_checkpoint(tagged)
+        assert saver.list_checkpoints(tags=["revisao"]) == []
+    
+    def test_content_addressed_chunks_are_shared_and_collected(self, tmp_path):
+        """Testa deduplicação de chunks entre checkpoints e coleta por refcount."""
+        storage = SQLiteCheckpointStorage(db_path=str(tmp_path / "checkpoints.db"))
+        saver = AdvancedCheckpointSaver(
+            CheckpointConfig(auto_checkpoint_interval=0, enable_incremental=False,
+                             max_checkpoints_per_session=0),
+            storage=storage
+        )
+        messages = [{"role": "user", "content": f"mensagem {i}"} for i in range(150)]
+        
+        first = saver.save_checkpoint(session_id="sessao", state={"messages": messages[:140], "step": 1})
+        second = saver.save_checkpoint(session_id="sessao", state={"messages": messages, "step": 2})
+        
+        # 150 mensagens, 2 valores de "step" e 4 grupos: os dois grupos
+        # completos de 64 mensagens são compartilhados pelos checkpoints
+        assert storage.get_chunk_statistics()["unique_chunks"] == 150 + 2 + 4
+        assert saver.load_checkpoint(first)["messages"] == messages[:140]
+        assert saver.load_checkpoint(second) == {"messages": messages, "step": 2}
+        
+        storage.delete_checkpoint(first)
+        assert saver.load_checkpoint(second)["messages"] == messages
+        storage.delete_checkpoint(second)
+        assert storage.get_chunk_statistics()["unique_chunks"] == 0
+
+    def test_zstd_dictionary_compression(self, tmp_path):
+        """Testa treino do dicionário zstd e leitura com outro saver."""
+        pytest.importorskip("zstandard")
+        storage = SQLiteCheckpointStorage(db_path=str(tmp_path / "checkpoints.db"))
+        config = CheckpointConfig(auto_checkpoint_interval=0, max_checkpoints_per_session=0,
+                                  content_addressed=False, compression_type=CompressionType.ZSTD_DICT)
+        saver = AdvancedCheckpointSaver(config, storage=storage)
+        messages = []
+        for i in range(100):
+            messages.append({"role": "user", "content": f"cláusula {i} do contrato social da holding " * 8})
+            saver.save_checkpoint(session_id="treino", state={"messages": list(messages)})
+        
+        dict_id = saver.train_compression_dictionary()
+        assert dict_id is not None
+        checkpoint_id = saver.save_checkpoint(
+            session_id="sessao", state={"messages": [{"role": "user", "content": "cláusula 7 do contrato social"}]}
+        )
+        assert storage.list_checkpoints(session_id="sessao")[0].compression == CompressionType.ZSTD_DICT
+        
+        # Outro saver (compressão diferente) encontra o dicionário pelo ID do frame
+        reader = AdvancedCheckpointSaver(
+            CheckpointConfig(auto_checkpoint_interval=0, compression_type=CompressionType.GZIP),
+            storage=SQLiteCheckpointStorage(db_path=str(tmp_path / "checkpoints.db"))
+        )
+        assert reader.load_checkpoint(checkpoint_id)["messages"][0]["content"] == "cláusula 7 do contrato social"
+    
+    def test_gzip_accepts_zstd_compression_level(self, tmp_path):
+        """Testa que um nível ajustado para o zstd não quebra a compressão gzip."""
+        storage = SQLiteCheckpointStorage(db_path=str(tmp_path / "checkpoints.db"))
+        saver = AdvancedCheckpointSaver(
+            CheckpointConfig(auto_checkpoint_interval=0, content_addressed=False,
+                             compression_type=CompressionType.GZIP, compression_level=19),
+            storage=storage
+        )
+        state = {"messages": [{"role": "user", "content": "cláusula de não concorrência " * 100}]}
+        checkpoint_id = saver.save_checkpoint(session_id="sessao", state=state)
+        
+        assert storage.list_checkpoints(session_id="sessao")[0].compression == CompressionType.GZIP
+        assert saver.load_checkpoint(checkpoint_id)["messages"] == state["messages"]
+    
+    def test_versioned_serialization_and_partial_load(self, tmp_path):
+        """Testa o formato msgpack versionado, leitura parcial e pickle legado."""
+        import pickle
+        from langchain_core.messages import AIMessage, HumanMessage
+        
+        storage = SQLiteCheckpointStorage(db_path=str(tmp_path / "checkpoints.db"))
+        saver = AdvancedCheckpointSaver(
+            CheckpointConfig(auto_checkpoint_interval=0, content_addressed=False), storage=storage
+        )
+        messages = [HumanMessage("Qual o prazo da impugnação?"), AIMessage("30 dias.", id="m1")]
+        state = {"messages": messages, "context": {"area": "tributario"}}
+        checkpoint_id = saver.save_checkpoint(session_id="sessao", state=state)
+        
+        assert saver.load_checkpoint(checkpoint_id) == state
+        assert saver.load_checkpoint(checkpoint_id, keys=["context"]) == {"context": {"area": "tributario"}}
+        
+        payload = encode_state_payload(state, STATE_SERIALIZERS[SerializationFormat.MSGPACK], lazy=True)
+        assert payload.startswith(STATE_MAGIC)
+        assert decode_state_payload(payload, keys=["messages"]) == {"messages": messages}
+        with pytest.raises(ValueError):
+            decode_state_payload(pickle.dumps({"legado": True}))
+        assert decode_state_payload(pickle.dumps({"legado": True}), allow_pickle=True) == {"legado": True}
+        with pytest.raises(ValueError):
+            decode_state_payload(STATE_MAGIC + bytes([STATE_SCHEMA_VERSION + 1]) + payload[4:])
+    
+    def test_state_serializer_requires_codec(self):
+        """Testa que um serializador sem loads é recusado na criação."""
+        class SoGravacao(StateSerializer):
+            format = SerializationFormat.MSGPACK
+            
+            def dumps(self, value):
+                return b""
+        
+        with pytest.raises(TypeError):
+            SoGravacao()
+    
+    def test_msgpack_load_does_not_run_payload_code(self, tmp_path):
+        """Testa que tipos estendidos adulterados não importam nem chamam nada fora da lista."""
+        import ormsgpack
+        from langgraph.checkpoint.serde.jsonplus import EXT_CONSTRUCTOR_SINGLE_ARG, EXT_PYDANTIC_V2
+        
+        marker = tmp_path / "executado"
+        serializer = STATE_SERIALIZERS[SerializationFormat.MSGPACK]
+        crafted = ormsgpack.packb({
+            "cmd": ormsgpack.Ext(EXT_CONSTRUCTOR_SINGLE_ARG, ormsgpack.packb(("os", "system", f"touch {marker}"))),
+            "model": ormsgpack.Ext(EXT_PYDANTIC_V2, ormsgpack.packb(("os", "system", {"x": 1}, "model_validate"))),
+        })
+        payload = STATE_MAGIC + bytes([STATE_SCHEMA_VERSION, 1, 0]) + crafted
+        
+        assert decode_state_payload(payload) == {"cmd": f"touch {marker}", "model": {"x": 1}}
+        assert not marker.exists()
+        
+        # Tipos registrados continuam sendo reconstruídos
+        value = {"quando": datetime(2024, 5, 1, 12, 30), "status": CheckpointType.MILESTONE}
+        assert serializer.loads(serializer.dumps(value)) == {"quando": value["quando"], "status": "milestone"}
+        register_state_type(CheckpointType)
+        assert serializer.loads(serializer.dumps(value)) == value
+    
+    def test_file_storage_mmap_segments_and_compaction(self, tmp_path):
+        """Testa o backend de arquivos: conteúdo em segmentos, leitura via mmap e compactação."""
+        import random
+        
+        def open_saver():
+            storage = FileCheckpointStorage(db_path=str(tmp_path / "checkpoints.db"),
+                                            segment_size=64 * 1024, inline_threshold=1024)
+            config = CheckpointConfig(auto_checkpoint_interval=0, max_checkpoints_per_session=2,
+                                      enable_incremental=False, content_addressed=False)
+            return storage, AdvancedCheckpointSaver(config, storage=storage)
+        
+        storage, saver = open_saver()
+        rng = random.Random(0)
+        ids = []
+        for step in range(6):
+            document = "".join(rng.choice("abcdefghij ") for _ in range(40000))
+            ids.append(saver.save_checkpoint(session_id="sessao", state={"documento": document, "step": step}))
+        
+        # Conteúdo fora do SQLite, lido como memoryview sobre o segmento
+        data, metadata = storage.load_checkpoint(ids[-1])
+        assert isinstance(data, memoryview) and len(data) == metadata.size_bytes
+        assert saver.load_checkpoint(ids[-1])["step"] == 5
+        
+        # A retenção deixa bytes mortos; a compactação remove os segmentos antigos
+        before = storage.get_file_statistics()
+        assert before["segments"] > 1 and before["dead_ratio"] > 0.5
+        
+        # Um leitor com memoryview sobre um segmento compactado segura o
+        # mapeamento e o arquivo até soltar a view
+        oldest = storage._segment_numbers()[0]
+        pinned = storage._view(oldest, 0, 64)
+        expected = bytes(pinned)
+        result = storage.compact()
+        assert result["segments_removed"] >= 1 and oldest not in storage._maps
+        assert storage._segment_path(oldest).exists() and bytes(pinned) == expected
+        assert saver.load_checkpoint(ids[-1])["step"] == 5
+        del pinned
+        storage._release_retired()
+        assert not storage._segment_path(oldest).exists() and not storage._retired
+        
+        after = storage.get_file_statistics()
+        assert after["total_bytes"] < before["total_bytes"] and after["live_bytes"] == before["live_bytes"]
+        storage.close()
+        
+        storage, saver = open_saver()
+        assert [saver.load_checkpoint(checkpoint_id)["step"] for checkpoint_id in ids[-2:]] == [4, 5]
+        storage.close()
+    
+    def test_write_behind_backpressure_and_drain(self, tmp_path):
+        """Testa a fila de escrita: leitura após escrita, backpressure e drenagem no shutdown."""
+        import threading
+        import time
+        
+        storage = SQLiteCheckpointStorage(db_path=str(tmp_path / "checkpoints.db"))
+        config = CheckpointConfig(auto_checkpoint_interval=0, max_checkpoints_per_session=0,
+                                  durability_mode=DurabilityMode.ASYNC,
+                                  write_queue_size=2, write_queue_timeout=0.2)
+        saver = AdvancedCheckpointSaver(config, storage=storage)
+        
+        # Leituras aguardam as escritas enfileiradas
+        messages = []
+        for step in range(5):
+            messages.append({"role": "user", "content": f"mensagem {step}"})
+            last = saver.save_checkpoint(session_id="sessao", state={"messages": list(messages), "step": step})
+        assert saver.load_checkpoint(last)["step"] == 4
+        assert len(saver.list_checkpoints(session_id="sessao")) == 5
+        
+        # Com o escritor parado, a fila enche e save_checkpoint falha no timeout
+        release = threading.Event()
+        write_batch = storage.write_batch
+        storage.write_batch = lambda operations: release.wait() and write_batch(operations)
+        with pytest.raises(RuntimeError):
+            for step in range(5, 10):
+                saver.save_checkpoint(session_id="sessao", state={"messages": list(messages), "step": step})
+        
+        # Submits concorrentes esperam vaga em paralelo, não um atrás do outro
+        # pelo lock da fila, e flush não fica preso atrás deles
+        failures = []
+        
+        def submit_blocked():
+            try:
+                saver._write_queue.submit("checkpoint", ())
+            except RuntimeError as e:
+                failures.append(e)
+        
+        started = time.perf_counter()
+        threads = [threading.Thread(target=submit_blocked) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        assert saver.flush(timeout=0.05) is False
+        for thread in threads:
+            thread.join()
+        assert len(failures) == 4 and time.perf_counter() - started < 0.6
+        
+        # O shutdown grava o que estava na fila antes de encerrar
+        release.set()
+        saver.shutdown()
+        assert len(storage.list_checkpoints(session_id="sessao")) > 5
+        assert storage.get_statistics()["total"] == len(storage.list_checkpoints(session_id="sessao"))
+        with pytest.raises(RuntimeError):
+            saver.save_checkpoint(session_id="sessao", state={"step": 99})
+    
+    @pytest.mark.asyncio
+    async def test_auto_checkpoint_scheduler_coalesces_dirty_sessions(self, tmp_path):
+        """Testa o agendador: marcações agrupadas por sessão, ciclo periódico e gravação no stop."""
+        import checkpointing
+        
+        saver = AdvancedCheckpointSaver(
+            CheckpointConfig(auto_checkpoint_interval=0, max_checkpoints_per_session=0),
+            storage=SQLiteCheckpointStorage(db_path=str(tmp_path / "checkpoints.db"))
+        )
+        scheduler = AutoCheckpointScheduler(saver, interval=0.05)
+        
+        for step in range(3):
+            scheduler.mark_dirty("sessao", {"step": step})
+        scheduler.mark_dirty("outra", {"step": 0})
+        assert scheduler.dirty_sessions == 2 and scheduler.coalesced == 2
+        
+        await scheduler.start()
+        await asyncio.sleep(0.15)
+        checkpoints = saver.list_checkpoints(session_id="sessao")
+        assert len(checkpoints) == 1 and checkpoints[0].checkpoint_type == CheckpointType.AUTOMATIC
+        assert saver.load_checkpoint(checkpoints[0].id) == {"step": 2}
+        
+        # O decorador usa o saver global; com deferred, apenas marca a sessão
+        @checkpointing.auto_checkpoint(deferred=True)
+        async def node(state):
+            return {**state, "step": state["step"] + 1}
+        
+        with patch.object(checkpointing, "advanced_checkpoint_saver", saver), \
+                patch.object(checkpointing, "auto_checkpoint_scheduler", scheduler):
+            await node({"session_id": "decorada", "step": 0})
+            await scheduler.stop()
+            assert not scheduler.running
+            await node({"session_id": "decorada", "step": 5})
+        
+        loaded = [saver.load_checkpoint(cp.id) for cp in saver.list_checkpoints(session_id="decorada")]
+        assert [state["step"] for state in loaded] == [6, 1]
+    
+    @pytest.mark.asyncio
+    async def test_auto_checkpoint_scheduler_from_graph_steps(self, tmp_path):
+        """Testa o agendador de ponta a ponta: passos do grafo marcam a thread e o ciclo grava."""
+        import operator
+        from typing import Annotated, TypedDict
+        from langgraph.graph import StateGraph, START, END
+        
+        class State(TypedDict):
+            messages: Annotated[list, operator.add]
+            area: str
+        
+        saver = AdvancedCheckpointSaver(
+            CheckpointConfig(auto_checkpoint_interval=0, max_checkpoints_per_session=0),
+            storage=SQLiteCheckpointStorage(db_path=str(tmp_path / "checkpoints.db"))
+        )
+        workflow = StateGraph(State)
+        workflow.add_node("classificar", lambda state: {"messages": ["classificada"], "area": "tributario"})
+        workflow.add_node("responder", lambda state: {"messages": ["resposta"]})
+        workflow.add_edge(START, "classificar")
+        workflow.add_edge("classificar", "responder")
+        workflow.add_edge("responder", END)
+        graph = workflow.compile(checkpointer=saver)
+        
+        scheduler = AutoCheckpointScheduler(saver, interval=0.05)
+        await scheduler.start()
+        await graph.ainvoke({"messages": ["consulta"], "area": ""}, {"configurable": {"thread_id": "thread-1"}})
+        # Três passos do grafo, agrupados em um checkpoint no ciclo
+        assert scheduler.coalesced >= 1
+        await asyncio.sleep(0.15)
+        
+        checkpoints = saver.list_checkpoints(session_id="thread-1")
+        assert [cp.checkpoint_type for cp in checkpoints] == [CheckpointType.AUTOMATIC]
+        assert saver.load_checkpoint(checkpoints[0].id) == {
+            "messages": ["consulta", "classificada", "resposta"], "area": "tributario"
+        }
+        
+        # Parado, o agendador deixa de receber os passos
+        await scheduler.stop()
+        await graph.ainvoke({"messages": ["outra"], "area": ""}, {"configurable": {"thread_id": "thread-2"}})
+        assert saver.auto_checkpoints is None and scheduler.dirty_sessions == 0
+    
+    @pytest.mark.asyncio
+    async def test_langgraph_checkpointer_persists_threads(self, tmp_path):
+        """Testa o saver como checkpointer de um grafo, com retenção e reabertura."""
+        import operator
+        from typing import Annotated, TypedDict
+        from langgraph.graph import StateGraph, START, END
+        
+        class State(TypedDict):
+            messages: Annotated[list, operator.add]
+        
+        def build(saver):
+            workflow = StateGraph(State)
+            workflow.add_node("responder", lambda state: {"messages": ["resposta " * 300]})
+            workflow.add_edge(START, "responder")
+            workflow.add_edge("responder", END)
+            return workflow.compile(checkpointer=saver)
+        
+        db_path = str(tmp_path / "checkpoints.db")
+        config = CheckpointConfig(auto_checkpoint_interval=0, max_checkpoints_per_session=4)
+        thread = {"configurable": {"thread_id": "sessao"}}
+        
+        storage = SQLiteCheckpointStorage(db_path=db_path)
+        graph = build(AdvancedCheckpointSaver(config, storage=storage))
+        graph.invoke({"messages": ["pergunta 1"]}, thread)
+        await graph.ainvoke({"messages": ["pergunta 2"]}, thread)
+        
+        # Retenção por thread e compressão dos snapshots
+        rows = storage.list_graph_checkpoints(thread_id="sessao")
+        assert len(rows) == 4
+        assert {row["compression"] for row in rows} == {config.compression_type.value}
+        storage.close()
+        
+        # Outro processo (novo saver sobre o mesmo banco) retoma o thread
+        saver = AdvancedCheckpointSaver(config, storage=SQLiteCheckpointStorage(db_path=db_path))
+        state = build(saver).get_state(thread)
+        assert state.values["messages"][0] == "pergunta 1"
+        assert len(state.values["messages"]) == 4
+        assert [c async for c in saver.alist(thread, limit=2)][0].config == state.config
+        
+        await saver.adelete_thread("sessao")
+        assert saver.get_tuple(thread) is None
+    
+    @pytest.mark.asyncio
+    async def test_graphs_sharing_saver_keep_threads_apart(self, tmp_path):
+        """Testa dois grafos no mesmo saver e thread_id: estados e retenção separados."""
+        import operator
+        from typing import Annotated, TypedDict
+        from langgraph.graph import StateGraph, START, END
+        
+        class Consulta(TypedDict):
+            messages: Annotated[list, operator.add]
+        
+        class Contrato(TypedDict):
+            clausulas: Annotated[list, operator.add]
+        
+        def build(state_type, key, graph_name):
+            workflow = StateGraph(state_type)
+            workflow.add_node("passo", lambda state: {key: [graph_name]})
+            workflow.add_edge(START, "passo")
+            workflow.add_edge("passo", END)
+            return workflow.compile(checkpointer=saver.for_graph(graph_name))
+        
+        saver = AdvancedCheckpointSaver(
+            CheckpointConfig(auto_checkpoint_interval=0, max_checkpoints_per_session=3),
+            storage=SQLiteCheckpointStorage(db_path=str(tmp_path / "checkpoints.db"))
+        )
+        master = build(Consulta, "messages", "master")
+        contratos = build(Contrato, "clausulas", "contratos")
+        thread = {"configurable": {"thread_id": "copilotkit-1"}}
+        
+        master.invoke({"messages": ["pergunta"]}, thread)
+        for i in range(3):
+            await contratos.ainvoke({"clausulas": [f"cláusula {i}"]}, thread)
+        
+        # Cada grafo retoma só o próprio estado; a retenção de um não poda o outro
+        assert master.get_state(thread).values == {"messages": ["pergunta", "master"]}
+        assert len(contratos.get_state(thread).values["clausulas"]) == 6
+        assert master.get_state(thread).config["configurable"]["thread_id"] == "copilotkit-1"
+        assert len(list(saver.for_graph("master").list(thread))) == 3
+        assert {c.config["configurable"]["thread_id"] for c in saver.for_graph("master").list(None)} == {"copilotkit-1"}
+        
+        saver.for_graph("contratos").delete_thread("copilotkit-1")
+        assert contratos.get_state(thread).values == {}
+        assert master.get_state(thread).values["messages"] == ["pergunta", "master"]
 
 
 class TestObservability:
@@ -223,6 +753,225 @@ class TestObservability:
         
         assert event.event_type == EventType.AGENT_START
         assert event.agent_name == "test_agent"
+    
+    @pytest.mark.asyncio
+    async def test_trace_context_isolated_per_task_with_parent_spans(self):
+        """Testa contexto de trace por task, spans pai/filho e propagação no gather."""
+        manager = ObservabilityManager(ObservabilityConfig(langsmith_enabled=False, trace_level=TraceLevel.DEBUG))
+        
+        async def run(agent_name):
+            trace_id = manager.start_trace(agent_name)
+            with manager.trace_node("externo") as outer:
+                with manager.trace_node("interno") as inner:
+                    await asyncio.sleep(0.01)
+                    assert manager.current_trace_id == trace_id
+                    assert manager.current_node_name == "interno"
+                    manager.log_tool_call("busca", {})
+                assert manager.current_span_id == outer
+                assert manager.current_node_name == "externo"
+            manager.end_trace(trace_id)
+            assert manager.current_trace_id is None
+            return trace_id, outer, inner
+        
+        runs = await asyncio.gather(run("agente_a"), run("agente_b"))
+        events = {e.id: e for e in manager.trace_events}
+        for (trace_id, outer, inner), agent_name in zip(runs, ["agente_a", "agente_b"]):
+            root = next(e for e in events.values() if e.trace_id == trace_id and e.event_type == EventType.AGENT_START)
+            assert events[outer].parent_id == root.id
+            assert events[inner].parent_id == outer
+            tool = next(e for e in events.values() if e.trace_id == trace_id and e.event_type == EventType.TOOL_CALL)
+            assert (tool.parent_id, tool.node_name, tool.agent_name) == (inner, "interno", agent_name)
+        
+        # Cada tarefa do map vira um span filho do nodo que chamou execute_parallel_tasks
+        tasks = [{"id": f"t{i}", "agent": agent, "description": "x", "estimated_time": 0.1}
+                 for i, agent in enumerate(["tributario", "contratos"])]
+        with patch("observability._global_observability_manager", manager):
+            trace_id = manager.start_trace("master")
+            with manager.trace_node("map_reduce") as parent:
+                result = await execute_parallel_tasks.ainvoke({"map_tasks": tasks, "max_workers": 2})
+            manager.end_trace(trace_id)
+        assert result["execution_successful"] is True
+        children = [e for e in manager.trace_events
+                    if e.trace_id == trace_id and e.event_type == EventType.NODE_ENTER and e.parent_id == parent]
+        assert sorted(e.node_name for e in children) == ["map_contratos", "map_tributario"]
+    
+    def test_trace_summary_from_per_trace_index(self):
+        """Testa resumo O(1) por trace com buffer circular e agregados."""
+        manager = ObservabilityManager(ObservabilityConfig(
+            langsmith_enabled=False, max_trace_events=5, max_indexed_traces=2, max_events_per_trace=3
+        ))
+        trace_id = manager.start_trace("agente")
+        for i in range(4):
+            manager.log_tool_call(f"ferramenta_{i}", {}, error=ValueError("falha") if i == 3 else None)
+        manager.end_trace(trace_id)
+        
+        summary = manager.get_trace_summary(trace_id)
+        # Agregados contam todos os eventos, mesmo os que já saíram dos buffers
+        assert summary["total_events"] == 6
+        assert summary["event_counts"] == {"agent_start": 1, "tool_call": 4, "agent_end": 1}
+        assert summary["error_count"] == 1 and summary["success"] is False
+        assert [e.event_type for e in manager.get_trace_events(trace_id)] == [
+            EventType.TOOL_CALL, EventType.TOOL_CALL, EventType.AGENT_END
+        ]
+        
+        # CRITICAL também conta como erro
+        manager.add_trace_event(TraceEvent("critico", trace_id, None, EventType.ERROR, level=TraceLevel.CRITICAL))
+        assert manager.get_trace_summary(trace_id)["error_count"] == 2
+        
+        # Só os traces mais recentes ficam indexados
+        for agent in ("b", "c"):
+            manager.end_trace(manager.start_trace(agent))
+        assert "error" in manager.get_trace_summary(trace_id)
+        assert manager.get_trace_summary(manager.start_trace("d"))["total_events"] == 1
+    
+    def test_trace_event_lazy_message_and_level_filter(self):
+        """Testa eventos compactos, formatação tardia e filtro de nível pré-calculado."""
+        manager = ObservabilityManager(ObservabilityConfig(langsmith_enabled=False))
+        trace_id = manager.start_trace("agente")
+        with manager.trace_node("nodo"):
+            manager.log_state_update({"a": 1}, {"a": 2})
+        # INFO: eventos DEBUG (nodo/estado) nem chegam a ser montados
+        assert [e.event_type for e in manager.get_trace_events(trace_id)] == [EventType.AGENT_START]
+        
+        manager.set_trace_level(TraceLevel.DEBUG)
+        with pytest.raises(ValueError):
+            with manager.trace_node("nodo"):
+                raise ValueError("quebrou")
+        enter, error, exit_ = manager.get_trace_events(trace_id)[1:]
+        assert not hasattr(enter, "__dict__")
+        assert error.message == "Error in node nodo: quebrou" and "ValueError" in error.stack_trace
+        assert enter.timestamp_ns <= exit_.timestamp_ns and exit_.duration_ms >= 0
+        assert exit_.to_dict()["message"] == "Exiting node nodo"
+        assert isinstance(exit_.to_dict()["timestamp"], str)
+    
+    def test_batched_export_to_jsonl_and_otlp_collector(self, tmp_path):
+        """Testa exportação em lotes para JSONL rotativo e coletor OTLP local."""
+        import gzip
+        import threading
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+        
+        received = []
+        
+        class Collector(BaseHTTPRequestHandler):
+            def do_POST(self):
+                received.append((self.path, json.loads(self.rfile.read(int(self.headers["Content-Length"])))))
+                self.send_response(200)
+                self.end_headers()
+            
+            def log_message(self, *args):
+                pass
+        
+        server = HTTPServer(("127.0.0.1", 0), Collector)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        
+        def run(level: TraceLevel, export_dir):
+            received.clear()
+            manager = ObservabilityManager(ObservabilityConfig(
+                langsmith_enabled=False,
+                trace_level=level,
+                export_jsonl_dir=str(export_dir),
+                export_jsonl_max_bytes=2000,
+                otlp_endpoint=f"http://127.0.0.1:{server.server_port}/v1/traces",
+                export_batch_size=4,
+                flush_interval_seconds=60
+            ))
+            trace_id = manager.start_trace("agente")
+            for i in range(10):
+                with manager.trace_node(f"nodo_{i}"):
+                    with manager.trace_node("interno"):
+                        manager.log_tool_call("busca", {"i": i})
+            manager.end_trace(trace_id)
+            manager.shutdown()
+            spans = [span for path, body in received
+                     for span in body["resourceSpans"][0]["scopeSpans"][0]["spans"]]
+            assert {path for path, _ in received} == {"/v1/traces"}
+            return manager, spans
+        
+        def check_spans(spans):
+            # Um span por nodo e um pela sessão, com o intervalo medido; todo
+            # parentSpanId aponta para um span exportado
+            by_id = {span["spanId"]: span for span in spans}
+            assert len(spans) == len(by_id) == 31
+            assert all(span["parentSpanId"] in by_id for span in spans if span["parentSpanId"])
+            root = next(span for span in spans if not span["parentSpanId"])
+            assert root["name"] == "agente" and int(root["endTimeUnixNano"]) > int(root["startTimeUnixNano"])
+            node = next(span for span in spans if span["name"] == "nodo_3")
+            inner = next(span for span in spans if span["parentSpanId"] == node["spanId"])
+            tool = next(span for span in spans if span["parentSpanId"] == inner["spanId"])
+            assert node["parentSpanId"] == root["spanId"] and inner["name"] == "interno"
+            assert tool["name"] == "tool_call"
+            assert int(node["startTimeUnixNano"]) <= int(tool["startTimeUnixNano"]) <= int(node["endTimeUnixNano"])
+            assert {span["traceId"] for span in spans} == {root["traceId"]}
+        
+        try:
+            manager, spans = run(TraceLevel.DEBUG, tmp_path / "export")
+            stats = manager.exporter.get_stats()
+            assert (stats["queued"], stats["exported"], stats["dropped"], stats["failed"]) == (0, 52, 0, 0)
+            check_spans(spans)
+            
+            # Em INFO os eventos de nodo não são registrados, mas os spans sim
+            manager, spans = run(TraceLevel.INFO, tmp_path / "export_info")
+            assert not any(e.event_type == EventType.NODE_EXIT for e in manager.trace_events)
+            check_spans(spans)
+            info_lines = [json.loads(line) for f in (tmp_path / "export_info").glob("traces-*.jsonl.gz")
+                          for line in gzip.open(f, "rt")]
+            assert len(info_lines) == 12
+        finally:
+            server.shutdown()
+        
+        files = sorted((tmp_path / "export").glob("traces-*.jsonl.gz"))
+        lines = [json.loads(line) for f in files for line in gzip.open(f, "rt")]
+        assert len(files) > 1 and len(lines) == 52
+        assert lines[-1]["event_type"] == "agent_end" and lines[-1]["message"] == "Agent agente completed"
+        
+        # Sink lento: a fila enche, submit descarta sem bloquear e o encerramento drena
+        release = threading.Event()
+        
+        class SlowSink(TraceSink):
+            exported = 0
+            
+            def export(self, events):
+                release.wait(5)
+                SlowSink.exported += len(events)
+        
+        exporter = BatchExporter([SlowSink()], max_queue_size=2, batch_size=1, flush_interval=60)
+        events = [TraceEvent(str(i), "t", None, EventType.TOOL_CALL) for i in range(10)]
+        accepted = sum(exporter.submit(event) for event in events)
+        assert exporter.dropped == 10 - accepted and exporter.dropped >= 7
+        release.set()
+        exporter.shutdown()
+        assert SlowSink.exported == accepted and not exporter.submit(events[0])
+    
+    def test_trace_sink_requires_export(self):
+        """Testa que um sink sem export é recusado na criação."""
+        class SemExport(TraceSink):
+            name = "sem_export"
+        
+        with pytest.raises(TypeError):
+            SemExport()
+    
+    def test_performance_monitor_streaming_percentiles(self):
+        """Testa percentis por histograma com janelas de tempo deslizantes."""
+        monitor = PerformanceMonitor(max_metrics=10)
+        for value in range(1, 1001):
+            monitor.record_latency("busca", float(value), "agente", "nodo")
+        
+        summary = monitor.get_metrics_summary()["latency"]
+        assert summary["count"] == 1000 and len(monitor.metrics) == 10
+        assert (summary["min"], summary["max"]) == (1.0, 1000.0)
+        for key, expected in (("p50", 500), ("p95", 950), ("p99", 990)):
+            assert abs(summary[key] - expected) / expected <= 0.02
+        
+        [entry] = monitor.get_histogram_summaries()
+        assert (entry["agent_name"], entry["node_name"], entry["name"]) == ("agente", "nodo", "busca_latency")
+        
+        # Buckets fora da janela são descartados; o total acumulado permanece
+        rolling = RollingHistogram(bucket_seconds=60, num_buckets=3)
+        for minute, value in enumerate([10.0, 20.0, 30.0, 40.0]):
+            rolling.add(value, now=minute * 60)
+        assert rolling.window(60, now=180).max == 40.0
+        assert rolling.window(3600, now=180).count == 3
+        assert rolling.total.count == 4
 
 
 class TestMapReduce:
@@ -294,6 +1043,424 @@ class TestPersistentMemory:
         assert entry.access_level == AccessLevel.INTERNAL
         assert "teste" in entry.tags
 
+    def test_full_text_search_ignores_accents(self, tmp_path):
+        """Testa busca FTS5 sem acentos e ordenada por BM25."""
+        memory = PersistentMemorySystem(db_path=str(tmp_path / "memory.db"))
+        for title, content in [
+            ("Reforma Tributária - EC 132/2023", "Cria CBS e IBS com transição até 2032."),
+            ("Holding patrimonial", "Menciona a reforma tributária apenas de passagem."),
+        ]:
+            memory.store_memory(MemoryEntry(
+                id=f"mem_{title[:8]}",
+                memory_type=MemoryType.COMPLIANCE_RULE,
+                title=title,
+                content=content,
+                tags=[],
+                access_level=AccessLevel.PUBLIC,
+                created_at=datetime.now(),
+                updated_at=datetime.now()
+            ))
+        
+        results = memory.search_memories("reforma tributaria")
+        
+        assert [m.title for m in results][0] == "Reforma Tributária - EC 132/2023"
+        assert len(results) == 2
+        assert memory.search_memories("inexistente") == []
+        # Só stopwords ou pontuação não viram "sem consulta"
+        assert memory.search_memories("de que para") == []
+        assert memory.search_memories("?!") == []
+        assert memory.hybrid_search("?!") == []
+        assert len(memory.search_memories("")) == 2
+    
+    def test_tag_filter_exact_match_and_modes(self, tmp_path):
+        """Testa filtro por tags normalizadas com semântica AND/OR."""
+        memory = PersistentMemorySystem(db_path=str(tmp_path / "memory.db"))
+        for memory_id, tags in [("irpj", ["IRPJ", "tributário"]), ("ir", ["ir", "pessoa física"])]:
+            memory.store_memory(MemoryEntry(
+                id=memory_id,
+                memory_type=MemoryType.COMPLIANCE_RULE,
+                title=f"Regra {memory_id}",
+                content="Conteúdo",
+                tags=tags,
+                access_level=AccessLevel.PUBLIC,
+                created_at=datetime.now(),
+                updated_at=datetime.now()
+            ))
+        
+        assert [m.id for m in memory.search_memories("", tags=["ir"])] == ["ir"]
+        assert [m.id for m in memory.search_memories("", tags=["irpj", "tributário"])] == ["irpj"]
+        assert memory.search_memories("", tags=["irpj", "ir"]) == []
+        assert {m.id for m in memory.search_memories("", tags=["irpj", "ir"], tag_mode="any")} == {"ir", "irpj"}
+    
+    def test_vector_and_hybrid_search(self, tmp_path):
+        """Testa índice vetorial incremental e ranking híbrido."""
+        pytest.importorskip("numpy")
+        db_path = str(tmp_path / "memory.db")
+        memory = PersistentMemorySystem(db_path=db_path)
+        for memory_id, title, content in [
+            ("resp", "Limitação de responsabilidade", "Cláusula limita indenização contratual"),
+            ("hold", "Holding familiar", "Planejamento sucessório e proteção patrimonial"),
+        ]:
+            memory.store_memory(MemoryEntry(
+                id=memory_id,
+                memory_type=MemoryType.LEGAL_PRECEDENT,
+                title=title,
+                content=content,
+                tags=[],
+                access_level=AccessLevel.PUBLIC,
+                created_at=datetime.now(),
+                updated_at=datetime.now()
+            ))
+        
+        assert memory.vector_search("sucessório patrimonial")[0].id == "hold"
+        assert memory.hybrid_search("indenização contratual")[0].id == "resp"
+        
+        reopened = PersistentMemorySystem(db_path=db_path)
+        assert len(reopened.vector_index) == 2
+        assert reopened.vector_search("holding")[0].id == "hold"
+    
+    def test_vector_index_migration_reads_in_batches(self, tmp_path, monkeypatch):
+        """Testa que entradas sem vetor são indexadas em lotes ao abrir o banco."""
+        pytest.importorskip("numpy")
+        import persistent_memory
+        
+        db_path = str(tmp_path / "memory.db")
+        memory = PersistentMemorySystem(db_path=db_path, vector_index_mode="off")
+        memory.store_memories_bulk([
+            MemoryEntry(
+                id=f"mem_{i}",
+                memory_type=MemoryType.LEGAL_PRECEDENT,
+                title=f"Precedente {i}",
+                content=f"Decisão sobre responsabilidade contratual {i}",
+                tags=[],
+                access_level=AccessLevel.PUBLIC,
+                created_at=datetime.now(),
+                updated_at=datetime.now()
+            )
+            for i in range(5)
+        ])
+        
+        batches = []
+        add = VectorIndex.add
+        
+        def recording_add(index, ids, texts):
+            batches.append(len(ids))
+            return add(index, ids, texts)
+        
+        monkeypatch.setattr(persistent_memory, "VECTOR_MIGRATION_BATCH_SIZE", 2)
+        monkeypatch.setattr(VectorIndex, "add", recording_add)
+        reopened = PersistentMemorySystem(db_path=db_path)
+        assert batches == [2, 2, 1]
+        assert len(reopened.vector_index) == 5
+    
+    def test_vector_index_follows_updates_and_deletes(self, tmp_path):
+        """Testa upsert e remoção no índice vetorial, com tombstones e compactação."""
+        import sqlite3
+        pytest.importorskip("numpy")
+        db_path = str(tmp_path / "memory.db")
+        memory = PersistentMemorySystem(db_path=db_path)
+        topics = ["indenização contratual", "sucessão patrimonial", "tributação de dividendos",
+                  "recuperação judicial", "marcas registradas", "rescisão trabalhista"]
+        entries = [
+            MemoryEntry(
+                id=f"mem_{i}",
+                memory_type=MemoryType.LEGAL_PRECEDENT,
+                title=topic.title(),
+                content=f"Precedente sobre {topic}",
+                tags=[],
+                access_level=AccessLevel.PUBLIC,
+                created_at=datetime.now(),
+                updated_at=datetime.now()
+            )
+            for i, topic in enumerate(topics)
+        ]
+        memory.store_memories_bulk(entries)
+        
+        # Conteúdo editado: o vetor antigo deixa de ranquear
+        entries[0].title, entries[0].content = "Fusões", "Aquisição de controle societário"
+        assert memory.update_memory(entries[0]) is True
+        assert "mem_0" not in {m.id for m in memory.vector_search("indenização contratual")}
+        assert memory.vector_search("aquisição de controle")[0].id == "mem_0"
+        assert memory.get_memory_by_id("mem_0").title == "Fusões"
+        assert len(memory.vector_index) == 6
+        
+        # Remoção abaixo do limite de compactação vira tombstone persistido
+        assert memory.delete_memory("mem_1") is True
+        assert "mem_1" not in {m.id for m in memory.vector_search("sucessão patrimonial")}
+        assert len(memory.vector_index._ids) == 6
+        reopened = PersistentMemorySystem(db_path=db_path)
+        assert len(reopened.vector_index) == 5
+        assert "mem_1" not in {m.id for m in reopened.vector_search("sucessão patrimonial")}
+        
+        # Acima do limite, os arquivos são regravados só com as linhas vivas
+        assert reopened.delete_memories(["mem_2", "inexistente"]) == 1
+        assert reopened.vector_index._ids == ["mem_0", "mem_3", "mem_4", "mem_5"]
+        assert not reopened.vector_index.deleted_path.exists()
+        assert reopened.vector_search("recuperação judicial")[0].id == "mem_3"
+        
+        # Remoções feitas fora do sistema são descartadas na abertura
+        with sqlite3.connect(db_path) as conn:
+            conn.execute("DELETE FROM memory_entries WHERE id = 'mem_4'")
+        assert "mem_4" not in PersistentMemorySystem(db_path=db_path).vector_index
+        
+        # No IVF, vetores sobrescritos mudam de grupo e a compactação retreina
+        index = VectorIndex(tmp_path / "ivf", HashingEmbeddings(), mode="ivf", min_ivf_size=8)
+        index.add([f"doc_{i}" for i in range(40)], [f"documento {i} tema {i % 5}" for i in range(40)])
+        assert index.search("documento 7 tema 2", k=1)[0][0] == "doc_7"
+        index.upsert(["doc_7"], ["cláusula penal abusiva"])
+        assert index.search("cláusula penal abusiva", k=1)[0][0] == "doc_7"
+        index.delete([f"doc_{i}" for i in range(10)])
+        assert index._centroids is None and len(index) == 30
+        assert not {"doc_7", "doc_8"} & {doc_id for doc_id, _ in index.search("documento 8 tema 3", k=30)}
+        assert index.search("documento 12 tema 2", k=1)[0][0] == "doc_12"
+        assert index._trained_count == 30
+    
+    def test_bulk_store_reports_per_row_outcomes(self, tmp_path):
+        """Testa ingestão em lote com deduplicação por hash de conteúdo."""
+        memory = PersistentMemorySystem(db_path=str(tmp_path / "memory.db"))
+        
+        def entry(memory_id, content):
+            return MemoryEntry(
+                id=memory_id,
+                memory_type=MemoryType.CASE_LAW,
+                title="Título",
+                content=content,
+                tags=["lote"],
+                access_level=AccessLevel.PUBLIC,
+                created_at=datetime.now(),
+                updated_at=datetime.now()
+            )
+        
+        memory.store_memory(entry("antigo", "já existente"))
+        outcomes = memory.store_memories_bulk([
+            entry("novo", "conteúdo novo"),
+            entry("copia", "já existente"),
+            entry("novo", "mesmo id, outro conteúdo"),
+        ])
+        
+        assert outcomes == [
+            ("novo", StoreOutcome.INSERTED),
+            ("copia", StoreOutcome.UPDATED),
+            ("novo", StoreOutcome.ERROR),
+        ]
+        assert len(memory.search_memories("", tags=["lote"])) == 2
+    
+    def test_access_stats_are_buffered_and_flushed(self, tmp_path, monkeypatch):
+        """Testa gravação adiada e em lote dos contadores de acesso."""
+        memory = PersistentMemorySystem(db_path=str(tmp_path / "memory.db"))
+        memory.store_memory(MemoryEntry(
+            id="hot",
+            memory_type=MemoryType.LEGAL_PRECEDENT,
+            title="Precedente",
+            content="Consultado com frequência",
+            tags=[],
+            access_level=AccessLevel.PUBLIC,
+            created_at=datetime.now(),
+            updated_at=datetime.now()
+        ))
+        
+        memory.record_access(["hot", "hot"])
+        memory.update_access_stats("hot")
+        assert memory.search_memories("precedente")[0].accessed_count == 0
+        
+        assert memory.flush_access_stats() == 1
+        entry = memory.search_memories("precedente")[0]
+        assert entry.accessed_count == 3
+        assert entry.last_accessed is not None
+        
+        # Falha na gravação: os acessos voltam ao buffer e um timer tenta de novo
+        import sqlite3
+        import time
+        import persistent_memory
+        memory.record_access(["hot"])
+        monkeypatch.setattr(persistent_memory, "ACCESS_FLUSH_INTERVAL", 0.01)
+        failures = iter([True])
+        real_connection = memory._connections.connection
+        
+        def flaky_connection():
+            if next(failures, False):
+                raise sqlite3.OperationalError("database is locked")
+            return real_connection()
+        
+        monkeypatch.setattr(memory._connections, "connection", flaky_connection)
+        assert memory.flush_access_stats() == 0
+        assert memory._access_flush_timer is not None and memory._access_flush_failures == 1
+        deadline = time.monotonic() + 5
+        while memory._access_flush_failures and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert memory.search_memories("precedente")[0].accessed_count == 4
+        assert not memory._pending_access
+    
+    @pytest.mark.asyncio
+    async def test_full_access_buffer_flushes_off_the_event_loop(self, tmp_path, monkeypatch):
+        """Testa que o buffer cheio agenda o flush em vez de gravar na thread do chamador."""
+        import threading
+        import persistent_memory
+        memory = PersistentMemorySystem(db_path=str(tmp_path / "memory.db"))
+        memory.store_memory(MemoryEntry(
+            id="hot",
+            memory_type=MemoryType.LEGAL_PRECEDENT,
+            title="Precedente",
+            content="Consultado com frequência",
+            tags=[],
+            access_level=AccessLevel.PUBLIC,
+            created_at=datetime.now(),
+            updated_at=datetime.now()
+        ))
+        monkeypatch.setattr(persistent_memory, "ACCESS_FLUSH_MAX_PENDING", 2)
+        
+        flushed_on = []
+        done = threading.Event()
+        flush = memory.flush_access_stats
+        
+        def tracked_flush():
+            flushed_on.append(threading.get_ident())
+            result = flush()
+            done.set()
+            return result
+        
+        monkeypatch.setattr(memory, "flush_access_stats", tracked_flush)
+        memory.record_access(["hot", "outro", "terceiro"])
+        assert threading.get_ident() not in flushed_on
+        assert memory._access_flush_timer is None or memory._access_flush_timer.interval == 0
+        
+        assert await asyncio.to_thread(done.wait, 5)
+        assert flushed_on and threading.get_ident() not in flushed_on
+        assert memory.search_memories("precedente")[0].accessed_count == 1
+    
+    def test_memory_stats_counters(self, tmp_path):
+        """Testa estatísticas mantidas incrementalmente por triggers."""
+        memory = PersistentMemorySystem(db_path=str(tmp_path / "memory.db"))
+        memory.store_memories_bulk([
+            MemoryEntry(
+                id=f"mem_{i}",
+                memory_type=memory_type,
+                title=f"Entrada {i}",
+                content="Conteúdo",
+                tags=[],
+                access_level=AccessLevel.PUBLIC,
+                created_at=datetime.now(),
+                updated_at=datetime.now()
+            )
+            for i, memory_type in enumerate([MemoryType.CASE_LAW, MemoryType.CASE_LAW, MemoryType.COMPLIANCE_RULE])
+        ])
+        
+        stats = memory.get_memory_stats()
+        
+        assert stats["total_memories"] == 3
+        assert stats["recent_memories"] == 3
+        assert stats["by_type"] == {"case_law": 2, "compliance_rule": 1}
+    
+    def test_get_by_id_and_cache_invalidation(self, tmp_path):
+        """Testa leitura por chave primária, get_many e invalidação do cache."""
+        memory = PersistentMemorySystem(db_path=str(tmp_path / "memory.db"))
+        entries = [
+            MemoryEntry(
+                id=f"mem_{i}",
+                memory_type=MemoryType.CASE_LAW,
+                title=f"Precedente {i}",
+                content=f"Conteúdo {i}",
+                tags=["stf"] if i else [],
+                access_level=AccessLevel.PUBLIC,
+                created_at=datetime.now(),
+                updated_at=datetime.now()
+            )
+            for i in range(3)
+        ]
+        memory.store_memories_bulk(entries)
+        
+        assert memory.get_memory_by_id("mem_2").title == "Precedente 2"
+        assert memory.get_memory_by_id("missing") is None
+        assert list(memory.get_many(["mem_1", "missing", "mem_0"])) == ["mem_1", "mem_0"]
+        assert memory.get_memory_by_id("mem_0").tags == []
+        
+        # Conteúdo duplicado atualiza a entrada e invalida o cache
+        memory.store_memory(entries[2])
+        assert memory.get_memory_by_id("mem_2").accessed_count == 1
+        
+        # Atualização concorrente entre a leitura do banco e a entrada no
+        # cache: a linha antiga lida não fica servida pelo cache
+        row_to_entry = memory._row_to_entry
+        
+        def update_during_load(row):
+            memory._row_to_entry = row_to_entry
+            memory.store_memory(entries[1])
+            return row_to_entry(row)
+        
+        memory._invalidate_cache(["mem_1"])
+        memory._row_to_entry = update_during_load
+        assert memory.get_memory_by_id("mem_1").accessed_count == 0
+        assert memory.get_memory_by_id("mem_1").accessed_count == 1
+    
+    def test_connection_pool_is_bounded_and_reentrant(self, tmp_path):
+        """Testa o pool compartilhado de conexões SQLite."""
+        pool = SQLiteConnectionManager(str(tmp_path / "pool.db"), max_size=1, timeout=0.1)
+        
+        with pool.connection() as conn:
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+            # Chamadas aninhadas na mesma thread reutilizam a conexão
+            with pool.connection() as nested:
+                assert nested is conn
+            with pytest.raises(TimeoutError):
+                pool.acquire()
+        
+        assert pool.stats() == {"max_size": 1, "open": 1, "idle": 1}
+        pool.close_all()
+        assert pool.stats()["open"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_async_api_runs_off_event_loop(self, tmp_path):
+        """Testa a API assíncrona executada no executor de banco."""
+        memory = PersistentMemorySystem(db_path=str(tmp_path / "memory.db"))
+        entry = MemoryEntry(
+            id="mem_async",
+            memory_type=MemoryType.CASE_LAW,
+            title="Precedente assíncrono",
+            content="Responsabilidade de sócios",
+            tags=["stj"],
+            access_level=AccessLevel.PUBLIC,
+            created_at=datetime.now(),
+            updated_at=datetime.now()
+        )
+        
+        assert await memory.astore_memory(entry)
+        results, stats = await asyncio.gather(
+            memory.asearch_memories("responsabilidade"),
+            memory.aget_memory_stats()
+        )
+        
+        assert [memory_entry.id for memory_entry in results] == ["mem_async"]
+        assert stats["total_memories"] == 1
+        assert (await memory.aget_memory_by_id("mem_async")).title == "Precedente assíncrono"
+    
+    def test_streaming_backup_and_snapshot_restore(self, tmp_path):
+        """Testa backup NDJSON comprimido e snapshot, incluindo entradas confidenciais."""
+        memory = PersistentMemorySystem(db_path=str(tmp_path / "memory.db"))
+        memory.store_memories_bulk([
+            MemoryEntry(
+                id=f"mem_{i}",
+                memory_type=MemoryType.CASE_LAW,
+                title=f"Parecer {i}",
+                content="Conteúdo sigiloso",
+                tags=["parecer"],
+                access_level=AccessLevel.CONFIDENTIAL if i % 2 else AccessLevel.PUBLIC,
+                created_at=datetime.now(),
+                updated_at=datetime.now()
+            )
+            for i in range(5)
+        ])
+        batches = list(memory.iter_entries(batch_size=2))
+        assert [[entry.id for entry in batch] for batch in batches] == [["mem_0", "mem_1"], ["mem_2", "mem_3"], ["mem_4"]]
+        backup = MemoryBackupSystem(backup_dir=str(tmp_path / "backups"), memory=memory)
+        
+        for backup_file in (backup.create_backup(compression="gzip"), backup.create_snapshot()):
+            restored = PersistentMemorySystem(db_path=str(tmp_path / f"{Path(backup_file).stem}.db"))
+            restorer = MemoryBackupSystem(backup_dir=str(tmp_path / "backups"), memory=restored)
+            
+            assert restorer.restore_backup(backup_file)
+            assert restorer.last_report["entries"] == 5
+            assert restored.get_memory_by_id("mem_1").access_level == AccessLevel.CONFIDENTIAL
+
 
 class TestIntelligentRouting:
     """Testes do Sistema de Roteamento Inteligente."""
@@ -367,6 +1534,55 @@ class TestFaultTolerance:
         assert cb.failure_count == 0
 
 
+class TestPrometheusMetrics:
+    """Testes do endpoint de métricas Prometheus."""
+    
+    def test_render_exposition_format_with_cache(self, tmp_path):
+        """Testa histogramas, contadores, circuit breakers, checkpoints e cache."""
+        observability = ObservabilityManager(ObservabilityConfig(langsmith_enabled=False))
+        trace_id = observability.start_trace("master")
+        for latency in (3.0, 40.0, 700.0):
+            observability.performance_monitor.record_latency("node_analise", latency, "master", "analise")
+        observability.performance_monitor.record_token_usage(150, "master", "analise")
+        observability.log_tool_call("busca", {})
+        observability.log_tool_call("busca", {}, error=ValueError("timeout"))
+        observability.end_trace(trace_id)
+        
+        fault_manager = FaultToleranceManager()
+        breaker = fault_manager.get_circuit_breaker("llm \"principal\"")
+        for _ in range(breaker.failure_threshold):
+            breaker._on_failure()
+        
+        saver = AdvancedCheckpointSaver(
+            CheckpointConfig(), storage=SQLiteCheckpointStorage(db_path=str(tmp_path / "checkpoints.db"))
+        )
+        saver.save_checkpoint(session_id="sessao", state={"messages": ["a" * 2000]})
+        
+        metrics = PrometheusMetrics(observability, fault_manager, saver, cache_seconds=60)
+        text = metrics.render()
+        lines = text.splitlines()
+        labels = 'agent="master",node="analise",operation="node_analise"'
+        buckets = [float(line.rsplit(" ", 1)[1]) for line in lines
+                   if line.startswith(f"agent_latency_seconds_bucket{{{labels}")]
+        assert buckets == sorted(buckets) and buckets[-1] == 3
+        assert f'agent_latency_seconds_bucket{{{labels},le="0.005"}} 1' in lines
+        assert f'agent_latency_seconds_bucket{{{labels},le="0.05"}} 2' in lines
+        assert f"agent_latency_seconds_count{{{labels}}} 3" in lines
+        assert 'agent_tokens_total{agent="master",node="analise",metric="token_usage"} 150.0' in lines
+        assert 'agent_tool_calls_total{agent="master",tool="busca",status="error"} 1' in lines
+        assert 'agent_errors_total{agent="master",node=""} 1' in lines
+        assert 'circuit_breaker_state{component="llm \\"principal\\"",state="OPEN"} 1' in lines
+        assert "# TYPE agent_latency_seconds histogram" in lines
+        assert any(line.startswith("checkpoint_size_bytes{") for line in lines)
+        
+        # Dentro do intervalo de scrape o texto vem do cache
+        observability.start_trace("master")
+        observability.log_tool_call("busca", {})
+        assert metrics.render() is text and metrics.renders == 1
+        metrics.cache_seconds = 0
+        assert 'agent_tool_calls_total{agent="master",tool="busca",status="success"} 2' in metrics.render()
+
+
 # ==================== TESTES DE INTEGRAÇÃO ====================
 
 class TestSystemIntegration: